@@ -1,20 +1,180 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, make_response, g
 from flask_cors import CORS
 from database_postgres import (
-    save_bookmark, get_bookmark, get_all_bookmarks, init_db,
+    save_bookmark, get_bookmark, get_all_bookmarks,
     create_collection, get_all_collections, create_tag, get_all_tags,
     update_bookmark, get_bookmarks_by_tag_id, get_bookmarks_by_collection_id,
-    save_summary, get_summary
+    save_summary, get_summary, get_pool_stats, get_bookmarks_page,
+    get_bookmarks_by_ids, bulk_save_bookmarks, enqueue_job, get_job,
+    enqueue_job_batch, get_job_batch, get_summarized_bookmark_ids,
+    search_bookmarks, get_table_versions, get_bookmark_version, get_changes_since,
+    get_bookmarks_json, export_bookmarks
 )
-from youtube import get_video_id, fetch_transcript, summarize
+import json
+from youtube import (
+    get_video_id, stream_video_summary, TranscriptError, RateLimitTimeout, summary_rate_limiter
+)
+from jobs import WorkerPool, PREFETCH_PRIORITY
+from migrate import check_schema_version
+from embeddings import similar_bookmarks, semantic_search, warm_index
 import traceback
 import sys
+import os
+import math
+import time
+import metrics
+from http_helpers import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, BOOKMARK_LIST_TABLES, parse_limit, parse_page_args,
+    parse_sync_cursor, prefetch_job_kind, conditional_etag, set_validators, sse_event,
+    export_headers, ExportEncoder
+)
+import profiler
+from replicas import REPLICA_CONFIG, replicas_enabled, start_read_session, session_write_position
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Initialize the database
-init_db()
+# Batch summary jobs queue behind summaries a user asked for directly
+BATCH_SUMMARY_PRIORITY = -10
+
+# Largest number of items accepted by POST /api/bookmarks/bulk
+MAX_BULK_ITEMS = int(os.getenv('MAX_BULK_ITEMS', '100000'))
+
+# Serve bookmark listings as JSON rendered by Postgres (see get_bookmarks_json)
+PG_JSON_LISTINGS = os.getenv('PG_JSON_LISTINGS', '0') == '1'
+
+# Refuse to start against a schema that is missing migrations (python migrate.py)
+check_schema_version()
+
+# Background workers for summary jobs (JOB_WORKERS=0 to run them elsewhere via jobs.py)
+job_workers = WorkerPool()
+if job_workers.workers > 0:
+    job_workers.start()
+
+# Load the embedding index before the first similarity query needs it
+warm_index()
+
+def schedule_prefetch(bookmark_id, text):
+    """Queue a low-priority prefetch for a new YouTube bookmark (never fails the save)"""
+    kind = prefetch_job_kind(text)
+    if kind is None:
+        return
+    try:
+        # Behind every other job, and limited to JOB_PREFETCH_CONCURRENCY
+        # workers. Asking for the summary later raises a queued prefetched
+        # summary to normal priority.
+        enqueue_job(kind, bookmark_id, priority=PREFETCH_PRIORITY)
+        job_workers.notify()
+    except Exception as e:
+        print(f"Could not schedule prefetch for bookmark {bookmark_id}: {e}", file=sys.stderr)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if profiler.profiling_enabled():
+        g.profile = profiler.start_profile(request.headers, f"{request.method} {request.path}")
+
+@app.after_request
+def record_request_metrics(response):
+    # Label by route pattern, not path, so ids do not explode the series count.
+    # Streaming responses are timed to the first byte.
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    started = g.get('request_started')
+    if started is not None:
+        metrics.http_request_duration.labels(request.method, route).observe(time.perf_counter() - started)
+    metrics.http_requests.labels(request.method, route, response.status_code).inc()
+
+    # Keep profiling until the body has been sent, which covers streamed responses
+    session = g.pop('profile', None)
+    if session is not None:
+        response.headers['X-Profile-Id'] = session.id
+        response.call_on_close(session.finish)
+    return response
+
+@app.teardown_request
+def finish_abandoned_profile(exc):
+    # after_request did not run, so nothing else will stop this profile
+    session = g.pop('profile', None)
+    if session is not None:
+        session.finish()
+
+# Read-your-writes when reads go to replicas: a client that wrote gets the
+# primary's WAL position back and its next reads wait for a replica that has it
+READ_AFTER_HEADER = 'X-Read-After-LSN'
+READ_AFTER_COOKIE = 'read_after_lsn'
+# A replica found more than max_lag behind leaves rotation, so once this long
+# has passed every replica still serving reads has the write; the cookie can go
+READ_AFTER_MAX_AGE = math.ceil(REPLICA_CONFIG['max_lag'] + REPLICA_CONFIG['check_interval'])
+
+@app.before_request
+def start_replica_session():
+    if replicas_enabled():
+        start_read_session(request.headers.get(READ_AFTER_HEADER) or request.cookies.get(READ_AFTER_COOKIE))
+
+@app.after_request
+def return_write_position(response):
+    position = session_write_position()
+    if position is not None:
+        response.headers[READ_AFTER_HEADER] = position
+        response.set_cookie(
+            READ_AFTER_COOKIE, position, max_age=READ_AFTER_MAX_AGE, httponly=True, samesite='Lax'
+        )
+    return response
+
+def conditional_response(validator, build):
+    """Answer 304 when the client's cached copy matches `validator`, else call build()
+
+    `validator` is a (version token, last modified) pair that is cheap to
+    compute; build() only runs when the client's copy is stale.
+    """
+    token, last_modified = validator
+    etag, fresh = conditional_etag(token, request)
+    if fresh:
+        response = app.response_class(status=304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+    return set_validators(response, etag, last_modified)
+
+def list_bookmarks_response(fetch_all, tag_id=None, collection_id=None):
+    """Respond with a keyset page if requested, otherwise with the full list"""
+    return conditional_response(
+        get_table_versions(BOOKMARK_LIST_TABLES),
+        lambda: build_bookmarks_listing(fetch_all, tag_id, collection_id)
+    )
+
+def build_bookmarks_listing(fetch_all, tag_id=None, collection_id=None):
+    try:
+        page = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if PG_JSON_LISTINGS:
+        return build_bookmarks_json(page, tag_id, collection_id)
+    if page is None:
+        return jsonify(fetch_all())
+
+    limit, cursor = page
+    try:
+        bookmarks, next_cursor = get_bookmarks_page(
+            limit, cursor, tag_id=tag_id, collection_id=collection_id
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'bookmarks': bookmarks, 'next_cursor': next_cursor})
+
+def build_bookmarks_json(page, tag_id=None, collection_id=None):
+    """The same listing as build_bookmarks_listing, with Postgres' bytes as the body"""
+    limit, cursor = page or (None, None)
+    try:
+        body, next_cursor = get_bookmarks_json(
+            limit, cursor, tag_id=tag_id, collection_id=collection_id
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if page is not None:
+        body = b'{"bookmarks":' + body + b',"next_cursor":' + json.dumps(next_cursor).encode() + b'}'
+    return app.response_class(body, mimetype='application/json')
 
 @app.route('/api/bookmarks', methods=['POST'])
 def create_bookmark():
@@ -29,6 +189,7 @@ def create_bookmark():
             return jsonify({'error': 'Text is required'}), 400
             
         bookmark_id = save_bookmark(text, title, collection_id, tag_ids)
+        schedule_prefetch(bookmark_id, text)
         return jsonify({
             'id': bookmark_id,
             'message': 'Bookmark saved successfully'
@@ -42,20 +203,153 @@ def create_bookmark():
 @app.route('/api/bookmarks/<int:bookmark_id>', methods=['GET'])
 def get_bookmark_by_id(bookmark_id):
     try:
-        bookmark = get_bookmark(bookmark_id)
-        if bookmark:
-            return jsonify(bookmark)
-        return jsonify({'error': 'Bookmark not found'}), 404
+        version = get_bookmark_version(bookmark_id)
+        if version is None:
+            return jsonify({'error': 'Bookmark not found'}), 404
+
+        def build():
+            bookmark = get_bookmark(bookmark_id)
+            if bookmark:
+                return jsonify(bookmark)
+            return jsonify({'error': 'Bookmark not found'}), 404
+        return conditional_response(version, build)
     except Exception as e:
         print("ERROR in get_bookmark_by_id:", file=sys.stderr)
         print(traceback.format_exc(), file=sys.stderr)
         return jsonify({'error': str(e)}), 500
 
+def parse_bulk_body():
+    """Parse a JSON array or NDJSON request body into (items, errors_by_index)"""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'application/json-lines'):
+        items, errors = [], {}
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                errors[len(items)] = f'Invalid JSON: {e}'
+                items.append(None)
+        return items, errors
+
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        raise ValueError('Body must be a JSON array or NDJSON')
+    return items, {}
+
+@app.route('/api/bookmarks/bulk', methods=['POST'])
+def create_bookmarks_bulk():
+    try:
+        try:
+            items, parse_errors = parse_bulk_body()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if len(items) > MAX_BULK_ITEMS:
+            return jsonify({'error': f'At most {MAX_BULK_ITEMS} items per request'}), 413
+
+        results = bulk_save_bookmarks(items)
+        for index, message in parse_errors.items():
+            results[index] = {'error': message}
+
+        errors = [
+            {'index': i, 'error': r['error']} for i, r in enumerate(results) if 'error' in r
+        ]
+        return jsonify({
+            'ids': [r.get('id') for r in results],
+            'created': len(results) - len(errors),
+            'failed': len(errors),
+            'errors': errors
+        }), 201 if not errors else 207
+    except Exception as e:
+        print("ERROR in create_bookmarks_bulk:", file=sys.stderr)
+        print(traceback.format_exc(), file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/bookmarks/batch', methods=['GET'])
+def get_bookmarks_batch():
+    try:
+        try:
+            ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+        except ValueError:
+            return jsonify({'error': 'ids must be a comma-separated list of integers'}), 400
+        ids = list(dict.fromkeys(ids))  # drop duplicates, keep order
+        if not ids:
+            return jsonify({'error': 'ids is required'}), 400
+        if len(ids) > MAX_PAGE_SIZE:
+            return jsonify({'error': f'At most {MAX_PAGE_SIZE} ids per request'}), 400
+
+        bookmarks = get_bookmarks_by_ids(ids)
+        found = {b['id'] for b in bookmarks}
+        return jsonify({
+            'bookmarks': bookmarks,
+            'missing': [i for i in ids if i not in found]
+        })
+    except Exception as e:
+        print("ERROR in get_bookmarks_batch:", file=sys.stderr)
+        print(traceback.format_exc(), file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'q is required'}), 400
+        try:
+            limit, cursor = parse_page_args(request.args) or (DEFAULT_PAGE_SIZE, None)
+            bookmarks, next_cursor = search_bookmarks(query, limit, cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'bookmarks': bookmarks, 'next_cursor': next_cursor})
+    except Exception as e:
+        print("ERROR in search:", file=sys.stderr)
+        print(traceback.format_exc(), file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
+def scored_bookmarks(matches):
+    """Hydrate (bookmark_id, score) pairs into bookmarks carrying their score"""
+    scores = dict(matches)
+    bookmarks = get_bookmarks_by_ids([bookmark_id for bookmark_id, _ in matches])
+    for bookmark in bookmarks:
+        bookmark['score'] = scores[bookmark['id']]
+    return bookmarks
+
+@app.route('/api/bookmarks/<int:bookmark_id>/similar', methods=['GET'])
+def get_similar_bookmarks(bookmark_id):
+    try:
+        try:
+            limit = parse_limit(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        matches = similar_bookmarks(bookmark_id, limit)
+        if matches is None:
+            return jsonify({'error': 'Bookmark has no summary embedding yet'}), 404
+        return jsonify({'bookmarks': scored_bookmarks(matches)})
+    except Exception as e:
+        print("ERROR in get_similar_bookmarks:", file=sys.stderr)
+        print(traceback.format_exc(), file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search/semantic', methods=['GET'])
+def search_semantic():
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'q is required'}), 400
+        try:
+            limit = parse_limit(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'bookmarks': scored_bookmarks(semantic_search(query, limit))})
+    except Exception as e:
+        print("ERROR in search_semantic:", file=sys.stderr)
+        print(traceback.format_exc(), file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/bookmarks', methods=['GET'])
 def list_bookmarks():
     try:
-        bookmarks = get_all_bookmarks()
-        return jsonify(bookmarks)
+        return list_bookmarks_response(get_all_bookmarks)
     except Exception as e:
         print("ERROR in list_bookmarks:", file=sys.stderr)
         print(traceback.format_exc(), file=sys.stderr)
@@ -79,8 +373,10 @@ def update_bookmark_by_id(bookmark_id):
 @app.route('/api/collections', methods=['GET'])
 def list_collections():
     try:
-        collections = get_all_collections()
-        return jsonify(collections)
+        return conditional_response(
+            get_table_versions(('collections',)),
+            lambda: jsonify(get_all_collections())
+        )
     except Exception as e:
         print("ERROR in list_collections:", file=sys.stderr)
         print(traceback.format_exc(), file=sys.stderr)
@@ -108,8 +404,10 @@ def create_new_collection():
 @app.route('/api/tags', methods=['GET'])
 def list_tags():
     try:
-        tags = get_all_tags()
-        return jsonify(tags)
+        return conditional_response(
+            get_table_versions(('tags',)),
+            lambda: jsonify(get_all_tags())
+        )
     except Exception as e:
         print("ERROR in list_tags:", file=sys.stderr)
         print(traceback.format_exc(), file=sys.stderr)
@@ -137,8 +435,9 @@ def create_new_tag():
 @app.route('/api/tags/<int:tag_id>/bookmarks', methods=['GET'])
 def get_bookmarks_by_tag(tag_id):
     try:
-        bookmarks = get_bookmarks_by_tag_id(tag_id)
-        return jsonify(bookmarks)
+        return list_bookmarks_response(
+            lambda: get_bookmarks_by_tag_id(tag_id), tag_id=tag_id
+        )
     except Exception as e:
         print("ERROR in get_bookmarks_by_tag:", file=sys.stderr)
         print(traceback.format_exc(), file=sys.stderr)
@@ -147,8 +446,10 @@ def get_bookmarks_by_tag(tag_id):
 @app.route('/api/collections/<int:collection_id>/bookmarks', methods=['GET'])
 def get_bookmarks_by_collection(collection_id):
     try:
-        bookmarks = get_bookmarks_by_collection_id(collection_id)
-        return jsonify(bookmarks)
+        return list_bookmarks_response(
+            lambda: get_bookmarks_by_collection_id(collection_id),
+            collection_id=collection_id
+        )
     except Exception as e:
         print("ERROR in get_bookmarks_by_collection:", file=sys.stderr)
         print(traceback.format_exc(), file=sys.stderr)
@@ -162,40 +463,239 @@ def save_bookmark_summary(bookmark_id):
         if not bookmark:
             return jsonify({'error': 'Bookmark not found'}), 404
             
-        text = bookmark['text']
-        
         # Check if it's a valid YouTube URL
-        video_id = get_video_id(text)
+        video_id = get_video_id(bookmark['text'])
         if not video_id:
             return jsonify({'error': 'Invalid YouTube URL'}), 400
         
-        # Fetch the transcript
-        transcript = fetch_transcript(text)
-        if transcript.startswith("An error occurred"):
-            return jsonify({'error': transcript}), 400
-        
-        # Generate the summary
-        summary = summarize(text)
-        
-        # Save the summary
-        summary_id = save_summary(bookmark_id, summary)
-        return jsonify({'id': summary_id, 'summary': summary}), 201
+        # Queue the transcript fetch and summary for a background worker
+        job_id = enqueue_job('summary', bookmark_id)
+        job_workers.notify()
+        return jsonify({'job_id': job_id}), 202, {
+            'Location': f'/api/jobs/{job_id}'
+        }
     except Exception as e:
         print(f"Error in save_bookmark_summary: {e}")
         traceback.print_exc(file=sys.stderr)
         return jsonify({'error': str(e)}), 500
 
+def summary_budget_exhausted():
+    """429 for a summary that found no summary rate limit budget in time"""
+    retry_after = max(1, math.ceil(summary_rate_limiter.wait_time()))
+    return jsonify({'error': 'Summary rate limit reached, try again later'}), 429, {
+        'Retry-After': str(retry_after)
+    }
+
+@app.route('/api/bookmarks/<int:bookmark_id>/summary/stream', methods=['GET'])
+def stream_bookmark_summary(bookmark_id):
+    try:
+        bookmark = get_bookmark(bookmark_id)
+        if not bookmark:
+            return jsonify({'error': 'Bookmark not found'}), 404
+        if not get_video_id(bookmark['text']):
+            return jsonify({'error': 'Invalid YouTube URL'}), 400
+        existing = get_summary(bookmark_id)
+    except Exception as e:
+        print(f"Error in stream_bookmark_summary: {e}")
+        traceback.print_exc(file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
+    # Start the summary before the stream, so an exhausted summary budget is
+    # a 429 instead of an error event in a 200 response
+    deltas, error = None, None
+    if existing is None:
+        try:
+            deltas = stream_video_summary(bookmark['text'])
+        except RateLimitTimeout:
+            return summary_budget_exhausted()
+        except Exception as e:
+            error = e
+
+    def generate():
+        # Replay an existing summary immediately
+        if existing is not None:
+            yield sse_event('token', {'text': existing})
+            yield sse_event('done', {'summary': existing})
+            return
+        try:
+            if error is not None:
+                raise error
+            pieces = []
+            try:
+                for delta in deltas:
+                    pieces.append(delta)
+                    yield sse_event('token', {'text': delta})
+            except GeneratorExit:
+                # The client went away; the video's summary is still finished
+                # and stored, and a job attaches it to this bookmark
+                try:
+                    enqueue_job('summary', bookmark_id)
+                    job_workers.notify()
+                except Exception as e:
+                    print(f"Could not queue summary for bookmark {bookmark_id}: {e}", file=sys.stderr)
+                raise
+            summary = ''.join(pieces)
+            summary_id = save_summary(bookmark_id, summary)
+            enqueue_job('embedding', bookmark_id)
+            job_workers.notify()
+            yield sse_event('done', {'id': summary_id, 'summary': summary})
+        except TranscriptError as e:
+            yield sse_event('error', {'error': str(e)})
+        except Exception as e:
+            print(f"Error in stream_bookmark_summary: {e}")
+            traceback.print_exc(file=sys.stderr)
+            yield sse_event('error', {'error': str(e)})
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # stop nginx from buffering the stream
+    })
+
+def enqueue_summary_batch(bookmarks, scope):
+    """Queue summary jobs for the YouTube bookmarks that have no summary yet"""
+    candidates = [b['id'] for b in bookmarks if get_video_id(b['text'])]
+    summarized = get_summarized_bookmark_ids(candidates)
+    pending = [i for i in candidates if i not in summarized]
+    if not pending:
+        return jsonify({'batch_id': None, 'queued': 0, 'skipped': len(bookmarks)})
+
+    batch_id = enqueue_job_batch(
+        'summary', pending, scope=scope, priority=BATCH_SUMMARY_PRIORITY
+    )
+    job_workers.notify()
+    return jsonify({
+        'batch_id': batch_id,
+        'queued': len(pending),
+        'skipped': len(bookmarks) - len(pending)
+    }), 202, {'Location': f'/api/batches/{batch_id}'}
+
+@app.route('/api/collections/<int:collection_id>/summaries', methods=['POST'])
+def summarize_collection(collection_id):
+    try:
+        bookmarks = get_bookmarks_by_collection_id(collection_id)
+        return enqueue_summary_batch(bookmarks, f'collection:{collection_id}')
+    except Exception as e:
+        print(f"Error in summarize_collection: {e}")
+        traceback.print_exc(file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/tags/<int:tag_id>/summaries', methods=['POST'])
+def summarize_tag(tag_id):
+    try:
+        bookmarks = get_bookmarks_by_tag_id(tag_id)
+        return enqueue_summary_batch(bookmarks, f'tag:{tag_id}')
+    except Exception as e:
+        print(f"Error in summarize_tag: {e}")
+        traceback.print_exc(file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/batches/<int:batch_id>', methods=['GET'])
+def get_batch_status(batch_id):
+    try:
+        batch = get_job_batch(batch_id)
+        if batch is None:
+            return jsonify({'error': 'Batch not found'}), 404
+        counts = batch['counts']
+        batch['total'] = sum(counts.values())
+        batch['finished'] = counts.get('queued', 0) == 0 and counts.get('running', 0) == 0
+        return jsonify(batch)
+    except Exception as e:
+        print(f"Error in get_batch_status: {e}")
+        traceback.print_exc(file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job_status(job_id):
+    try:
+        job = get_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
+    except Exception as e:
+        print(f"Error in get_job_status: {e}")
+        traceback.print_exc(file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sync', methods=['GET'])
+def sync_changes():
+    try:
+        # Omit ?since= for a full sync, then pass back the returned cursor
+        try:
+            since = parse_sync_cursor(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(get_changes_since(since))
+    except Exception as e:
+        print(f"Error in sync_changes: {e}")
+        traceback.print_exc(file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/export', methods=['GET'])
+def export_library():
+    try:
+        if request.args.get('format', 'ndjson') != 'ndjson':
+            return jsonify({'error': 'format must be ndjson'}), 400
+        try:
+            since = parse_sync_cursor(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        batches = export_bookmarks(since)
+        # Opens the snapshot, so a failure here still gets a JSON error
+        cursor = next(batches)
+    except Exception as e:
+        print(f"Error in export_library: {e}")
+        traceback.print_exc(file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
+    use_gzip = request.accept_encodings['gzip'] > 0
+
+    def generate():
+        encoder = ExportEncoder(use_gzip)
+        try:
+            for batch in batches:
+                yield encoder.encode(batch)
+            trailer = encoder.finish()
+            if trailer:
+                yield trailer
+        except Exception as e:
+            # The headers are sent; failing the stream tells the client the export is incomplete
+            print(f"Error in export_library: {e}")
+            traceback.print_exc(file=sys.stderr)
+            raise
+
+    response = Response(
+        generate(), mimetype='application/x-ndjson', headers=export_headers(cursor, use_gzip)
+    )
+    # Release the export's connection even if the client goes away mid-stream
+    response.call_on_close(batches.close)
+    return response
+
 @app.route('/api/bookmarks/<int:bookmark_id>/summary', methods=['GET'])
 def get_bookmark_summary(bookmark_id):
     try:
-        summary = get_summary(bookmark_id)
-        if summary is None:
-            return jsonify({'error': 'Summary not found'}), 404
-        return jsonify({'summary': summary})
+        def build():
+            summary = get_summary(bookmark_id)
+            if summary is None:
+                return jsonify({'error': 'Summary not found'}), 404
+            return jsonify({'summary': summary})
+        return conditional_response(get_table_versions(('summaries',)), build)
     except Exception as e:
         print(f"Error in get_bookmark_summary: {e}")
         traceback.print_exc(file=sys.stderr)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/stats/db', methods=['GET'])
+def db_pool_stats():
+    try:
+        return jsonify(get_pool_stats())
+    except Exception as e:
+        print(f"Error in db_pool_stats: {e}")
+        traceback.print_exc(file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000) 
\ No newline at end of file
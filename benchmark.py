@@ -0,0 +1,675 @@
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+# Load test for app.py against a local Postgres, with YouTube and OpenAI
+# replaced by in-process fakes of configurable latency.
+#
+#   python benchmark.py run --bookmarks 10000 --concurrency 16 --output before.json
+#   python benchmark.py compare before.json after.json
+#   python benchmark.py listing --bookmarks 100000
+#
+# `run` DROPS EVERY TABLE in --database (default scrollwise_bench), seeds it,
+# serves app.py on a local port and drives each route in turn. Results are JSON:
+# per route p50/p95/p99/mean latency (ms), throughput (req/s), error count and
+# DB queries per request.
+#
+# `listing` seeds the same way and compares the CPU time and peak Python memory
+# of one full GET /api/bookmarks through jsonify and through the
+# Postgres-rendered JSON fast path (PG_JSON_LISTINGS).
+
+WORDS = (
+    "python postgres async latency cache index query summary video transcript "
+    "pagination cursor embedding search vector worker queue batch stream token "
+    "model prompt network throughput benchmark profile metric histogram tag"
+).split()
+
+
+def _sentence(rnd, words):
+    return " ".join(rnd.choice(WORDS) for _ in range(words))
+
+
+def _video_id(n):
+    return f"b{n:010d}"
+
+
+# ---------------------------------------------------------------------------
+# Fakes for the upstream services
+
+class FakeTranscript:
+    """One manual English track of a FakeTranscriptApi listing"""
+
+    language_code = 'en'
+    is_generated = False
+    is_translatable = False
+    translation_languages = []
+
+    def __init__(self, video_id, latency, words):
+        self.video_id = video_id
+        self.latency = latency
+        self.words = words
+
+    def fetch(self):
+        time.sleep(self.latency)
+        rnd = random.Random(self.video_id)
+        return [{'text': _sentence(rnd, 10)} for _ in range(self.words // 10)]
+
+
+class FakeTranscriptApi:
+    """Stands in for YouTubeTranscriptApi: listing and fetching each sleep half
+    of `latency`, then the transcript has `words` words"""
+
+    latency = 0.2
+    words = 2000
+
+    @classmethod
+    def list_transcripts(cls, video_id):
+        time.sleep(cls.latency / 2)
+        return [FakeTranscript(video_id, cls.latency / 2, cls.words)]
+
+
+class FakeOpenAI:
+    """Stands in for the OpenAI client's chat.completions.create"""
+
+    def __init__(self, latency=1.0, stream_chunks=20):
+        self.latency = latency
+        self.stream_chunks = stream_chunks
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, stream=False, **kwargs):
+        prompt = " ".join(
+            part['text'] for message in messages for part in message['content']
+        )
+        text = "Fake summary: " + _sentence(random.Random(len(prompt)), 60)
+        usage = SimpleNamespace(
+            prompt_tokens=len(prompt) // 4 + 1, completion_tokens=len(text) // 4 + 1,
+            total_tokens=(len(prompt) + len(text)) // 4 + 2
+        )
+        if not stream:
+            time.sleep(self.latency)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage
+            )
+        include_usage = (kwargs.get('stream_options') or {}).get('include_usage')
+        return self._stream(text, usage if include_usage else None)
+
+    def _stream(self, text, usage=None):
+        # Time to first token is half the latency, the rest is spread over the chunks
+        time.sleep(self.latency / 2)
+        words = text.split(" ")
+        step = max(1, len(words) // self.stream_chunks)
+        for i in range(0, len(words), step):
+            time.sleep(self.latency / 2 / self.stream_chunks)
+            delta = SimpleNamespace(content=" ".join(words[i:i + step]) + " ")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        if usage is not None:
+            yield SimpleNamespace(choices=[], usage=usage)
+
+
+# ---------------------------------------------------------------------------
+# Query counting
+
+_query_counter = threading.local()
+
+
+def _count_query():
+    _query_counter.n = getattr(_query_counter, 'n', 0) + 1
+
+
+_counting_cursor_classes = {}
+
+
+def _counting_cursor(base):
+    cls = _counting_cursor_classes.get(base)
+    if cls is None:
+        class CountingCursor(base):
+            def execute(self, *args, **kwargs):
+                _count_query()
+                return super().execute(*args, **kwargs)
+
+            def executemany(self, *args, **kwargs):
+                _count_query()
+                return super().executemany(*args, **kwargs)
+
+            def copy_expert(self, *args, **kwargs):
+                _count_query()
+                return super().copy_expert(*args, **kwargs)
+
+        cls = _counting_cursor_classes[base] = CountingCursor
+    return cls
+
+
+def _counting_connection_factory():
+    import psycopg2.extensions
+
+    class CountingConnection(psycopg2.extensions.connection):
+        def cursor(self, *args, **kwargs):
+            base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+            kwargs['cursor_factory'] = _counting_cursor(base)
+            return super().cursor(*args, **kwargs)
+
+    return CountingConnection
+
+
+class QueryCountingMiddleware:
+    """WSGI middleware totalling DB queries per benchmark route (X-Bench-Route header).
+
+    The counter is thread-local, so it covers everything the server thread does
+    for a request, including streamed response bodies.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        route = environ.get('HTTP_X_BENCH_ROUTE')
+        _query_counter.n = 0
+        body = self.wsgi_app(environ, start_response)
+        try:
+            yield from body
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+            if route:
+                with self._lock:
+                    count, queries = self.totals.get(route, (0, 0))
+                    self.totals[route] = (count + 1, queries + _query_counter.n)
+
+
+# ---------------------------------------------------------------------------
+# Seeding
+
+def create_database(name):
+    """Create the benchmark database if it does not exist"""
+    import psycopg2
+    from database_postgres import DB_CONFIG
+    conn = psycopg2.connect(**dict(DB_CONFIG, dbname='postgres'))
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (name,))
+            if cur.fetchone() is None:
+                cur.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        conn.close()
+
+
+def seed(args, rnd):
+    """Reset the schema and load bookmarks, tags, collections, summaries and embeddings"""
+    from psycopg2.extras import execute_values
+    from database_postgres import (
+        bulk_save_bookmarks, get_db_connection, release_db_connection, enqueue_job_batch
+    )
+    from embeddings import HashingEmbedder, EMBEDDING_CONFIG
+    from reset_database import reset_database
+
+    reset_database()
+    tags = [f"tag-{i}" for i in range(args.tags)]
+    collections = [f"collection-{i}" for i in range(args.collections)]
+    items = []
+    for n in range(args.bookmarks):
+        if rnd.random() < args.youtube_fraction:
+            text = f"https://www.youtube.com/watch?v={_video_id(n)}"
+        else:
+            text = _sentence(rnd, 30)
+        items.append({
+            'text': text,
+            'title': _sentence(rnd, 6),
+            'collection': rnd.choice(collections) if collections else None,
+            'tags': rnd.sample(tags, min(args.tags_per_bookmark, len(tags))),
+        })
+    started = time.perf_counter()
+    results = bulk_save_bookmarks(items)
+    ids = [r['id'] for r in results]
+    print(f"Seeded {len(ids)} bookmarks in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    # Summaries (and their embeddings) for a fraction of the YouTube bookmarks;
+    # the rest are left for the summary routes to generate
+    youtube = [i for i, item in zip(ids, items) if 'youtube.com' in item['text']]
+    summarized = youtube[:int(len(youtube) * args.summarized_fraction)]
+    embedder = HashingEmbedder(EMBEDDING_CONFIG['local_dim'])
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            for start in range(0, len(summarized), 1000):
+                chunk = summarized[start:start + 1000]
+                texts = [_sentence(rnd, 80) for _ in chunk]
+                execute_values(cur, "INSERT INTO summaries (bookmark_id, summary) VALUES %s",
+                               list(zip(chunk, texts)))
+                vectors = embedder.embed(texts)
+                execute_values(cur, "INSERT INTO embeddings (bookmark_id, model, vector) VALUES %s",
+                               [(i, embedder.model, v.tobytes()) for i, v in zip(chunk, vectors)])
+        conn.commit()
+        # Plan against fresh statistics, as autovacuum would have them in production
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+        conn.commit()
+    finally:
+        release_db_connection(conn)
+
+    batch_id = enqueue_job_batch('summary', youtube[len(summarized):][:50], scope='bench')
+    return {
+        'bookmark_ids': ids,
+        'summarized_ids': summarized,
+        'unsummarized_ids': youtube[len(summarized):],
+        'batch_id': batch_id,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Scenarios: one per route in app.py
+
+def _ids_of(client, path):
+    status, body = client('GET', path)
+    return [row['id'] for row in json.loads(body)] if status == 200 else []
+
+
+def build_scenarios(state, client):
+    """Return [(route rule, method, name, make_request(rnd) -> (path, body))]"""
+    tag_ids = _ids_of(client, '/api/tags')
+    collection_ids = _ids_of(client, '/api/collections')
+    ids = state['bookmark_ids']
+    summarized = state['summarized_ids']
+    unsummarized = list(state['unsummarized_ids'])
+    _, body = client('POST', f"/api/bookmarks/{unsummarized[0]}/summary")
+    job_id = json.loads(body)['job_id']
+    # Incremental sync sees what the write scenarios change after seeding
+    _, body = client('GET', '/api/sync')
+    sync_cursor = json.loads(body)['cursor']
+    stream_lock = threading.Lock()
+
+    def next_unsummarized():
+        # Every stream request summarizes a video nobody has summarized yet
+        with stream_lock:
+            return unsummarized.pop() if len(unsummarized) > 1 else unsummarized[-1]
+
+    def bulk_body(rnd):
+        return [{'text': _sentence(rnd, 20), 'tags': [f"tag-{rnd.randrange(10)}"]} for _ in range(100)]
+
+    return [
+        ('/api/bookmarks', 'GET', 'list_bookmarks_all', lambda rnd: ('/api/bookmarks', None)),
+        ('/api/bookmarks', 'GET', 'list_bookmarks_page',
+         lambda rnd: ('/api/bookmarks?limit=50', None)),
+        ('/api/bookmarks/<int:bookmark_id>', 'GET', 'get_bookmark',
+         lambda rnd: (f'/api/bookmarks/{rnd.choice(ids)}', None)),
+        ('/api/bookmarks/batch', 'GET', 'get_bookmarks_batch',
+         lambda rnd: ('/api/bookmarks/batch?ids=' + ','.join(map(str, rnd.sample(ids, 50))), None)),
+        ('/api/tags/<int:tag_id>/bookmarks', 'GET', 'bookmarks_by_tag_page',
+         lambda rnd: (f'/api/tags/{rnd.choice(tag_ids)}/bookmarks?limit=50', None)),
+        ('/api/collections/<int:collection_id>/bookmarks', 'GET', 'bookmarks_by_collection_page',
+         lambda rnd: (f'/api/collections/{rnd.choice(collection_ids)}/bookmarks?limit=50', None)),
+        ('/api/collections', 'GET', 'list_collections', lambda rnd: ('/api/collections', None)),
+        ('/api/tags', 'GET', 'list_tags', lambda rnd: ('/api/tags', None)),
+        ('/api/search', 'GET', 'search',
+         lambda rnd: (f'/api/search?q={rnd.choice(WORDS)}+{rnd.choice(WORDS)}&limit=20', None)),
+        ('/api/bookmarks/<int:bookmark_id>/similar', 'GET', 'similar_bookmarks',
+         lambda rnd: (f'/api/bookmarks/{rnd.choice(summarized)}/similar?limit=10', None)),
+        ('/api/search/semantic', 'GET', 'semantic_search',
+         lambda rnd: (f'/api/search/semantic?q={rnd.choice(WORDS)}+{rnd.choice(WORDS)}', None)),
+        ('/api/bookmarks/<int:bookmark_id>/summary', 'GET', 'get_summary',
+         lambda rnd: (f'/api/bookmarks/{rnd.choice(summarized)}/summary', None)),
+        ('/api/jobs/<int:job_id>', 'GET', 'get_job', lambda rnd: (f'/api/jobs/{job_id}', None)),
+        ('/api/batches/<int:batch_id>', 'GET', 'get_batch',
+         lambda rnd: (f"/api/batches/{state['batch_id']}", None)),
+        ('/api/stats/db', 'GET', 'db_stats', lambda rnd: ('/api/stats/db', None)),
+        ('/metrics', 'GET', 'metrics', lambda rnd: ('/metrics', None)),
+        ('/api/bookmarks', 'POST', 'create_bookmark',
+         lambda rnd: ('/api/bookmarks', {'text': _sentence(rnd, 20), 'title': _sentence(rnd, 5),
+                                         'tag_ids': rnd.sample(tag_ids, min(3, len(tag_ids)))})),
+        ('/api/bookmarks/bulk', 'POST', 'create_bookmarks_bulk',
+         lambda rnd: ('/api/bookmarks/bulk', bulk_body(rnd))),
+        ('/api/bookmarks/<int:bookmark_id>', 'PUT', 'update_bookmark',
+         lambda rnd: (f'/api/bookmarks/{rnd.choice(ids)}',
+                      {'title': _sentence(rnd, 5), 'tag_ids': rnd.sample(tag_ids, min(2, len(tag_ids)))})),
+        ('/api/collections', 'POST', 'create_collection',
+         lambda rnd: ('/api/collections', {'name': _sentence(rnd, 2)})),
+        ('/api/tags', 'POST', 'create_tag', lambda rnd: ('/api/tags', {'name': _sentence(rnd, 2)})),
+        ('/api/bookmarks/<int:bookmark_id>/summary', 'POST', 'enqueue_summary',
+         lambda rnd: (f'/api/bookmarks/{rnd.choice(unsummarized)}/summary', None)),
+        ('/api/collections/<int:collection_id>/summaries', 'POST', 'summarize_collection',
+         lambda rnd: (f'/api/collections/{rnd.choice(collection_ids)}/summaries', None)),
+        ('/api/tags/<int:tag_id>/summaries', 'POST', 'summarize_tag',
+         lambda rnd: (f'/api/tags/{rnd.choice(tag_ids)}/summaries', None)),
+        ('/api/sync', 'GET', 'sync_incremental', lambda rnd: (f'/api/sync?since={sync_cursor}', None)),
+        ('/api/export', 'GET', 'export_full', lambda rnd: ('/api/export?format=ndjson', None)),
+        ('/api/export', 'GET', 'export_incremental',
+         lambda rnd: (f'/api/export?format=ndjson&since={sync_cursor}', None)),
+        ('/api/bookmarks/<int:bookmark_id>/summary/stream', 'GET', 'stream_summary',
+         lambda rnd: (f'/api/bookmarks/{next_unsummarized()}/summary/stream', None)),
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+
+def make_client(port, route=None):
+    def client(method, path, body=None):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+        try:
+            headers = {'X-Bench-Route': route} if route else {}
+            payload = None
+            if body is not None:
+                payload = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+    return client
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(p / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_scenario(port, name, method, make_request, requests, concurrency, seed_value, middleware):
+    client = make_client(port, route=name)
+    rnd_lock = threading.Lock()
+    rnd = random.Random(seed_value)
+
+    def one(_):
+        with rnd_lock:
+            path, body = make_request(rnd)
+        started = time.perf_counter()
+        status, _ = client(method, path, body)
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    time.sleep(0.05)  # let the server finish closing the last responses
+
+    latencies = sorted(latency * 1000 for latency, _ in outcomes)
+    errors = sum(1 for _, status in outcomes if status >= 400)
+    count, queries = middleware.totals.get(name, (0, 0))
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput_rps': round(requests / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'max_ms': round(latencies[-1], 3),
+        'queries_per_request': round(queries / count, 2) if count else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    # Configure everything read at import time before importing the app
+    os.environ['POSTGRES_DB'] = args.database
+    os.environ['JOB_WORKERS'] = str(args.job_workers)
+    os.environ['EMBEDDING_BACKEND'] = 'local'
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    # The fakes are free, so the per-process summary budget must not throttle them
+    os.environ['SUMMARY_RATE_PER_MINUTE'] = '1000000000'
+    os.environ['SUMMARY_RATE_BURST'] = '1000000000'
+    os.environ['DB_POOL_MAX_SIZE'] = str(max(args.concurrency + 2, int(os.getenv('DB_POOL_MAX_SIZE', '10'))))
+
+    import database_postgres
+    create_database(args.database)
+    database_postgres.CONNECTION_FACTORY = _counting_connection_factory()
+
+    rnd = random.Random(args.seed)
+    state = seed(args, rnd)
+
+    import youtube
+    FakeTranscriptApi.latency = args.transcript_latency
+    FakeTranscriptApi.words = args.transcript_words
+    youtube.YouTubeTranscriptApi = FakeTranscriptApi
+    youtube.openai_client = FakeOpenAI(args.completion_latency)
+
+    import app as app_module
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    middleware = QueryCountingMiddleware(app_module.app.wsgi_app)
+    app_module.app.wsgi_app = middleware
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    scenarios = build_scenarios(state, make_client(port))
+    covered = {(rule, method) for rule, method, _, _ in scenarios}
+    for rule in app_module.app.url_map.iter_rules():
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            if rule.endpoint != 'static' and (rule.rule, method) not in covered:
+                print(f"WARNING: no benchmark scenario for {method} {rule.rule}", file=sys.stderr)
+
+    results = {}
+    for rule, method, name, make_request in scenarios:
+        if args.routes and name not in args.routes:
+            continue
+        requests = args.requests
+        if name == 'stream_summary':
+            requests = min(requests, max(1, len(state['unsummarized_ids']) - 1))
+        results[name] = dict(
+            {'route': f'{method} {rule}'},
+            **run_scenario(port, name, method, make_request, requests,
+                           args.concurrency, args.seed, middleware)
+        )
+        r = results[name]
+        print(f"{name:32} p50 {r['p50_ms']:9.2f}ms  p95 {r['p95_ms']:9.2f}ms  "
+              f"p99 {r['p99_ms']:9.2f}ms  {r['throughput_rps']:9.1f} req/s  "
+              f"q/req {r['queries_per_request']}  errors {r['errors']}", file=sys.stderr)
+    server.shutdown()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'server': 'werkzeug threaded',
+            'params': {k: v for k, v in vars(args).items() if k not in ('func', 'output')},
+        },
+        'routes': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+def _seeded_app(args):
+    """Seed the benchmark database and return a test client for app.py on it"""
+    os.environ['POSTGRES_DB'] = args.database
+    os.environ['JOB_WORKERS'] = '0'
+    os.environ['EMBEDDING_BACKEND'] = 'local'
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+    create_database(args.database)
+    seed(args, random.Random(args.seed))
+
+    import app as app_module
+    return app_module, app_module.app.test_client()
+
+
+def measure(name, fetch, repeat):
+    """Median wall and app CPU time of fetch() plus its peak Python memory and body size"""
+    fetch()  # warm the pool and caches
+    walls, cpus = [], []
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        size = fetch()
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    # Measured separately: tracing allocations slows the Python path down
+    tracemalloc.start()
+    fetch()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = {
+        'wall_ms': round(statistics.median(walls) * 1000, 1),
+        'cpu_ms': round(statistics.median(cpus) * 1000, 1),
+        'peak_python_mb': round(peak / 2**20, 1),
+        'body_mb': round(size / 2**20, 1),
+    }
+    print(f"{name:14} wall {result['wall_ms']:9.1f}ms  app cpu {result['cpu_ms']:9.1f}ms  "
+          f"peak python memory {result['peak_python_mb']:7.1f}MB  body {result['body_mb']:6.1f}MB", file=sys.stderr)
+    return result
+
+
+def write_report(args, key, results):
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'params': {k: v for k, v in vars(args).items() if k not in ('func', 'output')},
+        },
+        key: results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+def listing(args):
+    """Compare the full bookmark listing built by jsonify with the Postgres-rendered one"""
+    app_module, client = _seeded_app(args)
+
+    def fetch():
+        response = client.get('/api/bookmarks')
+        body = response.get_data()
+        if response.status_code != 200:
+            raise RuntimeError(f"GET /api/bookmarks returned {response.status_code}")
+        return len(body)
+
+    results = {}
+    for name, fast in (('jsonify', False), ('postgres_json', True)):
+        app_module.PG_JSON_LISTINGS = fast
+        results[name] = measure(name, fetch, args.repeat)
+    write_report(args, 'listing', results)
+
+
+def export(args):
+    """Compare the NDJSON export, plain and gzipped, with the full JSON listing"""
+    app_module, client = _seeded_app(args)
+
+    def fetcher(path, headers=None):
+        def fetch():
+            # Read the stream chunk by chunk, as a client saving it to disk would
+            response = client.get(path, headers=headers, buffered=False)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+            size = sum(len(chunk) for chunk in response.response)
+            response.close()
+            return size
+        return fetch
+
+    results = {
+        'listing_json': measure('listing_json', fetcher('/api/bookmarks'), args.repeat),
+        'export_ndjson': measure('export_ndjson', fetcher('/api/export?format=ndjson'), args.repeat),
+        'export_gzip': measure('export_gzip', fetcher('/api/export?format=ndjson', {'Accept-Encoding': 'gzip'}),
+                               args.repeat),
+    }
+    write_report(args, 'export', results)
+
+
+def add_seed_arguments(parser):
+    parser.add_argument('--database', default='scrollwise_bench',
+                        help="database to (re)create and seed; all its tables are dropped")
+    parser.add_argument('--bookmarks', type=int, default=10000)
+    parser.add_argument('--tags', type=int, default=200)
+    parser.add_argument('--tags-per-bookmark', type=int, default=3)
+    parser.add_argument('--collections', type=int, default=50)
+    parser.add_argument('--youtube-fraction', type=float, default=0.6)
+    parser.add_argument('--summarized-fraction', type=float, default=0.5,
+                        help="share of YouTube bookmarks seeded with a summary and embedding")
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def compare(args):
+    """Print per-route latency and throughput changes between two result files"""
+    with open(args.baseline) as f:
+        before = json.load(f)['routes']
+    with open(args.candidate) as f:
+        after = json.load(f)['routes']
+
+    def change(old, new):
+        if not old or new is None:
+            return '     n/a'
+        return f"{(new - old) / old * 100:+7.1f}%"
+
+    print(f"{'route':32} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8} {'q/req':>12}")
+    for name in sorted(set(before) & set(after)):
+        a, b = before[name], after[name]
+        print(f"{name:32} {change(a['p50_ms'], b['p50_ms'])} {change(a['p95_ms'], b['p95_ms'])} "
+              f"{change(a['p99_ms'], b['p99_ms'])} {change(a['throughput_rps'], b['throughput_rps'])} "
+              f"{str(a['queries_per_request']):>5} -> {str(b['queries_per_request']):<5}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark app.py routes against a seeded local Postgres")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help="seed the benchmark database and drive every route")
+    add_seed_arguments(run_parser)
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--requests', type=int, default=200, help="requests per route")
+    run_parser.add_argument('--routes', nargs='*', help="only run these scenario names")
+    run_parser.add_argument('--transcript-latency', type=float, default=0.2, help="seconds")
+    run_parser.add_argument('--transcript-words', type=int, default=2000)
+    run_parser.add_argument('--completion-latency', type=float, default=1.0, help="seconds")
+    run_parser.add_argument('--job-workers', type=int, default=0,
+                            help="background job workers in the app process (0 keeps query counts per request clean)")
+    run_parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    run_parser.set_defaults(func=run)
+
+    listing_parser = sub.add_parser('listing', help="compare jsonify and Postgres-rendered JSON for the full listing")
+    add_seed_arguments(listing_parser)
+    listing_parser.add_argument('--repeat', type=int, default=5)
+    listing_parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    listing_parser.set_defaults(func=listing)
+
+    export_parser = sub.add_parser('export', help="measure the streaming NDJSON export against the full listing")
+    add_seed_arguments(export_parser)
+    export_parser.add_argument('--repeat', type=int, default=5)
+    export_parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    export_parser.set_defaults(func=export)
+
+    compare_parser = sub.add_parser('compare', help="compare two JSON reports")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
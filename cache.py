@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a size budget and per-entry time-to-live.
+
+    `sizeof` weighs each value (default: every entry weighs 1), so `max_size`
+    can bound either the number of entries or e.g. the total characters held.
+    """
+
+    def __init__(self, max_size, ttl, sizeof=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: 1)
+        self._data = OrderedDict()  # key -> (value, size, expires_at)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for `key`, or `default` if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[2] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Store `value`, evicting least recently used entries to stay within max_size"""
+        size = self.sizeof(value)
+        if size > self.max_size:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires_at)
+            self._size += size
+            while self._size > self.max_size:
+                self._remove(next(iter(self._data)))
+
+    def delete(self, key):
+        """Drop `key` from the cache if present"""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self._size -= size
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return entry count, total size and hit/miss counters"""
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'size': self._size,
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,973 @@
+import asyncio
+import base64
+import contextvars
+import functools
+import json
+import os
+from contextlib import asynccontextmanager
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg.adapt import Loader
+from psycopg.rows import dict_row, tuple_row
+from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool
+from metrics import timed_query
+import database_postgres
+import metrics
+from replicas import (
+    choose_replica, get_replica_monitor, get_replica_status, in_read_session, note_write,
+    session_write_position
+)
+from database_postgres import (
+    DB_CONFIG, POOL_CONFIG, HYDRATED_BOOKMARK_SELECT, SEARCH_BOOKMARK_SELECT, JOB_COLUMNS, SYNC_QUERIES,
+    SYNC_TOMBSTONES_QUERY, SYNC_SNAPSHOT_QUERIES, EXPORT_BATCH_SIZE, EXPORT_QUERY, EXPORT_SINCE_QUERY,
+    encode_cursor, decode_cursor, _bookmark_filter, _bookmarks_json_query, _table_versions_sql,
+    version_token
+)
+
+# Async mirror of database_postgres for app_async.py, on psycopg 3. Every
+# function keeps its sync counterpart's name, arguments and return value;
+# connections run in autocommit mode and writes use explicit transactions.
+
+# Coroutines are cheap, so the async pool is allowed to grow larger
+ASYNC_POOL_MAX_SIZE = int(os.getenv('ASYNC_DB_POOL_MAX_SIZE', '50'))
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+async def get_pool():
+    """Return the process-wide async connection pool, opening it on first use"""
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await _open_pool(make_conninfo(**DB_CONFIG))
+    return _pool
+
+async def _open_pool(conninfo):
+    pool = AsyncConnectionPool(
+        conninfo,
+        min_size=POOL_CONFIG['min_size'],
+        max_size=max(ASYNC_POOL_MAX_SIZE, POOL_CONFIG['min_size']),
+        timeout=POOL_CONFIG['timeout'],
+        kwargs={'autocommit': True, 'row_factory': dict_row},
+        check=AsyncConnectionPool.check_connection,
+        open=False
+    )
+    await pool.open()
+    return pool
+
+# One pool per read replica (see replicas.py), and the replica pool each
+# checked-out replica connection must go back to
+_replica_pools = {}
+_replica_checkouts = {}
+
+async def _get_replica_pool(replica):
+    pool = _replica_pools.get(replica.name)
+    if pool is None:
+        async with _pool_lock:
+            pool = _replica_pools.get(replica.name)
+            if pool is None:
+                pool = _replica_pools[replica.name] = await _open_pool(replica.dsn)
+    return pool
+
+async def close_pool():
+    """Close the pools and all of their connections"""
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+    while _replica_pools:
+        _, pool = _replica_pools.popitem()
+        await pool.close()
+
+async def get_db_connection(read_only=False):
+    """Check out a database connection, from a caught-up replica if `read_only` allows"""
+    if read_only:
+        replica = choose_replica()
+        if replica is not None:
+            try:
+                pool = await _get_replica_pool(replica)
+                conn = await pool.getconn()
+                _replica_checkouts[id(conn)] = pool
+                metrics.db_reads.labels(replica.name).inc()
+                return conn
+            except psycopg.Error as e:
+                # PoolTimeout is a psycopg.Error too; either way, use the primary
+                print(f"Replica {replica.name} unavailable, reading from primary: {e}")
+                get_replica_monitor().take_out(replica, e)
+        metrics.db_reads.labels('primary').inc()
+    try:
+        return await (await get_pool()).getconn()
+    except psycopg.Error as e:
+        print(f"Error connecting to PostgreSQL: {e}")
+        raise
+
+async def release_db_connection(conn, discard=False):
+    """Return a connection to the pool it came from (broken connections are discarded)"""
+    pool = _replica_checkouts.pop(id(conn), None) or await get_pool()
+    if discard:
+        await conn.close()
+    await pool.putconn(conn)
+
+def records_write(fn):
+    """After `fn` commits, remember the primary's WAL position for read-your-writes"""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        result = await fn(*args, **kwargs)
+        if in_read_session() and get_replica_monitor() is not None:
+            conn = await get_db_connection()
+            try:
+                cur = await conn.execute("SELECT pg_current_wal_lsn()::text AS lsn")
+                note_write((await cur.fetchone())['lsn'])
+            except psycopg.Error as e:
+                print(f"Error reading WAL position: {e}")
+                raise
+            finally:
+                await release_db_connection(conn)
+        return result
+    return wrapper
+
+@asynccontextmanager
+async def advisory_lock(name):
+    """Hold a Postgres advisory lock on `name`, serializing work across processes"""
+    conn = await get_db_connection()
+    discard = False
+    try:
+        await conn.execute("SELECT pg_advisory_lock(hashtext(%s))", (name,))
+        try:
+            yield
+        finally:
+            try:
+                await conn.execute("SELECT pg_advisory_unlock(hashtext(%s))", (name,))
+            except psycopg.Error:
+                # Never return a connection that may still hold the lock
+                discard = True
+                raise
+    finally:
+        await release_db_connection(conn, discard=discard)
+
+async def get_pool_stats():
+    """Return connection pool usage statistics, plus each replica's when configured"""
+    stats = _pool_stats(await get_pool())
+    if get_replica_monitor() is not None:
+        stats['replicas'] = [
+            dict(status, pool=_pool_stats(_replica_pools[status['name']]) if status['name'] in _replica_pools else None)
+            for status in get_replica_status()
+        ]
+    return stats
+
+def _pool_stats(pool):
+    stats = pool.get_stats()
+    return {
+        'min_size': stats.get('pool_min'),
+        'max_size': stats.get('pool_max'),
+        'size': stats.get('pool_size'),
+        'idle': stats.get('pool_available'),
+        'in_use': stats.get('pool_size', 0) - stats.get('pool_available', 0),
+        'checkouts': stats.get('requests_num', 0),
+        'checkout_failures': stats.get('requests_errors', 0),
+        'waits': stats.get('requests_queued', 0),
+        'total_wait_ms': stats.get('requests_wait_ms', 0),
+        'waiting': stats.get('requests_waiting', 0),
+        'reconnects': stats.get('connections_lost', 0),
+        'discarded': stats.get('returns_bad', 0),
+    }
+
+@timed_query
+@records_write
+async def save_bookmark(text, title=None, collection_id=None, tag_ids=None):
+    """Save a new text bookmark to the database with optional title, collection, and tags"""
+    conn = await get_db_connection()
+    try:
+        async with conn.transaction():
+            cur = await conn.execute(
+                "INSERT INTO bookmarks (text, title, collection_id) VALUES (%s, %s, %s) RETURNING id",
+                (text, title, collection_id)
+            )
+            bookmark_id = (await cur.fetchone())['id']
+
+            # Add tags if provided
+            if tag_ids:
+                async with conn.cursor() as cur:
+                    await cur.executemany(
+                        "INSERT INTO bookmark_tags (bookmark_id, tag_id) VALUES (%s, %s)",
+                        [(bookmark_id, tag_id) for tag_id in tag_ids]
+                    )
+        return bookmark_id
+    except psycopg.Error as e:
+        print(f"Error saving bookmark: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+async def bulk_save_bookmarks(items):
+    """Insert many bookmarks (with tags and collections by id or name) efficiently"""
+    # One COPY-driven import holds a connection for its whole duration either
+    # way; reusing the sync implementation (and the sync pool) keeps a single
+    # copy of that logic. It records its own write position, in a copy of
+    # this context, so hand that position back to the request
+    context = contextvars.copy_context()
+    result = await asyncio.to_thread(context.run, database_postgres.bulk_save_bookmarks, items)
+    position = context.run(session_write_position)
+    if position is not None:
+        note_write(position)
+    return result
+
+@timed_query
+async def get_bookmark(bookmark_id):
+    """Retrieve a bookmark by ID with its collection and tags"""
+    conn = await get_db_connection(read_only=True)
+    try:
+        cur = await conn.execute(HYDRATED_BOOKMARK_SELECT + " WHERE b.id = %s", (bookmark_id,))
+        return await cur.fetchone()
+    except psycopg.Error as e:
+        print(f"Error retrieving bookmark: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_bookmarks_by_ids(bookmark_ids):
+    """Retrieve several bookmarks by ID in one query, in the order the IDs were given"""
+    if not bookmark_ids:
+        return []
+    conn = await get_db_connection(read_only=True)
+    try:
+        cur = await conn.execute(HYDRATED_BOOKMARK_SELECT + " WHERE b.id = ANY(%s)", (list(bookmark_ids),))
+        by_id = {row['id']: row for row in await cur.fetchall()}
+        return [by_id[i] for i in bookmark_ids if i in by_id]
+    except psycopg.Error as e:
+        print(f"Error retrieving bookmarks by ids: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def search_bookmarks(query, limit, cursor=None):
+    """Full-text search over titles, text and summaries, best matches first.
+
+    Returns (bookmarks, next_cursor); each bookmark carries its `rank`.
+    """
+    conditions = ["b.search_vector @@ q"]
+    params = [query]
+    if cursor is not None:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            rank, bookmark_id = json.loads(raw)
+            params.extend([float(rank), int(bookmark_id)])
+        except (ValueError, TypeError) as e:
+            raise ValueError("Invalid cursor") from e
+        # ts_rank_cd is real; compare in real so a tied rank isn't skipped
+        conditions.append("(ts_rank_cd(b.search_vector, q), b.id) < (%s::real, %s)")
+    params.append(limit + 1)
+
+    conn = await get_db_connection(read_only=True)
+    try:
+        cur = await conn.execute(f"""
+            WITH hits AS (
+                SELECT b.id, ts_rank_cd(b.search_vector, q) AS rank
+                FROM bookmarks b, websearch_to_tsquery('english', %s) q
+                WHERE {' AND '.join(conditions)}
+                ORDER BY rank DESC, b.id DESC
+                LIMIT %s
+            )
+            {SEARCH_BOOKMARK_SELECT}
+        """, params)
+        bookmarks_list = await cur.fetchall()
+
+        next_cursor = None
+        if len(bookmarks_list) > limit:
+            bookmarks_list = bookmarks_list[:limit]
+            last = bookmarks_list[-1]
+            raw = json.dumps([last['rank'], last['id']]).encode()
+            next_cursor = base64.urlsafe_b64encode(raw).decode().rstrip('=')
+        return bookmarks_list, next_cursor
+    except psycopg.Error as e:
+        print(f"Error searching bookmarks: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+async def _list_bookmarks(join_sql="", where_sql=None, params=(), limit=None, cursor=None):
+    """Fetch bookmarks newest first, optionally one keyset page at a time.
+
+    Returns (bookmarks, next_cursor); next_cursor is None on the last page.
+    """
+    conditions = [where_sql] if where_sql else []
+    params = list(params)
+    if cursor is not None:
+        created_at, bookmark_id = decode_cursor(cursor)
+        conditions.append("(b.created_at, b.id) < (%s, %s)")
+        params.extend([created_at, bookmark_id])
+
+    query = f"""
+        {HYDRATED_BOOKMARK_SELECT}
+        {join_sql}
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY b.created_at DESC, b.id DESC
+    """
+    if limit is not None:
+        # Fetch one extra row to learn whether another page exists
+        query += " LIMIT %s"
+        params.append(limit + 1)
+
+    conn = await get_db_connection(read_only=True)
+    try:
+        cur = await conn.execute(query, params)
+        bookmarks_list = await cur.fetchall()
+
+        next_cursor = None
+        if limit is not None and len(bookmarks_list) > limit:
+            bookmarks_list = bookmarks_list[:limit]
+            last = bookmarks_list[-1]
+            next_cursor = encode_cursor(last['created_at'], last['id'])
+
+        return bookmarks_list, next_cursor
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_all_bookmarks():
+    """Retrieve all bookmarks with their collections and tags"""
+    try:
+        return (await _list_bookmarks())[0]
+    except psycopg.Error as e:
+        print(f"Error retrieving bookmarks: {e}")
+        raise
+
+@timed_query
+async def get_bookmarks_page(limit, cursor=None, tag_id=None, collection_id=None):
+    """Retrieve one page of bookmarks (optionally by tag or collection) and the next cursor"""
+    join_sql, where_sql, params = _bookmark_filter(tag_id, collection_id)
+    try:
+        return await _list_bookmarks(join_sql, where_sql, params, limit=limit, cursor=cursor)
+    except psycopg.Error as e:
+        print(f"Error retrieving bookmarks page: {e}")
+        raise
+
+class _RawTextLoader(Loader):
+    # Leaves text values as the bytes Postgres sent
+    def load(self, data):
+        return bytes(data)
+
+@timed_query
+async def get_bookmarks_json(limit=None, cursor=None, tag_id=None, collection_id=None):
+    """Return (JSON array bytes, next_cursor) for a bookmark listing, rendered by Postgres"""
+    query, params = _bookmarks_json_query(limit, cursor, tag_id, collection_id)
+    conn = await get_db_connection(read_only=True)
+    try:
+        cur = conn.cursor(row_factory=tuple_row)
+        cur.adapters.register_loader('text', _RawTextLoader)
+        await cur.execute(query, params)
+        body, has_more, last_created_at, last_id = await cur.fetchone()
+        next_cursor = encode_cursor(last_created_at, last_id) if has_more else None
+        return body, next_cursor
+    except psycopg.Error as e:
+        print(f"Error rendering bookmarks JSON: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+@records_write
+async def create_collection(name):
+    """Create a new collection"""
+    conn = await get_db_connection()
+    try:
+        cur = await conn.execute(
+            "INSERT INTO collections (name) VALUES (%s) RETURNING id",
+            (name,)
+        )
+        return (await cur.fetchone())['id']
+    except psycopg.Error as e:
+        print(f"Error creating collection: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_all_collections():
+    """Get all collections"""
+    conn = await get_db_connection(read_only=True)
+    try:
+        cur = await conn.execute("SELECT id, name, created_at, updated_at FROM collections ORDER BY name")
+        return await cur.fetchall()
+    except psycopg.Error as e:
+        print(f"Error retrieving collections: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+@records_write
+async def create_tag(name):
+    """Create a new tag"""
+    conn = await get_db_connection()
+    try:
+        cur = await conn.execute(
+            "INSERT INTO tags (name) VALUES (%s) RETURNING id",
+            (name,)
+        )
+        return (await cur.fetchone())['id']
+    except psycopg.Error as e:
+        print(f"Error creating tag: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_all_tags():
+    """Get all tags"""
+    conn = await get_db_connection(read_only=True)
+    try:
+        cur = await conn.execute("SELECT id, name, created_at, updated_at FROM tags ORDER BY name")
+        return await cur.fetchall()
+    except psycopg.Error as e:
+        print(f"Error retrieving tags: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+@records_write
+async def update_bookmark(bookmark_id, title=None, collection_id=None, tag_ids=None):
+    """Update a bookmark's title, collection, and tags"""
+    conn = await get_db_connection()
+    try:
+        async with conn.transaction():
+            # updated_at moves on every change, including tag-only changes
+            update_fields = ["updated_at = CURRENT_TIMESTAMP"]
+            params = []
+
+            if title is not None:
+                update_fields.append("title = %s")
+                params.append(title)
+
+            if collection_id is not None:
+                update_fields.append("collection_id = %s")
+                params.append(collection_id)
+
+            params.append(bookmark_id)
+            await conn.execute(f"""
+                UPDATE bookmarks
+                SET {', '.join(update_fields)}
+                WHERE id = %s
+            """, params)
+
+            # Replace tags if provided
+            if tag_ids is not None:
+                await conn.execute(
+                    "DELETE FROM bookmark_tags WHERE bookmark_id = %s",
+                    (bookmark_id,)
+                )
+                async with conn.cursor() as cur:
+                    await cur.executemany(
+                        "INSERT INTO bookmark_tags (bookmark_id, tag_id) VALUES (%s, %s)",
+                        [(bookmark_id, tag_id) for tag_id in tag_ids]
+                    )
+        return True
+    except psycopg.Error as e:
+        print(f"Error updating bookmark: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_bookmarks_by_tag_id(tag_id):
+    """Get all bookmarks that have a specific tag."""
+    try:
+        return (await _list_bookmarks(*_bookmark_filter(tag_id=tag_id)))[0]
+    except Exception as e:
+        print(f"Error getting bookmarks by tag: {e}")
+        raise
+
+@timed_query
+async def get_bookmarks_by_collection_id(collection_id):
+    """Get all bookmarks that belong to a specific collection."""
+    try:
+        return (await _list_bookmarks(*_bookmark_filter(collection_id=collection_id)))[0]
+    except Exception as e:
+        print(f"Error getting bookmarks by collection: {e}")
+        raise
+
+@timed_query
+async def get_table_versions(tables):
+    """Return (version token, last modified) summarizing changes to the given tables.
+
+    Tables carry no cheap modification time, so last modified is always None.
+    """
+    conn = await get_db_connection(read_only=True)
+    try:
+        cur = await conn.execute("SELECT " + _table_versions_sql(tables))
+        row = await cur.fetchone()
+        return version_token(row['newest_xids'], row['snapshot_xmin']), None
+    except psycopg.Error as e:
+        print(f"Error retrieving table versions: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_bookmark_version(bookmark_id):
+    """Return (version token, last modified) for one bookmark, or None if it does not exist"""
+    conn = await get_db_connection(read_only=True)
+    try:
+        # Collection and tag names are part of the hydrated bookmark too
+        cur = await conn.execute(f"""
+            SELECT b.change_xid::text AS change_xid, b.updated_at,
+                   {_table_versions_sql(('tags', 'collections'))}
+            FROM bookmarks b
+            WHERE b.id = %s
+        """, (bookmark_id,))
+        row = await cur.fetchone()
+        if row is None:
+            return None
+        token = version_token(row['newest_xids'], row['snapshot_xmin'])
+        return f"{row['change_xid']}.{token}", row['updated_at']
+    except psycopg.Error as e:
+        print(f"Error retrieving bookmark version: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_changes_since(since=None):
+    """Return what was created, changed or deleted after the sync cursor `since`"""
+    conn = await get_db_connection()
+    try:
+        async with conn.transaction():
+            for query in SYNC_SNAPSHOT_QUERIES:
+                cur = await conn.execute(query)
+            until = (await cur.fetchone())['until']
+            window = {'since': since or 0, 'until': until}
+
+            changes = {}
+            for name, query in SYNC_QUERIES.items():
+                cur = await conn.execute(query, window)
+                changes[name] = await cur.fetchall()
+            changes['deleted'] = []
+            if since is not None:
+                cur = await conn.execute(SYNC_TOMBSTONES_QUERY, window)
+                changes['deleted'] = await cur.fetchall()
+            changes['cursor'] = str(until)
+            return changes
+    except psycopg.Error as e:
+        print(f"Error retrieving changes: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+async def export_bookmarks(since=None, batch_size=EXPORT_BATCH_SIZE):
+    """Stream bookmarks as NDJSON: the sync cursor first, then batches of lines"""
+    conn = await get_db_connection()
+    try:
+        async with conn.transaction():
+            for query in SYNC_SNAPSHOT_QUERIES:
+                cur = await conn.execute(query)
+            until = (await cur.fetchone())['until']
+            yield str(until)
+
+            async with conn.cursor(name='bookmark_export', row_factory=tuple_row) as cur:
+                cur.adapters.register_loader('text', _RawTextLoader)
+                if since is None:
+                    await cur.execute(EXPORT_QUERY + " ORDER BY b.id")
+                else:
+                    await cur.execute(EXPORT_SINCE_QUERY + " ORDER BY b.id", {'since': since, 'until': until})
+                while True:
+                    rows = await cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield b'\n'.join(row[0] for row in rows) + b'\n'
+    except psycopg.Error as e:
+        print(f"Error exporting bookmarks: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+@records_write
+async def save_summary(bookmark_id, summary):
+    """Save a summary for a bookmark"""
+    conn = await get_db_connection()
+    try:
+        async with conn.transaction():
+            # Replace any existing summary for this bookmark
+            await conn.execute("DELETE FROM summaries WHERE bookmark_id = %s", (bookmark_id,))
+            cur = await conn.execute(
+                "INSERT INTO summaries (bookmark_id, summary) VALUES (%s, %s) RETURNING id",
+                (bookmark_id, summary)
+            )
+            return (await cur.fetchone())['id']
+    except psycopg.Error as e:
+        print(f"Error saving summary: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_summary(bookmark_id):
+    """Retrieve a summary for a bookmark"""
+    conn = await get_db_connection(read_only=True)
+    try:
+        cur = await conn.execute(
+            "SELECT summary FROM summaries WHERE bookmark_id = %s", (bookmark_id,)
+        )
+        result = await cur.fetchone()
+        return result['summary'] if result else None
+    except psycopg.Error as e:
+        print(f"Error retrieving summary: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_stored_transcripts(video_id):
+    """Retrieve every previously fetched transcript of a video, by language"""
+    conn = await get_db_connection()
+    try:
+        cur = await conn.execute(
+            "SELECT language, transcript FROM transcripts WHERE video_id = %s",
+            (video_id,)
+        )
+        return {row['language']: row['transcript'] for row in await cur.fetchall()}
+    except psycopg.Error as e:
+        print(f"Error retrieving transcript: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def save_transcript(video_id, language, transcript):
+    """Store a fetched transcript, replacing any previous copy"""
+    conn = await get_db_connection()
+    try:
+        await conn.execute("""
+            INSERT INTO transcripts (video_id, language, transcript) VALUES (%s, %s, %s)
+            ON CONFLICT (video_id, language)
+            DO UPDATE SET transcript = EXCLUDED.transcript, created_at = CURRENT_TIMESTAMP
+        """, (video_id, language, transcript))
+    except psycopg.Error as e:
+        print(f"Error saving transcript: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_video_summary(video_id, prompt_version, model):
+    """Retrieve a generated summary for a video, prompt version and model, or None"""
+    conn = await get_db_connection()
+    try:
+        cur = await conn.execute("""
+            SELECT summary FROM video_summaries
+            WHERE video_id = %s AND prompt_version = %s AND model = %s
+        """, (video_id, prompt_version, model))
+        row = await cur.fetchone()
+        return row['summary'] if row else None
+    except psycopg.Error as e:
+        print(f"Error retrieving video summary: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def save_video_summary(video_id, prompt_version, model, summary):
+    """Store a generated summary so other bookmarks of the same video can reuse it"""
+    conn = await get_db_connection()
+    try:
+        await conn.execute("""
+            INSERT INTO video_summaries (video_id, prompt_version, model, summary)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (video_id, prompt_version, model)
+            DO UPDATE SET summary = EXCLUDED.summary, created_at = CURRENT_TIMESTAMP
+        """, (video_id, prompt_version, model, summary))
+    except psycopg.Error as e:
+        print(f"Error saving video summary: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def claim_video_summary(video_id, prompt_version, model, lease):
+    """Claim generating a video's summary for `lease` seconds; return whether we got it"""
+    conn = await get_db_connection()
+    try:
+        # An expired claim belongs to a generator that died; take it over
+        cur = await conn.execute("""
+            INSERT INTO video_summary_claims (video_id, prompt_version, model, claimed_until)
+            VALUES (%s, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+            ON CONFLICT (video_id, prompt_version, model) DO UPDATE
+            SET claimed_until = EXCLUDED.claimed_until
+            WHERE video_summary_claims.claimed_until < CURRENT_TIMESTAMP
+            RETURNING 1
+        """, (video_id, prompt_version, model, lease))
+        return await cur.fetchone() is not None
+    except psycopg.Error as e:
+        print(f"Error claiming video summary: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def release_video_summary(video_id, prompt_version, model):
+    """Give up the claim taken with claim_video_summary()"""
+    conn = await get_db_connection()
+    try:
+        await conn.execute("""
+            DELETE FROM video_summary_claims
+            WHERE video_id = %s AND prompt_version = %s AND model = %s
+        """, (video_id, prompt_version, model))
+    except psycopg.Error as e:
+        print(f"Error releasing video summary claim: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def save_embedding(bookmark_id, model, vector):
+    """Store a bookmark's embedding as raw float32 bytes"""
+    conn = await get_db_connection()
+    try:
+        await conn.execute("""
+            INSERT INTO embeddings (bookmark_id, model, vector, updated_at)
+            VALUES (%s, %s, %s, clock_timestamp())
+            ON CONFLICT (bookmark_id)
+            DO UPDATE SET model = EXCLUDED.model, vector = EXCLUDED.vector,
+                          updated_at = EXCLUDED.updated_at
+        """, (bookmark_id, model, bytes(vector)))
+    except psycopg.Error as e:
+        print(f"Error saving embedding: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_embeddings_since(model, since=None):
+    """Return (bookmark_id, vector_bytes, updated_at) rows for `model` changed after `since`"""
+    conn = await get_db_connection()
+    try:
+        cur = await conn.execute("""
+            SELECT bookmark_id, vector, updated_at FROM embeddings
+            WHERE model = %s AND (%s::timestamptz IS NULL OR updated_at > %s)
+            ORDER BY updated_at
+        """, (model, since, since))
+        return [
+            (row['bookmark_id'], bytes(row['vector']), row['updated_at'])
+            for row in await cur.fetchall()
+        ]
+    except psycopg.Error as e:
+        print(f"Error retrieving embeddings: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def enqueue_job(kind, bookmark_id, priority=0):
+    """Queue a job, or return the id of the identical job already queued or running"""
+    conn = await get_db_connection()
+    try:
+        async with conn.transaction():
+            # One statement, so a job finishing between a failed insert and a
+            # follow-up lookup cannot leave us without a row. A queued
+            # prefetch of the same job moves up to this priority.
+            cur = await conn.execute("""
+                INSERT INTO jobs (kind, bookmark_id, priority) VALUES (%s, %s, %s)
+                ON CONFLICT (kind, bookmark_id) WHERE status IN ('queued', 'running')
+                DO UPDATE SET priority = GREATEST(jobs.priority, EXCLUDED.priority)
+                RETURNING id
+            """, (kind, bookmark_id, priority))
+            row = await cur.fetchone()
+        return row['id']
+    except psycopg.Error as e:
+        print(f"Error enqueuing job: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def enqueue_job_batch(kind, bookmark_ids, scope=None, priority=0):
+    """Queue one job per bookmark as a batch and return the batch id.
+
+    Bookmarks that already have an active job of this kind join the batch with
+    that job instead of getting a duplicate.
+    """
+    conn = await get_db_connection()
+    try:
+        async with conn.transaction():
+            cur = await conn.execute(
+                "INSERT INTO job_batches (kind, scope) VALUES (%s, %s) RETURNING id",
+                (kind, scope)
+            )
+            batch_id = (await cur.fetchone())['id']
+            # As in enqueue_job, one statement: an active job that finishes
+            # meanwhile is replaced by a new one rather than left out
+            await conn.execute("""
+                WITH enqueued AS (
+                    INSERT INTO jobs (kind, bookmark_id, priority)
+                    SELECT DISTINCT %s, bookmark_id, %s FROM unnest(%s::integer[]) AS bookmark_id
+                    ON CONFLICT (kind, bookmark_id) WHERE status IN ('queued', 'running')
+                    DO UPDATE SET priority = GREATEST(jobs.priority, EXCLUDED.priority)
+                    RETURNING id
+                )
+                INSERT INTO job_batch_items (batch_id, job_id)
+                SELECT %s, id FROM enqueued
+            """, (kind, priority, list(bookmark_ids), batch_id))
+        return batch_id
+    except psycopg.Error as e:
+        print(f"Error enqueuing job batch: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_job_batch(batch_id):
+    """Retrieve a batch with per-status job counts, or None"""
+    conn = await get_db_connection()
+    try:
+        cur = await conn.execute("SELECT * FROM job_batches WHERE id = %s", (batch_id,))
+        batch = await cur.fetchone()
+        if not batch:
+            return None
+        cur = await conn.execute("""
+            SELECT j.status, count(*) AS count
+            FROM job_batch_items i
+            JOIN jobs j ON j.id = i.job_id
+            WHERE i.batch_id = %s
+            GROUP BY j.status
+        """, (batch_id,))
+        batch['counts'] = {row['status']: row['count'] for row in await cur.fetchall()}
+        return batch
+    except psycopg.Error as e:
+        print(f"Error retrieving job batch: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_summarized_bookmark_ids(bookmark_ids):
+    """Return the subset of bookmark ids that already have a summary"""
+    if not bookmark_ids:
+        return set()
+    conn = await get_db_connection()
+    try:
+        cur = await conn.execute(
+            "SELECT DISTINCT bookmark_id FROM summaries WHERE bookmark_id = ANY(%s)",
+            (list(bookmark_ids),)
+        )
+        return {row['bookmark_id'] for row in await cur.fetchall()}
+    except psycopg.Error as e:
+        print(f"Error retrieving summarized bookmarks: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def claim_job(kinds=None, priority_above=None):
+    """Atomically claim the next runnable job (optionally of the given kinds, or
+    above a priority), or None"""
+    conn = await get_db_connection()
+    try:
+        cur = await conn.execute(f"""
+            UPDATE jobs
+            SET status = 'running', attempts = attempts + 1,
+                locked_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE status = 'queued' AND run_after <= CURRENT_TIMESTAMP
+                  AND (%s::text[] IS NULL OR kind = ANY(%s::text[]))
+                  AND (%s::integer IS NULL OR priority > %s)
+                ORDER BY priority DESC, id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {JOB_COLUMNS}
+        """, (kinds, kinds, priority_above, priority_above))
+        return await cur.fetchone()
+    except psycopg.Error as e:
+        print(f"Error claiming job: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def complete_job(job_id, result=None):
+    """Mark a running job as succeeded with an optional JSON result"""
+    conn = await get_db_connection()
+    try:
+        await conn.execute("""
+            UPDATE jobs
+            SET status = 'succeeded', result = %s, error = NULL,
+                locked_at = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """, (Jsonb(result), job_id))
+    except psycopg.Error as e:
+        print(f"Error completing job: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def fail_job(job_id, error, retry_in=None):
+    """Record a job failure; requeue it after `retry_in` seconds if given, else fail it"""
+    conn = await get_db_connection()
+    try:
+        if retry_in is None:
+            await conn.execute("""
+                UPDATE jobs
+                SET status = 'failed', error = %s,
+                    locked_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (error, job_id))
+        else:
+            await conn.execute("""
+                UPDATE jobs
+                SET status = 'queued', error = %s, locked_at = NULL,
+                    run_after = CURRENT_TIMESTAMP + %s * INTERVAL '1 second',
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (error, float(retry_in), job_id))
+    except psycopg.Error as e:
+        print(f"Error failing job: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def requeue_stale_jobs(stale_after, max_attempts):
+    """Requeue jobs left running longer than `stale_after` seconds (e.g. by a killed worker)
+
+    Jobs that already used `max_attempts` attempts are failed instead.
+    Returns (requeued, failed).
+    """
+    conn = await get_db_connection()
+    try:
+        cur = await conn.execute("""
+            UPDATE jobs
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                error = CASE WHEN attempts >= %s THEN 'Worker stopped before finishing the last attempt'
+                             ELSE error END,
+                locked_at = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'running'
+              AND locked_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+            RETURNING status
+        """, (max_attempts, max_attempts, float(stale_after)))
+        statuses = [row['status'] for row in await cur.fetchall()]
+        return statuses.count('queued'), statuses.count('failed')
+    except psycopg.Error as e:
+        print(f"Error requeuing stale jobs: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
+
+@timed_query
+async def get_job(job_id):
+    """Retrieve a job's state"""
+    conn = await get_db_connection()
+    try:
+        cur = await conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = %s", (job_id,))
+        return await cur.fetchone()
+    except psycopg.Error as e:
+        print(f"Error retrieving job: {e}")
+        raise
+    finally:
+        await release_db_connection(conn)
@@ -1,7 +1,21 @@
 import os
+import io
+import json
+import base64
+import functools
+import threading
+from contextlib import contextmanager
 import psycopg2
-from psycopg2.extras import DictCursor
-from datetime import datetime
+import psycopg2.extensions
+from psycopg2.extras import DictCursor, Json, execute_values
+from datetime import datetime, timezone
+from db_pool import ConnectionPool
+from metrics import timed_query
+from profiler import profiling_enabled, ProfilingConnection
+import metrics
+from replicas import (
+    choose_replica, get_replica_monitor, get_replica_status, in_read_session, note_write, set_primary
+)
 
 # Database configuration
 DB_CONFIG = {
@@ -12,86 +26,146 @@ DB_CONFIG = {
     'port': os.getenv('POSTGRES_PORT', '5432')
 }
 
-def get_db_connection():
-    """Create and return a database connection"""
+# The replica monitor measures lag against the primary's WAL position
+set_primary(DB_CONFIG)
+
+# psycopg2 connection class for pooled connections. Kept out of DB_CONFIG,
+# which must stay plain connection parameters (database_async builds a
+# conninfo string from it). Profiled requests record their SQL (see profiler.py)
+CONNECTION_FACTORY = ProfilingConnection if profiling_enabled() else None
+
+def _connect_kwargs(params):
+    """Connection parameters plus CONNECTION_FACTORY, for ConnectionPool"""
+    if CONNECTION_FACTORY is None:
+        return dict(params)
+    return dict(params, connection_factory=CONNECTION_FACTORY)
+
+# Connection pool configuration
+POOL_CONFIG = {
+    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', '5')),
+    'healthcheck_interval': float(os.getenv('DB_POOL_HEALTHCHECK_INTERVAL', '30'))
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(_connect_kwargs(DB_CONFIG), **POOL_CONFIG)
+    return _pool
+
+# One pool per read replica (see replicas.py), and the replica pool each
+# checked-out replica connection must go back to
+_replica_pools = {}
+_replica_checkouts = {}
+
+def _get_replica_pool(replica):
+    pool = _replica_pools.get(replica.name)
+    if pool is None:
+        with _pool_lock:
+            pool = _replica_pools.get(replica.name)
+            if pool is None:
+                pool = _replica_pools[replica.name] = ConnectionPool(
+                    _connect_kwargs({'dsn': replica.dsn}), **POOL_CONFIG
+                )
+    return pool
+
+def get_db_connection(read_only=False):
+    """Check out a database connection from the pool.
+
+    With `read_only`, the connection may come from a read replica that has
+    caught up with the session's own writes; otherwise, or if no replica
+    qualifies, it comes from the primary.
+    """
+    if read_only:
+        replica = choose_replica()
+        if replica is not None:
+            try:
+                conn = _get_replica_pool(replica).getconn()
+                _replica_checkouts[id(conn)] = _replica_pools[replica.name]
+                metrics.db_reads.labels(replica.name).inc()
+                return conn
+            except psycopg2.Error as e:
+                # PoolTimeout is a psycopg2.Error too; either way, use the primary
+                print(f"Replica {replica.name} unavailable, reading from primary: {e}")
+                get_replica_monitor().take_out(replica, e)
+        metrics.db_reads.labels('primary').inc()
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
+        return get_pool().getconn()
     except psycopg2.Error as e:
         print(f"Error connecting to PostgreSQL: {e}")
         raise
 
-def init_db():
-    """Initialize the database and create necessary tables"""
+def release_db_connection(conn, discard=False):
+    """Return a connection to the pool it came from (broken connections are discarded)"""
+    pool = _replica_checkouts.pop(id(conn), None) or get_pool()
+    pool.putconn(conn, discard=discard)
+
+def records_write(fn):
+    """After `fn` commits, remember the primary's WAL position for read-your-writes.
+
+    Only inside a request's read session with replicas configured; job
+    workers and scripts pay nothing.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        result = fn(*args, **kwargs)
+        if in_read_session() and get_replica_monitor() is not None:
+            conn = get_db_connection()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_current_wal_lsn()::text")
+                    note_write(cur.fetchone()[0])
+                conn.commit()
+            except psycopg2.Error as e:
+                print(f"Error reading WAL position: {e}")
+                raise
+            finally:
+                release_db_connection(conn)
+        return result
+    return wrapper
+
+@contextmanager
+def advisory_lock(name):
+    """Hold a Postgres advisory lock on `name`, serializing work across processes"""
     conn = get_db_connection()
+    discard = False
     try:
         with conn.cursor() as cur:
-            # Create collections table
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS collections (
-                    id SERIAL PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Create tags table
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS tags (
-                    id SERIAL PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Create bookmarks table with title and collection_id
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS bookmarks (
-                    id SERIAL PRIMARY KEY,
-                    text TEXT NOT NULL,
-                    title TEXT,
-                    collection_id INTEGER REFERENCES collections(id) ON DELETE SET NULL,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Create bookmark_tags junction table
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS bookmark_tags (
-                    bookmark_id INTEGER REFERENCES bookmarks(id) ON DELETE CASCADE,
-                    tag_id INTEGER REFERENCES tags(id) ON DELETE CASCADE,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (bookmark_id, tag_id)
-                )
-            """)
-            
-            # Create summaries table
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS summaries (
-                    id SERIAL PRIMARY KEY,
-                    bookmark_id INTEGER REFERENCES bookmarks(id) ON DELETE CASCADE,
-                    summary TEXT NOT NULL,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Create indexes for better performance
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_bookmarks_collection_id ON bookmarks(collection_id)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_bookmark_tags_bookmark_id ON bookmark_tags(bookmark_id)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_bookmark_tags_tag_id ON bookmark_tags(tag_id)")
-            
+            cur.execute("SELECT pg_advisory_lock(hashtext(%s))", (name,))
         conn.commit()
-    except psycopg2.Error as e:
-        print(f"Error initializing database: {e}")
-        conn.rollback()
-        raise
+        try:
+            yield
+        finally:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (name,))
+                conn.commit()
+            except psycopg2.Error:
+                # Never return a connection that may still hold the lock
+                discard = True
+                raise
     finally:
-        conn.close()
+        release_db_connection(conn, discard=discard)
 
+def get_pool_stats():
+    """Return connection pool usage statistics, plus each replica's when configured"""
+    stats = get_pool().stats()
+    if get_replica_monitor() is not None:
+        stats['replicas'] = [
+            dict(status, pool=_replica_pools[status['name']].stats() if status['name'] in _replica_pools else None)
+            for status in get_replica_status()
+        ]
+    return stats
+
+@timed_query
+@records_write
 def save_bookmark(text, title=None, collection_id=None, tag_ids=None):
     """Save a new text bookmark to the database with optional title, collection, and tags"""
     conn = get_db_connection()
@@ -119,89 +193,503 @@ def save_bookmark(text, title=None, collection_id=None, tag_ids=None):
         conn.rollback()
         raise
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+# Bookmarks are loaded in chunks of this many items, one COPY per chunk
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '5000'))
+
+def _normalize_bulk_item(item):
+    """Validate one bulk-import item and return it as a dict of column values"""
+    if not isinstance(item, dict):
+        raise ValueError("Item must be a JSON object")
+    text = item.get('text')
+    if not isinstance(text, str) or not text:
+        raise ValueError("Text is required")
+    title = item.get('title')
+    if title is not None and not isinstance(title, str):
+        raise ValueError("title must be a string")
+
+    collection_id = item.get('collection_id')
+    collection_name = item.get('collection')
+    if collection_id is not None and not isinstance(collection_id, int):
+        raise ValueError("collection_id must be an integer")
+    if collection_name is not None and not isinstance(collection_name, str):
+        raise ValueError("collection must be a collection name")
+
+    tag_ids = item.get('tag_ids') or []
+    tag_names = item.get('tags') or []
+    if not isinstance(tag_ids, list) or not all(isinstance(t, int) for t in tag_ids):
+        raise ValueError("tag_ids must be a list of integers")
+    if not isinstance(tag_names, list) or not all(isinstance(t, str) and t for t in tag_names):
+        raise ValueError("tags must be a list of tag names")
+
+    created_at = item.get('created_at')
+    if isinstance(created_at, (int, float)) and not isinstance(created_at, bool):
+        try:
+            created_at = datetime.fromtimestamp(created_at, tz=timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            # inf, nan, or beyond the years datetime can represent
+            raise ValueError("created_at is not a valid unix timestamp")
+    elif isinstance(created_at, str):
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except ValueError:
+            raise ValueError("created_at is not a valid ISO 8601 timestamp")
+        if created_at.tzinfo is None:
+            # Without an offset, take the time as UTC rather than the server's zone
+            created_at = created_at.replace(tzinfo=timezone.utc)
+    elif created_at is not None:
+        raise ValueError("created_at must be an ISO 8601 string or a unix timestamp")
+
+    return {
+        'text': text,
+        'title': title,
+        'collection_id': collection_id,
+        'collection_name': collection_name,
+        'tag_ids': tag_ids,
+        'tag_names': tag_names,
+        'created_at': created_at,
+    }
+
+def _resolve_names(cur, table, names, cache):
+    """Map names to ids in `table` (tags or collections), creating missing rows"""
+    def lookup(names):
+        cur.execute(
+            f"SELECT name, min(id) FROM {table} WHERE name = ANY(%s) GROUP BY name",
+            (names,)
+        )
+        cache.update(cur.fetchall())
+        return [n for n in names if n not in cache]
+
+    to_create = lookup(sorted({n for n in names if n not in cache}))
+    if to_create:
+        # Names carry no unique index (create_tag allows duplicates), so
+        # ON CONFLICT cannot catch a concurrent import creating the same name.
+        # Imports take turns instead and look again once it is theirs; one
+        # lock for both tables, held to commit, so two imports cannot deadlock
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('bulk_import_names'))")
+        to_create = lookup(to_create)
+    if to_create:
+        created = execute_values(
+            cur, f"INSERT INTO {table} (name) VALUES %s RETURNING name, id",
+            [(n,) for n in to_create], fetch=True
+        )
+        cache.update(created)
+
+def _existing_ids(cur, table, ids):
+    """Return the subset of `ids` present in `table`"""
+    if not ids:
+        return set()
+    cur.execute(f"SELECT id FROM {table} WHERE id = ANY(%s)", (list(ids),))
+    return {row[0] for row in cur.fetchall()}
+
+def _csv_field(value):
+    """Format a value for COPY ... WITH (FORMAT csv), keeping NULL distinct from ''"""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def _copy_rows(cur, table, columns, rows):
+    """Load rows into `table` with a single COPY FROM STDIN"""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write(','.join(_csv_field(v) for v in row))
+        buf.write('\n')
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf
+    )
+
+def _bulk_insert_chunk(cur, chunk, now, tag_cache, collection_cache, results):
+    """Insert one chunk of (index, item) pairs, recording an id or error per index"""
+    pending = []
+    for index, item in chunk:
+        try:
+            pending.append((index, _normalize_bulk_item(item)))
+        except ValueError as e:
+            results[index] = {'error': str(e)}
+    if not pending:
+        return
+
+    # Resolve names to ids, creating tags and collections that do not exist yet
+    _resolve_names(cur, 'tags', [n for _, b in pending for n in b['tag_names']], tag_cache)
+    _resolve_names(
+        cur, 'collections',
+        [b['collection_name'] for _, b in pending if b['collection_name']],
+        collection_cache
+    )
 
+    # Check referenced ids up front so a bad reference fails one item, not the chunk
+    known_tags = _existing_ids(cur, 'tags', {t for _, b in pending for t in b['tag_ids']})
+    known_collections = _existing_ids(
+        cur, 'collections', {b['collection_id'] for _, b in pending if b['collection_id'] is not None}
+    )
+    rows = []
+    for index, b in pending:
+        unknown_tags = [t for t in b['tag_ids'] if t not in known_tags]
+        if unknown_tags:
+            results[index] = {'error': f"Unknown tag_ids: {unknown_tags}"}
+            continue
+        if b['collection_id'] is not None and b['collection_id'] not in known_collections:
+            results[index] = {'error': f"Unknown collection_id: {b['collection_id']}"}
+            continue
+        collection_id = b['collection_id']
+        if collection_id is None and b['collection_name']:
+            collection_id = collection_cache[b['collection_name']]
+        tag_ids = list(dict.fromkeys(b['tag_ids'] + [tag_cache[n] for n in b['tag_names']]))
+        rows.append((index, b['text'], b['title'], collection_id, b['created_at'] or now, tag_ids))
+    if not rows:
+        return
+
+    # Allocate ids up front so the bookmark and tag-link COPYs can share them
+    cur.execute(
+        "SELECT nextval(pg_get_serial_sequence('bookmarks', 'id')) FROM generate_series(1, %s)",
+        (len(rows),)
+    )
+    ids = [row[0] for row in cur.fetchall()]
+
+    cur.execute("SAVEPOINT bulk_chunk")
+    try:
+        _copy_rows(
+            cur, 'bookmarks', ('id', 'text', 'title', 'collection_id', 'created_at', 'updated_at'),
+            [(bid, text, title, cid, created, created)
+             for bid, (_, text, title, cid, created, _) in zip(ids, rows)]
+        )
+        _copy_rows(
+            cur, 'bookmark_tags', ('bookmark_id', 'tag_id'),
+            [(bid, tag_id) for bid, row in zip(ids, rows) for tag_id in row[5]]
+        )
+        cur.execute("RELEASE SAVEPOINT bulk_chunk")
+        for bid, row in zip(ids, rows):
+            results[row[0]] = {'id': bid}
+        return
+    except psycopg2.Error:
+        cur.execute("ROLLBACK TO SAVEPOINT bulk_chunk")
+
+    # Something in the chunk was rejected; insert row by row to isolate it
+    for bid, (index, text, title, cid, created, tag_ids) in zip(ids, rows):
+        cur.execute("SAVEPOINT bulk_item")
+        try:
+            cur.execute(
+                "INSERT INTO bookmarks (id, text, title, collection_id, created_at, updated_at) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                (bid, text, title, cid, created, created)
+            )
+            if tag_ids:
+                execute_values(
+                    cur, "INSERT INTO bookmark_tags (bookmark_id, tag_id) VALUES %s",
+                    [(bid, tag_id) for tag_id in tag_ids]
+                )
+            cur.execute("RELEASE SAVEPOINT bulk_item")
+            results[index] = {'id': bid}
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT bulk_item")
+            results[index] = {'error': str(e).strip()}
+
+@timed_query
+@records_write
+def bulk_save_bookmarks(items):
+    """Import many bookmarks in one transaction, loading them chunk by chunk with COPY.
+
+    Items take the same fields as save_bookmark, plus `tags` / `collection` given by
+    name and an optional `created_at`. Returns one {'id': ...} or {'error': ...} per item.
+    """
+    results = [None] * len(items)
+    tag_cache, collection_cache = {}, {}
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT CURRENT_TIMESTAMP")
+            now = cur.fetchone()[0]
+            for start in range(0, len(items), BULK_CHUNK_SIZE):
+                chunk = list(enumerate(items[start:start + BULK_CHUNK_SIZE], start))
+                _bulk_insert_chunk(cur, chunk, now, tag_cache, collection_cache, results)
+        conn.commit()
+        return results
+    except psycopg2.Error as e:
+        print(f"Error bulk saving bookmarks: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+# A bookmark's tags as a JSON array of {id, name}
+BOOKMARK_TAGS_JSON = """
+    COALESCE((
+        SELECT json_agg(json_build_object('id', t.id, 'name', t.name) ORDER BY t.id)
+        FROM bookmark_tags bt
+        JOIN tags t ON t.id = bt.tag_id
+        WHERE bt.bookmark_id = b.id
+    ), '[]'::json)
+"""
+
+# Bookmarks hydrated with collection name and tags in a single statement.
+# Callers append their own WHERE / ORDER BY / LIMIT.
+HYDRATED_BOOKMARK_COLUMNS = f"""
+    b.id, b.text, b.title, b.collection_id, b.created_at, b.updated_at,
+    c.name as collection_name,
+    {BOOKMARK_TAGS_JSON} as tags
+"""
+HYDRATED_BOOKMARK_SELECT = f"""
+    SELECT {HYDRATED_BOOKMARK_COLUMNS}
+    FROM bookmarks b
+    LEFT JOIN collections c ON b.collection_id = c.id
+"""
+
+# Full-text hits (a `hits` CTE of id, rank) hydrated like the above.
+SEARCH_BOOKMARK_SELECT = f"""
+    SELECT h.rank, {HYDRATED_BOOKMARK_COLUMNS}
+    FROM hits h
+    JOIN bookmarks b ON b.id = h.id
+    LEFT JOIN collections c ON b.collection_id = c.id
+    ORDER BY h.rank DESC, b.id DESC
+"""
+
+# The same bookmark rendered to JSON by Postgres, with jsonify's sorted keys
+# and HTTP-date timestamps, plus the keyset columns for ordering and cursors
+_HTTP_DATE = """to_char(%s AT TIME ZONE 'UTC', 'Dy, DD Mon YYYY HH24:MI:SS "GMT"')"""
+BOOKMARK_JSON_SELECT = f"""
+    SELECT json_build_object(
+               'collection_id', b.collection_id,
+               'collection_name', c.name,
+               'created_at', {_HTTP_DATE % 'b.created_at'},
+               'id', b.id,
+               'tags', {BOOKMARK_TAGS_JSON},
+               'text', b.text,
+               'title', b.title,
+               'updated_at', {_HTTP_DATE % 'b.updated_at'}
+           ) AS doc,
+           b.created_at, b.id,
+           row_number() OVER (ORDER BY b.created_at DESC, b.id DESC) AS n
+    FROM bookmarks b
+    LEFT JOIN collections c ON b.collection_id = c.id
+"""
+
+@timed_query
 def get_bookmark(bookmark_id):
     """Retrieve a bookmark by ID with its collection and tags"""
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=True)
     try:
         with conn.cursor(cursor_factory=DictCursor) as cur:
-            # Get bookmark details
-            cur.execute("""
-                SELECT b.*, c.name as collection_name 
-                FROM bookmarks b
-                LEFT JOIN collections c ON b.collection_id = c.id
-                WHERE b.id = %s
-            """, (bookmark_id,))
+            cur.execute(HYDRATED_BOOKMARK_SELECT + " WHERE b.id = %s", (bookmark_id,))
             bookmark = cur.fetchone()
-            
-            if not bookmark:
-                return None
-                
-            # Get tags for this bookmark
-            cur.execute("""
-                SELECT t.id, t.name
-                FROM tags t
-                JOIN bookmark_tags bt ON t.id = bt.tag_id
-                WHERE bt.bookmark_id = %s
-            """, (bookmark_id,))
-            tags = cur.fetchall()
-            
-            result = dict(bookmark)
-            result['tags'] = [dict(tag) for tag in tags]
-            return result
+            return dict(bookmark) if bookmark else None
     except psycopg2.Error as e:
         print(f"Error retrieving bookmark: {e}")
         raise
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+@timed_query
+def get_bookmarks_by_ids(bookmark_ids):
+    """Retrieve several bookmarks by ID in one query, in the order the IDs were given"""
+    if not bookmark_ids:
+        return []
+    conn = get_db_connection(read_only=True)
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            cur.execute(HYDRATED_BOOKMARK_SELECT + " WHERE b.id = ANY(%s)", (list(bookmark_ids),))
+            by_id = {row['id']: dict(row) for row in cur.fetchall()}
+            return [by_id[i] for i in bookmark_ids if i in by_id]
+    except psycopg2.Error as e:
+        print(f"Error retrieving bookmarks by ids: {e}")
+        raise
+    finally:
+        release_db_connection(conn)
+
+def encode_cursor(created_at, bookmark_id):
+    """Encode a (created_at, id) keyset position as an opaque cursor string"""
+    raw = json.dumps([created_at.isoformat(), bookmark_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor, raising ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, bookmark_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(bookmark_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+@timed_query
+def search_bookmarks(query, limit, cursor=None):
+    """Full-text search over titles, text and summaries, best matches first.
+
+    Returns (bookmarks, next_cursor); each bookmark carries its `rank`.
+    """
+    conditions = ["b.search_vector @@ q"]
+    params = [query]
+    if cursor is not None:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            rank, bookmark_id = json.loads(raw)
+            params.extend([float(rank), int(bookmark_id)])
+        except (ValueError, TypeError) as e:
+            raise ValueError("Invalid cursor") from e
+        # ts_rank_cd is real; compare in real so a tied rank isn't skipped
+        conditions.append("(ts_rank_cd(b.search_vector, q), b.id) < (%s::real, %s)")
+    params.append(limit + 1)
+
+    conn = get_db_connection(read_only=True)
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            cur.execute(f"""
+                WITH hits AS (
+                    SELECT b.id, ts_rank_cd(b.search_vector, q) AS rank
+                    FROM bookmarks b, websearch_to_tsquery('english', %s) q
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY rank DESC, b.id DESC
+                    LIMIT %s
+                )
+                {SEARCH_BOOKMARK_SELECT}
+            """, params)
+            bookmarks_list = [dict(row) for row in cur.fetchall()]
+
+            next_cursor = None
+            if len(bookmarks_list) > limit:
+                bookmarks_list = bookmarks_list[:limit]
+                last = bookmarks_list[-1]
+                raw = json.dumps([last['rank'], last['id']]).encode()
+                next_cursor = base64.urlsafe_b64encode(raw).decode().rstrip('=')
+            return bookmarks_list, next_cursor
+    except psycopg2.Error as e:
+        print(f"Error searching bookmarks: {e}")
+        raise
+    finally:
+        release_db_connection(conn)
+
+def _list_bookmarks(join_sql="", where_sql=None, params=(), limit=None, cursor=None):
+    """Fetch bookmarks newest first, optionally one keyset page at a time.
+
+    Returns (bookmarks, next_cursor); next_cursor is None on the last page.
+    """
+    conditions, params = _keyset_conditions(where_sql, params, cursor)
+    query = f"""
+        {HYDRATED_BOOKMARK_SELECT}
+        {join_sql}
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY b.created_at DESC, b.id DESC
+    """
+    if limit is not None:
+        # Fetch one extra row to learn whether another page exists
+        query += " LIMIT %s"
+        params.append(limit + 1)
+
+    conn = get_db_connection(read_only=True)
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            cur.execute(query, params)
+            bookmarks_list = [dict(row) for row in cur.fetchall()]
+
+            next_cursor = None
+            if limit is not None and len(bookmarks_list) > limit:
+                bookmarks_list = bookmarks_list[:limit]
+                last = bookmarks_list[-1]
+                next_cursor = encode_cursor(last['created_at'], last['id'])
+
+            return bookmarks_list, next_cursor
+    finally:
+        release_db_connection(conn)
+
+def _keyset_conditions(where_sql, params, cursor):
+    """Return (conditions, params) for a listing filter plus its keyset position"""
+    conditions = [where_sql] if where_sql else []
+    params = list(params)
+    if cursor is not None:
+        created_at, bookmark_id = decode_cursor(cursor)
+        conditions.append("(b.created_at, b.id) < (%s, %s)")
+        params.extend([created_at, bookmark_id])
+    return conditions, params
+
+def _bookmark_filter(tag_id=None, collection_id=None):
+    """Return (join_sql, where_sql, params) restricting bookmarks to a tag or collection"""
+    if tag_id is not None:
+        return "JOIN bookmark_tags bt ON b.id = bt.bookmark_id", "bt.tag_id = %s", (tag_id,)
+    if collection_id is not None:
+        return "", "b.collection_id = %s", (collection_id,)
+    return "", None, ()
 
+@timed_query
 def get_all_bookmarks():
     """Retrieve all bookmarks with their collections and tags"""
-    conn = get_db_connection()
     try:
-        with conn.cursor(cursor_factory=DictCursor) as cur:
-            # Get all bookmarks with collection names
-            cur.execute("""
-                SELECT b.*, c.name as collection_name 
-                FROM bookmarks b
-                LEFT JOIN collections c ON b.collection_id = c.id
-                ORDER BY b.created_at DESC
-            """)
-            bookmarks = cur.fetchall()
-            
-            # Convert to list of dictionaries
-            bookmarks_list = [dict(row) for row in bookmarks]
-            
-            # Get tags for all bookmarks
-            bookmark_ids = [b['id'] for b in bookmarks_list]
-            if bookmark_ids:
-                cur.execute("""
-                    SELECT bt.bookmark_id, t.id, t.name
-                    FROM tags t
-                    JOIN bookmark_tags bt ON t.id = bt.tag_id
-                    WHERE bt.bookmark_id = ANY(%s)
-                """, (bookmark_ids,))
-                tags_by_bookmark = {}
-                for row in cur.fetchall():
-                    if row['bookmark_id'] not in tags_by_bookmark:
-                        tags_by_bookmark[row['bookmark_id']] = []
-                    tags_by_bookmark[row['bookmark_id']].append({
-                        'id': row['id'],
-                        'name': row['name']
-                    })
-                
-                # Add tags to each bookmark
-                for bookmark in bookmarks_list:
-                    bookmark['tags'] = tags_by_bookmark.get(bookmark['id'], [])
-            
-            return bookmarks_list
+        return _list_bookmarks()[0]
     except psycopg2.Error as e:
         print(f"Error retrieving bookmarks: {e}")
         raise
+
+@timed_query
+def get_bookmarks_page(limit, cursor=None, tag_id=None, collection_id=None):
+    """Retrieve one page of bookmarks (optionally by tag or collection) and the next cursor"""
+    join_sql, where_sql, params = _bookmark_filter(tag_id, collection_id)
+    try:
+        return _list_bookmarks(join_sql, where_sql, params, limit=limit, cursor=cursor)
+    except psycopg2.Error as e:
+        print(f"Error retrieving bookmarks page: {e}")
+        raise
+
+def _bookmarks_json_query(limit, cursor, tag_id, collection_id):
+    """Return (query, params) rendering a listing to one row of
+    (JSON array, has_more, last created_at, last id)"""
+    join_sql, where_sql, params = _bookmark_filter(tag_id, collection_id)
+    conditions, params = _keyset_conditions(where_sql, params, cursor)
+    listing = f"""
+        {BOOKMARK_JSON_SELECT}
+        {join_sql}
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY b.created_at DESC, b.id DESC
+    """
+    # Aggregating in the listing's own order lets Postgres skip a second sort
+    if limit is None:
+        query = f"""
+            WITH listing AS ({listing})
+            SELECT COALESCE(json_agg(doc ORDER BY created_at DESC, id DESC), '[]')::text,
+                   false, NULL, NULL
+            FROM listing
+        """
+    else:
+        # One extra row tells whether another page exists; row `limit` is the cursor
+        query = f"""
+            WITH listing AS ({listing} LIMIT %s)
+            SELECT COALESCE(json_agg(doc ORDER BY created_at DESC, id DESC) FILTER (WHERE n <= %s), '[]')::text,
+                   count(*) > %s,
+                   max(created_at) FILTER (WHERE n = %s),
+                   max(id) FILTER (WHERE n = %s)
+            FROM listing
+        """
+        params.extend([limit + 1, limit, limit, limit, limit])
+    return query, params
+
+@timed_query
+def get_bookmarks_json(limit=None, cursor=None, tag_id=None, collection_id=None):
+    """Return (JSON array bytes, next_cursor) for a bookmark listing, rendered by Postgres.
+
+    The fast path for large listings: the document arrives as one text value
+    and is handed back undecoded, so no row objects or dicts are built and
+    nothing is re-encoded. The bytes match what jsonify would produce for
+    the same rows, key order and whitespace aside.
+    """
+    query, params = _bookmarks_json_query(limit, cursor, tag_id, collection_id)
+    conn = get_db_connection(read_only=True)
+    try:
+        with conn.cursor() as cur:
+            psycopg2.extensions.register_type(psycopg2.extensions.BYTES, cur)
+            cur.execute(query, params)
+            body, has_more, last_created_at, last_id = cur.fetchone()
+            next_cursor = encode_cursor(last_created_at, last_id) if has_more else None
+            return body, next_cursor
+    except psycopg2.Error as e:
+        print(f"Error rendering bookmarks JSON: {e}")
+        raise
     finally:
-        conn.close()
+        release_db_connection(conn)
 
+@timed_query
+@records_write
 def create_collection(name):
     """Create a new collection"""
     conn = get_db_connection()
@@ -219,21 +707,24 @@ def create_collection(name):
         conn.rollback()
         raise
     finally:
-        conn.close()
+        release_db_connection(conn)
 
+@timed_query
 def get_all_collections():
     """Get all collections"""
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=True)
     try:
         with conn.cursor(cursor_factory=DictCursor) as cur:
-            cur.execute("SELECT * FROM collections ORDER BY name")
+            cur.execute("SELECT id, name, created_at, updated_at FROM collections ORDER BY name")
             return [dict(row) for row in cur.fetchall()]
     except psycopg2.Error as e:
         print(f"Error retrieving collections: {e}")
         raise
     finally:
-        conn.close()
+        release_db_connection(conn)
 
+@timed_query
+@records_write
 def create_tag(name):
     """Create a new tag"""
     conn = get_db_connection()
@@ -251,28 +742,32 @@ def create_tag(name):
         conn.rollback()
         raise
     finally:
-        conn.close()
+        release_db_connection(conn)
 
+@timed_query
 def get_all_tags():
     """Get all tags"""
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=True)
     try:
         with conn.cursor(cursor_factory=DictCursor) as cur:
-            cur.execute("SELECT * FROM tags ORDER BY name")
+            cur.execute("SELECT id, name, created_at, updated_at FROM tags ORDER BY name")
             return [dict(row) for row in cur.fetchall()]
     except psycopg2.Error as e:
         print(f"Error retrieving tags: {e}")
         raise
     finally:
-        conn.close()
+        release_db_connection(conn)
 
+@timed_query
+@records_write
 def update_bookmark(bookmark_id, title=None, collection_id=None, tag_ids=None):
     """Update a bookmark's title, collection, and tags"""
     conn = get_db_connection()
     try:
         with conn.cursor() as cur:
-            # Update bookmark details
-            update_fields = []
+            # Update bookmark details; updated_at moves on every change,
+            # including tag-only changes, so it can validate cached copies
+            update_fields = ["updated_at = CURRENT_TIMESTAMP"]
             params = []
             
             if title is not None:
@@ -283,13 +778,12 @@ def update_bookmark(bookmark_id, title=None, collection_id=None, tag_ids=None):
                 update_fields.append("collection_id = %s")
                 params.append(collection_id)
                 
-            if update_fields:
-                params.append(bookmark_id)
-                cur.execute(f"""
-                    UPDATE bookmarks 
-                    SET {', '.join(update_fields)}
-                    WHERE id = %s
-                """, params)
+            params.append(bookmark_id)
+            cur.execute(f"""
+                UPDATE bookmarks 
+                SET {', '.join(update_fields)}
+                WHERE id = %s
+            """, params)
             
             # Update tags if provided
             if tag_ids is not None:
@@ -313,99 +807,226 @@ def update_bookmark(bookmark_id, title=None, collection_id=None, tag_ids=None):
         conn.rollback()
         raise
     finally:
-        conn.close()
+        release_db_connection(conn)
 
+@timed_query
 def get_bookmarks_by_tag_id(tag_id):
     """Get all bookmarks that have a specific tag."""
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=DictCursor) as cur:
-                cur.execute("""
-                    SELECT DISTINCT b.id, b.text, b.title, b.collection_id, 
-                           c.name as collection_name, b.created_at
-                    FROM bookmarks b
-                    LEFT JOIN collections c ON b.collection_id = c.id
-                    JOIN bookmark_tags bt ON b.id = bt.bookmark_id
-                    WHERE bt.tag_id = %s
-                    ORDER BY b.created_at DESC
-                """, (tag_id,))
-                bookmarks = cur.fetchall()
-                
-                # Convert to list of dictionaries
-                bookmarks_list = [dict(row) for row in bookmarks]
-                
-                # Get tags for all bookmarks
-                bookmark_ids = [b['id'] for b in bookmarks_list]
-                if bookmark_ids:
-                    cur.execute("""
-                        SELECT bt.bookmark_id, t.id, t.name
-                        FROM tags t
-                        JOIN bookmark_tags bt ON t.id = bt.tag_id
-                        WHERE bt.bookmark_id = ANY(%s)
-                    """, (bookmark_ids,))
-                    tags_by_bookmark = {}
-                    for row in cur.fetchall():
-                        if row['bookmark_id'] not in tags_by_bookmark:
-                            tags_by_bookmark[row['bookmark_id']] = []
-                        tags_by_bookmark[row['bookmark_id']].append({
-                            'id': row['id'],
-                            'name': row['name']
-                        })
-                    
-                    # Add tags to each bookmark
-                    for bookmark in bookmarks_list:
-                        bookmark['tags'] = tags_by_bookmark.get(bookmark['id'], [])
-                
-                return bookmarks_list
+        return _list_bookmarks(*_bookmark_filter(tag_id=tag_id))[0]
     except Exception as e:
         print(f"Error getting bookmarks by tag: {e}")
         raise
 
+@timed_query
 def get_bookmarks_by_collection_id(collection_id):
     """Get all bookmarks that belong to a specific collection."""
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=DictCursor) as cur:
-                cur.execute("""
-                    SELECT DISTINCT b.id, b.text, b.title, b.collection_id, 
-                           c.name as collection_name, b.created_at
-                    FROM bookmarks b
-                    LEFT JOIN collections c ON b.collection_id = c.id
-                    WHERE b.collection_id = %s
-                    ORDER BY b.created_at DESC
-                """, (collection_id,))
-                bookmarks = cur.fetchall()
-                
-                # Convert to list of dictionaries
-                bookmarks_list = [dict(row) for row in bookmarks]
-                
-                # Get tags for all bookmarks
-                bookmark_ids = [b['id'] for b in bookmarks_list]
-                if bookmark_ids:
-                    cur.execute("""
-                        SELECT bt.bookmark_id, t.id, t.name
-                        FROM tags t
-                        JOIN bookmark_tags bt ON t.id = bt.tag_id
-                        WHERE bt.bookmark_id = ANY(%s)
-                    """, (bookmark_ids,))
-                    tags_by_bookmark = {}
-                    for row in cur.fetchall():
-                        if row['bookmark_id'] not in tags_by_bookmark:
-                            tags_by_bookmark[row['bookmark_id']] = []
-                        tags_by_bookmark[row['bookmark_id']].append({
-                            'id': row['id'],
-                            'name': row['name']
-                        })
-                    
-                    # Add tags to each bookmark
-                    for bookmark in bookmarks_list:
-                        bookmark['tags'] = tags_by_bookmark.get(bookmark['id'], [])
-                
-                return bookmarks_list
+        return _list_bookmarks(*_bookmark_filter(collection_id=collection_id))[0]
     except Exception as e:
         print(f"Error getting bookmarks by collection: {e}")
         raise
 
+# HTTP validators come from the change_xid columns of migration 0009: the
+# newest change_xid of each table (bookmark_tags changes touch their
+# bookmarks) and the newest tombstone of its rows, all index lookups. Nothing
+# is written per change, so writers never wait on each other for it.
+VERSIONED_TABLES = {'bookmarks': 'bookmark', 'tags': 'tag', 'collections': 'collection', 'summaries': 'summary'}
+
+def _table_versions_sql(tables):
+    """Select expressions for the validator of `tables`, to read with version_token()"""
+    tables = [t for t in tables if t in VERSIONED_TABLES]
+    newest = ', '.join(f"(SELECT max(change_xid) FROM {t})::text" for t in tables)
+    entities = ', '.join(f"'{VERSIONED_TABLES[t]}'" for t in tables)
+    return f"""
+        ARRAY[{newest}, (SELECT max(deleted_xid) FROM sync_tombstones
+                         WHERE entity IN ({entities}))::text] AS newest_xids,
+        pg_snapshot_xmin(pg_current_snapshot())::text AS snapshot_xmin
+    """
+
+def version_token(newest_xids, snapshot_xmin):
+    """Turn the values selected by _table_versions_sql() into a version token"""
+    xids = [int(xid) if xid else 0 for xid in newest_xids]
+    token = '.'.join(str(xid) for xid in xids)
+    # A transaction older than the newest change may still commit rows that
+    # sort below it; while one runs the token carries the snapshot's xmin, so
+    # its commit (which moves xmin) still changes the token
+    if int(snapshot_xmin) < max(xids, default=0):
+        token += f".{snapshot_xmin}"
+    return token
+
+@timed_query
+def get_table_versions(tables):
+    """Return (version token, last modified) summarizing changes to the given tables.
+
+    Tables carry no cheap modification time, so last modified is always None.
+    """
+    conn = get_db_connection(read_only=True)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT " + _table_versions_sql(tables))
+            return version_token(*cur.fetchone()), None
+    except psycopg2.Error as e:
+        print(f"Error retrieving table versions: {e}")
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def get_bookmark_version(bookmark_id):
+    """Return (version token, last modified) for one bookmark, or None if it does not exist"""
+    conn = get_db_connection(read_only=True)
+    try:
+        with conn.cursor() as cur:
+            # Collection and tag names are part of the hydrated bookmark too
+            cur.execute(f"""
+                SELECT b.change_xid::text, b.updated_at, {_table_versions_sql(('tags', 'collections'))}
+                FROM bookmarks b
+                WHERE b.id = %s
+            """, (bookmark_id,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            change_xid, updated_at, newest_xids, snapshot_xmin = row
+            return f"{change_xid}.{version_token(newest_xids, snapshot_xmin)}", updated_at
+    except psycopg2.Error as e:
+        print(f"Error retrieving bookmark version: {e}")
+        raise
+    finally:
+        release_db_connection(conn)
+
+# Incremental sync: rows carry the id of the transaction that last wrote them
+# (change_xid) and deletions leave sync_tombstones rows; see migration 0009.
+# Each query takes the window's (since, until) bounds as its parameters.
+SYNC_WINDOW = "%(column)s >= %%(since)s::text::xid8 AND %(column)s < %%(until)s::text::xid8"
+SYNC_QUERIES = {
+    'bookmarks': HYDRATED_BOOKMARK_SELECT + " WHERE " + SYNC_WINDOW % {'column': 'b.change_xid'} + " ORDER BY b.id",
+    'collections': "SELECT id, name, created_at, updated_at FROM collections WHERE "
+                   + SYNC_WINDOW % {'column': 'change_xid'} + " ORDER BY id",
+    'tags': "SELECT id, name, created_at, updated_at FROM tags WHERE "
+            + SYNC_WINDOW % {'column': 'change_xid'} + " ORDER BY id",
+    'summaries': "SELECT id, bookmark_id, summary, created_at, updated_at FROM summaries WHERE "
+                 + SYNC_WINDOW % {'column': 'change_xid'} + " ORDER BY id",
+}
+SYNC_TOMBSTONES_QUERY = (
+    "SELECT entity AS type, entity_id AS id, deleted_at FROM sync_tombstones WHERE "
+    + SYNC_WINDOW % {'column': 'deleted_xid'} + " ORDER BY id"
+)
+# Start a read-only transaction whose single snapshot covers every query
+SYNC_SNAPSHOT_QUERIES = (
+    "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY",
+    "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS until",
+)
+
+@timed_query
+def get_changes_since(since=None):
+    """Return what was created, changed or deleted after the sync cursor `since`.
+
+    `since` is the cursor returned by an earlier call, or None for a full
+    sync. Only transactions finished before this call's snapshot are
+    included and the returned cursor is where they end, so a write that
+    commits late is picked up by the next sync instead of being skipped.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            for query in SYNC_SNAPSHOT_QUERIES:
+                cur.execute(query)
+            until = cur.fetchone()['until']
+            window = {'since': since or 0, 'until': until}
+
+            changes = {}
+            for name, query in SYNC_QUERIES.items():
+                cur.execute(query, window)
+                changes[name] = [dict(row) for row in cur.fetchall()]
+            # A full sync has nothing to delete on the client
+            changes['deleted'] = []
+            if since is not None:
+                cur.execute(SYNC_TOMBSTONES_QUERY, window)
+                changes['deleted'] = [dict(row) for row in cur.fetchall()]
+            changes['cursor'] = str(until)
+        conn.commit()
+        return changes
+    except psycopg2.Error as e:
+        print(f"Error retrieving changes: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+# Library export (GET /api/export): one JSON document per bookmark and line,
+# rendered by Postgres. Timestamps keep Postgres' ISO 8601 form with full
+# precision, since exports are read back by programs rather than browsers.
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+EXPORT_QUERY = f"""
+    SELECT json_build_object(
+               'id', b.id,
+               'text', b.text,
+               'title', b.title,
+               'collection_id', b.collection_id,
+               'collection_name', c.name,
+               'tags', {BOOKMARK_TAGS_JSON},
+               'summary', s.summary,
+               'created_at', b.created_at,
+               'updated_at', b.updated_at
+           )::text
+    FROM bookmarks b
+    LEFT JOIN collections c ON b.collection_id = c.id
+    LEFT JOIN LATERAL (
+        SELECT summary, change_xid FROM summaries
+        WHERE bookmark_id = b.id
+        ORDER BY id DESC
+        LIMIT 1
+    ) s ON true
+"""
+# An incremental export holds the bookmarks written, retagged or summarized in
+# the sync window; deletions are only reported by /api/sync
+EXPORT_SINCE_QUERY = (
+    EXPORT_QUERY + " WHERE (" + SYNC_WINDOW % {'column': 'b.change_xid'}
+    + " OR " + SYNC_WINDOW % {'column': 's.change_xid'} + ")"
+)
+
+def export_bookmarks(since=None, batch_size=EXPORT_BATCH_SIZE):
+    """Stream every bookmark (or those changed after the sync cursor `since`) as NDJSON.
+
+    A generator over one read-only snapshot: the first item is the sync
+    cursor the export ends at, to pass as `since` next time, and each later
+    item is the bytes of up to `batch_size` lines. Rows are fetched through
+    a server-side cursor one batch at a time, so memory stays flat however
+    large the library is. The connection is held until the generator is
+    exhausted or closed.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            for query in SYNC_SNAPSHOT_QUERIES:
+                cur.execute(query)
+            until = cur.fetchone()[0]
+        yield str(until)
+
+        with conn.cursor(name='bookmark_export') as cur:
+            # Keep each line as the bytes Postgres sent
+            psycopg2.extensions.register_type(psycopg2.extensions.BYTES, cur)
+            if since is None:
+                cur.execute(EXPORT_QUERY + " ORDER BY b.id")
+            else:
+                cur.execute(EXPORT_SINCE_QUERY + " ORDER BY b.id", {'since': since, 'until': until})
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield b'\n'.join(row[0] for row in rows) + b'\n'
+        conn.commit()
+    except psycopg2.Error as e:
+        print(f"Error exporting bookmarks: {e}")
+        conn.rollback()
+        raise
+    finally:
+        # An export closed early still has its transaction open; the pool rolls it back
+        release_db_connection(conn)
+
+@timed_query
+@records_write
 def save_summary(bookmark_id, summary):
     """Save a summary for a bookmark"""
     conn = get_db_connection()
@@ -428,11 +1049,12 @@ def save_summary(bookmark_id, summary):
         conn.rollback()
         raise
     finally:
-        conn.close()
+        release_db_connection(conn)
 
+@timed_query
 def get_summary(bookmark_id):
     """Retrieve a summary for a bookmark"""
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=True)
     try:
         with conn.cursor(cursor_factory=DictCursor) as cur:
             cur.execute("""
@@ -446,8 +1068,425 @@ def get_summary(bookmark_id):
         print(f"Error retrieving summary: {e}")
         raise
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+@timed_query
+def get_stored_transcripts(video_id):
+    """Retrieve every previously fetched transcript of a video, by language"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT language, transcript FROM transcripts WHERE video_id = %s",
+                (video_id,)
+            )
+            return dict(cur.fetchall())
+    except psycopg2.Error as e:
+        print(f"Error retrieving transcript: {e}")
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def save_transcript(video_id, language, transcript):
+    """Store a fetched transcript, replacing any previous copy"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO transcripts (video_id, language, transcript) VALUES (%s, %s, %s)
+                ON CONFLICT (video_id, language)
+                DO UPDATE SET transcript = EXCLUDED.transcript, created_at = CURRENT_TIMESTAMP
+            """, (video_id, language, transcript))
+        conn.commit()
+    except psycopg2.Error as e:
+        print(f"Error saving transcript: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
 
-# Initialize the database when the module is imported
-if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+@timed_query
+def get_video_summary(video_id, prompt_version, model):
+    """Retrieve a generated summary for a video, prompt version and model, or None"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT summary FROM video_summaries
+                WHERE video_id = %s AND prompt_version = %s AND model = %s
+            """, (video_id, prompt_version, model))
+            row = cur.fetchone()
+            return row[0] if row else None
+    except psycopg2.Error as e:
+        print(f"Error retrieving video summary: {e}")
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def save_video_summary(video_id, prompt_version, model, summary):
+    """Store a generated summary so other bookmarks of the same video can reuse it"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO video_summaries (video_id, prompt_version, model, summary)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (video_id, prompt_version, model)
+                DO UPDATE SET summary = EXCLUDED.summary, created_at = CURRENT_TIMESTAMP
+            """, (video_id, prompt_version, model, summary))
+        conn.commit()
+    except psycopg2.Error as e:
+        print(f"Error saving video summary: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def claim_video_summary(video_id, prompt_version, model, lease):
+    """Claim generating a video's summary for `lease` seconds; return whether we got it"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            # An expired claim belongs to a generator that died; take it over
+            cur.execute("""
+                INSERT INTO video_summary_claims (video_id, prompt_version, model, claimed_until)
+                VALUES (%s, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+                ON CONFLICT (video_id, prompt_version, model) DO UPDATE
+                SET claimed_until = EXCLUDED.claimed_until
+                WHERE video_summary_claims.claimed_until < CURRENT_TIMESTAMP
+                RETURNING 1
+            """, (video_id, prompt_version, model, lease))
+            claimed = cur.fetchone() is not None
+        conn.commit()
+        return claimed
+    except psycopg2.Error as e:
+        print(f"Error claiming video summary: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def release_video_summary(video_id, prompt_version, model):
+    """Give up the claim taken with claim_video_summary()"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM video_summary_claims
+                WHERE video_id = %s AND prompt_version = %s AND model = %s
+            """, (video_id, prompt_version, model))
+        conn.commit()
+    except psycopg2.Error as e:
+        print(f"Error releasing video summary claim: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def save_embedding(bookmark_id, model, vector):
+    """Store a bookmark's embedding as raw float32 bytes"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO embeddings (bookmark_id, model, vector, updated_at)
+                VALUES (%s, %s, %s, clock_timestamp())
+                ON CONFLICT (bookmark_id)
+                DO UPDATE SET model = EXCLUDED.model, vector = EXCLUDED.vector,
+                              updated_at = EXCLUDED.updated_at
+            """, (bookmark_id, model, psycopg2.Binary(vector)))
+        conn.commit()
+    except psycopg2.Error as e:
+        print(f"Error saving embedding: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def get_embeddings_since(model, since=None):
+    """Return (bookmark_id, vector_bytes, updated_at) rows for `model` changed after `since`"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT bookmark_id, vector, updated_at FROM embeddings
+                WHERE model = %s AND (%s::timestamptz IS NULL OR updated_at > %s)
+                ORDER BY updated_at
+            """, (model, since, since))
+            return [(row[0], bytes(row[1]), row[2]) for row in cur.fetchall()]
+    except psycopg2.Error as e:
+        print(f"Error retrieving embeddings: {e}")
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def get_deleted_bookmarks_since(since=None):
+    """Return (bookmark_ids, cursor): bookmarks deleted after the sync cursor `since`.
+
+    As in get_changes_since, `since` None returns no ids, only the cursor to
+    continue from.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            for query in SYNC_SNAPSHOT_QUERIES:
+                cur.execute(query)
+            until = cur.fetchone()[0]
+            bookmark_ids = []
+            if since is not None:
+                cur.execute(
+                    "SELECT entity_id FROM sync_tombstones WHERE entity = 'bookmark' AND "
+                    + SYNC_WINDOW % {'column': 'deleted_xid'},
+                    {'since': since, 'until': until}
+                )
+                bookmark_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        return bookmark_ids, until
+    except psycopg2.Error as e:
+        print(f"Error retrieving deleted bookmarks: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+JOB_COLUMNS = "id, kind, bookmark_id, status, priority, attempts, result, error, created_at, updated_at"
+
+@timed_query
+def enqueue_job(kind, bookmark_id, priority=0):
+    """Queue a job, or return the id of the identical job already queued or running"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            # One statement, so a job finishing between a failed insert and a
+            # follow-up lookup cannot leave us without a row. A queued
+            # prefetch of the same job moves up to this priority.
+            cur.execute("""
+                INSERT INTO jobs (kind, bookmark_id, priority) VALUES (%s, %s, %s)
+                ON CONFLICT (kind, bookmark_id) WHERE status IN ('queued', 'running')
+                DO UPDATE SET priority = GREATEST(jobs.priority, EXCLUDED.priority)
+                RETURNING id
+            """, (kind, bookmark_id, priority))
+            job_id = cur.fetchone()[0]
+        conn.commit()
+        return job_id
+    except psycopg2.Error as e:
+        print(f"Error enqueuing job: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def enqueue_job_batch(kind, bookmark_ids, scope=None, priority=0):
+    """Queue one job per bookmark as a batch and return the batch id.
+
+    Bookmarks that already have an active job of this kind join the batch with
+    that job instead of getting a duplicate.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO job_batches (kind, scope) VALUES (%s, %s) RETURNING id",
+                (kind, scope)
+            )
+            batch_id = cur.fetchone()[0]
+            # As in enqueue_job, one statement: an active job that finishes
+            # meanwhile is replaced by a new one rather than left out
+            cur.execute("""
+                WITH enqueued AS (
+                    INSERT INTO jobs (kind, bookmark_id, priority)
+                    SELECT DISTINCT %s, bookmark_id, %s FROM unnest(%s::integer[]) AS bookmark_id
+                    ON CONFLICT (kind, bookmark_id) WHERE status IN ('queued', 'running')
+                    DO UPDATE SET priority = GREATEST(jobs.priority, EXCLUDED.priority)
+                    RETURNING id
+                )
+                INSERT INTO job_batch_items (batch_id, job_id)
+                SELECT %s, id FROM enqueued
+            """, (kind, priority, list(bookmark_ids), batch_id))
+        conn.commit()
+        return batch_id
+    except psycopg2.Error as e:
+        print(f"Error enqueuing job batch: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def get_job_batch(batch_id):
+    """Retrieve a batch with per-status job counts, or None"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            cur.execute("SELECT * FROM job_batches WHERE id = %s", (batch_id,))
+            batch = cur.fetchone()
+            if not batch:
+                return None
+            cur.execute("""
+                SELECT j.status, count(*) AS count
+                FROM job_batch_items i
+                JOIN jobs j ON j.id = i.job_id
+                WHERE i.batch_id = %s
+                GROUP BY j.status
+            """, (batch_id,))
+            result = dict(batch)
+            result['counts'] = {row['status']: row['count'] for row in cur.fetchall()}
+            return result
+    except psycopg2.Error as e:
+        print(f"Error retrieving job batch: {e}")
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def get_summarized_bookmark_ids(bookmark_ids):
+    """Return the subset of bookmark ids that already have a summary"""
+    if not bookmark_ids:
+        return set()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT DISTINCT bookmark_id FROM summaries WHERE bookmark_id = ANY(%s)",
+                (list(bookmark_ids),)
+            )
+            return {row[0] for row in cur.fetchall()}
+    except psycopg2.Error as e:
+        print(f"Error retrieving summarized bookmarks: {e}")
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def claim_job(kinds=None, priority_above=None):
+    """Atomically claim the next runnable job (optionally of the given kinds, or
+    above a priority), or None"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            cur.execute(f"""
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1,
+                    locked_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE status = 'queued' AND run_after <= CURRENT_TIMESTAMP
+                      AND (%s::text[] IS NULL OR kind = ANY(%s::text[]))
+                      AND (%s::integer IS NULL OR priority > %s)
+                    ORDER BY priority DESC, id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING {JOB_COLUMNS}
+            """, (kinds, kinds, priority_above, priority_above))
+            job = cur.fetchone()
+        conn.commit()
+        return dict(job) if job else None
+    except psycopg2.Error as e:
+        print(f"Error claiming job: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def complete_job(job_id, result=None):
+    """Mark a running job as succeeded with an optional JSON result"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE jobs
+                SET status = 'succeeded', result = %s, error = NULL,
+                    locked_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (Json(result), job_id))
+        conn.commit()
+    except psycopg2.Error as e:
+        print(f"Error completing job: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def fail_job(job_id, error, retry_in=None):
+    """Record a job failure; requeue it after `retry_in` seconds if given, else fail it"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            if retry_in is None:
+                cur.execute("""
+                    UPDATE jobs
+                    SET status = 'failed', error = %s,
+                        locked_at = NULL, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """, (error, job_id))
+            else:
+                cur.execute("""
+                    UPDATE jobs
+                    SET status = 'queued', error = %s, locked_at = NULL,
+                        run_after = CURRENT_TIMESTAMP + %s * INTERVAL '1 second',
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """, (error, retry_in, job_id))
+        conn.commit()
+    except psycopg2.Error as e:
+        print(f"Error failing job: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def requeue_stale_jobs(stale_after, max_attempts):
+    """Requeue jobs left running longer than `stale_after` seconds (e.g. by a killed worker)
+
+    Jobs that already used `max_attempts` attempts are failed instead.
+    Returns (requeued, failed).
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE jobs
+                SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                    error = CASE WHEN attempts >= %s THEN 'Worker stopped before finishing the last attempt'
+                                 ELSE error END,
+                    locked_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'running'
+                  AND locked_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                RETURNING status
+            """, (max_attempts, max_attempts, stale_after))
+            statuses = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        return statuses.count('queued'), statuses.count('failed')
+    except psycopg2.Error as e:
+        print(f"Error requeuing stale jobs: {e}")
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+@timed_query
+def get_job(job_id):
+    """Retrieve a job's state"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            cur.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = %s", (job_id,))
+            job = cur.fetchone()
+            return dict(job) if job else None
+    except psycopg2.Error as e:
+        print(f"Error retrieving job: {e}")
+        raise
+    finally:
+        release_db_connection(conn)
@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PoolTimeout(PoolError):
+    """Raised when no connection could be checked out before the timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe PostgreSQL connection pool with health checks and stats"""
+
+    def __init__(self, connect_kwargs, min_size=1, max_size=10, timeout=5.0,
+                 healthcheck_interval=30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: min=%s max=%s" % (min_size, max_size))
+        self.connect_kwargs = dict(connect_kwargs)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, returned_at)
+        self._in_use = set()
+        self._size = 0  # open connections plus connections being opened
+        self._closed = False
+        self._pid = os.getpid()
+
+        self._checkouts = 0
+        self._checkout_failures = 0
+        self._waits = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._reconnects = 0
+        self._discarded = 0
+
+        for _ in range(min_size):
+            conn = self._connect()
+            self._size += 1
+            self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs)
+
+    def _reset_after_fork(self):
+        # Connections inherited from a parent process must never be reused
+        # (e.g. gunicorn --preload); start over with an empty pool.
+        self._idle.clear()
+        self._in_use.clear()
+        self._size = 0
+        self._pid = os.getpid()
+
+    def getconn(self, timeout=None):
+        """Check out a connection, waiting up to `timeout` seconds for one to free up"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset_after_fork()
+            while True:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    conn, returned_at = None, None
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._checkout_failures += 1
+                    raise PoolTimeout(
+                        "no database connection available after %.1fs "
+                        "(pool size %d)" % (timeout, self.max_size)
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif not self._is_healthy(conn, returned_at):
+                self._close_quietly(conn)
+                conn = self._connect()
+                with self._cond:
+                    self._reconnects += 1
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._checkout_failures += 1
+                self._cond.notify()
+            raise
+
+        wait = time.monotonic() - start
+        with self._cond:
+            self._in_use.add(id(conn))
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, closing it if it is broken or `discard` is set"""
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._cond:
+            if id(conn) not in self._in_use:
+                # Not ours (or checked out before a fork); just close it.
+                self._close_quietly(conn)
+                return
+            self._in_use.discard(id(conn))
+            if discard or conn.closed or self._closed:
+                self._close_quietly(conn)
+                self._size -= 1
+                self._discarded += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that checks out a connection and always returns it"""
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def _is_healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - returned_at < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._close_quietly(conn)
+                self._size -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        """Return a snapshot of pool usage counters"""
+        with self._cond:
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'checkout_failures': self._checkout_failures,
+                'waits': self._waits,
+                'total_wait_ms': round(self._total_wait * 1000, 3),
+                'max_wait_ms': round(self._max_wait * 1000, 3),
+                'reconnects': self._reconnects,
+                'discarded': self._discarded,
+            }
@@ -0,0 +1,371 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from database_postgres import save_embedding, get_embeddings_since, get_deleted_bookmarks_since
+
+# Embedding configuration
+EMBEDDING_CONFIG = {
+    'backend': os.getenv('EMBEDDING_BACKEND', 'openai'),  # 'openai' or 'local'
+    'openai_model': os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small'),
+    'local_dim': int(os.getenv('EMBEDDING_LOCAL_DIM', '384')),
+    'index_dir': os.getenv('EMBEDDING_INDEX_DIR', 'embedding_index'),
+    'refresh_interval': float(os.getenv('EMBEDDING_REFRESH_INTERVAL', '5')),
+}
+
+# Rows committed slightly out of updated_at order are picked up by re-reading
+# this much history on every refresh (re-applying a row is harmless)
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+
+class HashingEmbedder:
+    """Deterministic offline embedder: signed feature hashing of words and bigrams"""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self.model = f'local-hash-{dim}'
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = re.findall(r'\w+', text.lower())
+            for feature in words + [a + ' ' + b for a, b in zip(words, words[1:])]:
+                h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'little')
+                vectors[row, h % self.dim] += 1.0 if h >> 63 else -1.0
+        return _normalize(vectors)
+
+
+class OpenAIEmbedder:
+    """Embeddings from the OpenAI embeddings API"""
+
+    def __init__(self, model='text-embedding-3-small'):
+        self.model = model
+
+    def embed(self, texts):
+        # Through openai_upstream, like the summaries: embedding calls share
+        # their rate limits, retries and circuit breaker. Imported here so the
+        # local backend needs no OpenAI client
+        from youtube import openai_client, openai_upstream, estimate_tokens, _attempt_timeout
+        texts = list(texts)
+        cost = sum(estimate_tokens(text) for text in texts)
+        response = openai_upstream.call(
+            lambda timeout: openai_client.embeddings.create(
+                model=self.model, input=texts, timeout=_attempt_timeout(timeout)
+            ),
+            tokens=cost
+        )
+        usage = getattr(response, 'usage', None)
+        openai_upstream.record_usage(cost, getattr(usage, 'total_tokens', None))
+        vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+        return _normalize(vectors)
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+# Snapshot rows copied per step when save() writes the vectors file
+SAVE_CHUNK_ROWS = 65536
+
+
+class EmbeddingIndex:
+    """In-memory matrix of unit vectors answering top-k cosine queries in one pass
+
+    A loaded snapshot stays a read-only memory map (the base); vectors added
+    or replaced later go to a separate in-RAM append buffer, and search scores
+    both. Replacing a base vector hides its base row rather than writing to it.
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+        self._base_ids = np.empty(0, dtype=np.int64)
+        self._base = np.empty((0, dim), dtype=np.float32)
+        self._base_live = None  # bool per base row once one is replaced, else None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._count = 0
+        self._rows = {}  # bookmark id -> row, base rows first, then the append buffer
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _reserve(self, extra):
+        # Grow the append buffer geometrically
+        needed = self._count + extra
+        if needed <= len(self._ids):
+            return
+        capacity = max(needed, 2 * len(self._ids), 1024)
+        ids = np.empty(capacity, dtype=np.int64)
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        ids[:self._count] = self._ids[:self._count]
+        matrix[:self._count] = self._matrix[:self._count]
+        self._ids, self._matrix = ids, matrix
+
+    def upsert(self, ids, vectors):
+        """Insert or replace the vectors for `ids` (vectors must be unit length)"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        with self._lock:
+            self._reserve(len(ids))
+            base_count = len(self._base_ids)
+            for bookmark_id, vector in zip(ids, vectors):
+                row = self._rows.get(bookmark_id)
+                if row is None or row < base_count:
+                    if row is not None:
+                        self._hide_base_row(row)
+                    row = self._rows[bookmark_id] = base_count + self._count
+                    self._ids[self._count] = bookmark_id
+                    self._count += 1
+                self._matrix[row - base_count] = vector
+
+    def remove(self, ids):
+        """Drop the vectors for `ids`; ids not in the index are ignored"""
+        with self._lock:
+            base_count = len(self._base_ids)
+            for bookmark_id in ids:
+                row = self._rows.pop(bookmark_id, None)
+                if row is None:
+                    continue
+                if row < base_count:
+                    self._hide_base_row(row)
+                    continue
+                # Move the last appended vector into the freed row
+                row -= base_count
+                last = self._count - 1
+                if row != last:
+                    moved = int(self._ids[last])
+                    self._ids[row] = moved
+                    self._matrix[row] = self._matrix[last]
+                    self._rows[moved] = base_count + row
+                self._count = last
+
+    def _hide_base_row(self, row):
+        # The base is read-only, so a replaced or removed row is masked instead
+        if self._base_live is None:
+            self._base_live = np.ones(len(self._base_ids), dtype=bool)
+        self._base_live[row] = False
+
+    def get(self, bookmark_id):
+        """Return the stored vector for a bookmark, or None"""
+        with self._lock:
+            row = self._rows.get(bookmark_id)
+            if row is None:
+                return None
+            base_count = len(self._base_ids)
+            if row < base_count:
+                return np.array(self._base[row])
+            return np.array(self._matrix[row - base_count])
+
+    def search(self, query, k=10, exclude=()):
+        """Return up to k (bookmark_id, cosine score) pairs, best first"""
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            if not self._rows:
+                return []
+            base_ids, ids = self._base_ids, self._ids[:self._count]
+            scores = np.concatenate([self._base @ query, self._matrix[:self._count] @ query])
+            if self._base_live is not None:
+                scores[:len(base_ids)][~self._base_live] = -np.inf
+            for bookmark_id in exclude:
+                row = self._rows.get(bookmark_id)
+                if row is not None:
+                    scores[row] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (int(base_ids[i] if i < len(base_ids) else ids[i - len(base_ids)]), float(scores[i]))
+            for i in top if np.isfinite(scores[i])
+        ]
+
+    def save(self, directory, meta):
+        """Write a snapshot that load() can memory-map; meta.json is replaced last
+
+        The snapshot then becomes this index's base, emptying the append buffer.
+        """
+        os.makedirs(directory, exist_ok=True)
+        generation = str(time.time_ns())
+        ids_path = os.path.join(directory, f'ids-{generation}.npy')
+        vectors_path = os.path.join(directory, f'vectors-{generation}.npy')
+        with self._lock:
+            base_rows = np.arange(len(self._base_ids)) if self._base_live is None \
+                else np.flatnonzero(self._base_live)
+            ids = np.concatenate([self._base_ids[base_rows], self._ids[:self._count]])
+            np.save(ids_path, ids)
+            # Written through a memory map, a chunk at a time, so a large base is
+            # never read into RAM whole
+            vectors = np.lib.format.open_memmap(
+                vectors_path, mode='w+', dtype=np.float32, shape=(len(ids), self.dim)
+            )
+            for start in range(0, len(base_rows), SAVE_CHUNK_ROWS):
+                chunk = base_rows[start:start + SAVE_CHUNK_ROWS]
+                vectors[start:start + len(chunk)] = self._base[chunk]
+            vectors[len(base_rows):] = self._matrix[:self._count]
+            vectors.flush()
+            del vectors
+            self._set_base(ids, np.load(vectors_path, mmap_mode='r'))
+        meta = dict(meta, dim=self.dim, generation=generation)
+        tmp = os.path.join(directory, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(directory, 'meta.json'))
+        for name in os.listdir(directory):
+            if name.endswith('.npy') and generation not in name:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def _set_base(self, ids, matrix):
+        # Make (ids, matrix) the base and empty the append buffer
+        self._base_ids, self._base, self._base_live = ids, matrix, None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._matrix = np.empty((0, self.dim), dtype=np.float32)
+        self._count = 0
+        self._rows = {int(bookmark_id): row for row, bookmark_id in enumerate(ids)}
+
+    @classmethod
+    def load(cls, directory):
+        """Memory-map a snapshot written by save(); returns (index, meta) or (None, None)"""
+        try:
+            with open(os.path.join(directory, 'meta.json')) as f:
+                meta = json.load(f)
+            generation = meta['generation']
+            ids = np.load(os.path.join(directory, f'ids-{generation}.npy'))
+            matrix = np.load(os.path.join(directory, f'vectors-{generation}.npy'), mmap_mode='r')
+        except (OSError, ValueError, KeyError):
+            return None, None
+        index = cls(meta['dim'])
+        index._set_base(ids, matrix)
+        return index, meta
+
+
+_embedder = None
+_index = None
+_synced_at = None
+_deleted_until = None  # sync cursor (see get_changes_since) of the last deletion applied
+_last_refresh = 0.0
+_state_lock = threading.Lock()
+
+
+def get_embedder():
+    """Return the configured embedding backend"""
+    global _embedder
+    if _embedder is None:
+        if EMBEDDING_CONFIG['backend'] == 'local':
+            _embedder = HashingEmbedder(EMBEDDING_CONFIG['local_dim'])
+        else:
+            _embedder = OpenAIEmbedder(EMBEDDING_CONFIG['openai_model'])
+    return _embedder
+
+
+def _catch_up(index, model, since):
+    # Apply embeddings written (by any process) since the last sync
+    rows = get_embeddings_since(model, since - REFRESH_OVERLAP if since else None)
+    if rows:
+        index.upsert(
+            [row[0] for row in rows],
+            np.frombuffer(b''.join(row[1] for row in rows), dtype=np.float32)
+        )
+        return rows[-1][2]
+    return since
+
+
+def _catch_up_deletions(index, since):
+    # Drop bookmarks deleted (by any process) since the last sync. Runs before
+    # _catch_up: a deletion past the returned cursor is applied next time, and
+    # one before it has already removed its embedding row
+    bookmark_ids, until = get_deleted_bookmarks_since(since)
+    index.remove(bookmark_ids)
+    return until
+
+
+def get_index():
+    """Return the process-wide index: memory-mapped snapshot plus newer rows from the DB"""
+    global _index, _synced_at, _deleted_until, _last_refresh
+    with _state_lock:
+        model = get_embedder().model
+        if _index is None:
+            index, meta = EmbeddingIndex.load(EMBEDDING_CONFIG['index_dir'])
+            since = deleted_since = None
+            if index is not None and meta.get('model') == model:
+                since = meta.get('synced_at') and datetime.fromisoformat(meta['synced_at'])
+                # Snapshots from before deletions were tracked replay them all
+                deleted_since = meta.get('deleted_until', 0)
+            else:
+                index = None
+            _index = index or EmbeddingIndex(_embedding_dim())
+            _deleted_until = _catch_up_deletions(_index, deleted_since)
+            _synced_at = _catch_up(_index, model, since)
+            _last_refresh = time.monotonic()
+        elif time.monotonic() - _last_refresh >= EMBEDDING_CONFIG['refresh_interval']:
+            _deleted_until = _catch_up_deletions(_index, _deleted_until)
+            _synced_at = _catch_up(_index, model, _synced_at)
+            _last_refresh = time.monotonic()
+        return _index
+
+
+def warm_index():
+    """Load the index in the background, so the first query does not wait for it"""
+    def load():
+        try:
+            get_index()
+        except Exception as e:
+            print(f"Could not load the embedding index: {e}", file=sys.stderr)
+    threading.Thread(target=load, name='embedding-index-warmup', daemon=True).start()
+
+
+def _embedding_dim():
+    embedder = get_embedder()
+    if isinstance(embedder, HashingEmbedder):
+        return embedder.dim
+    return embedder.embed(['dimension probe']).shape[1]
+
+
+def index_summary(bookmark_id, summary):
+    """Embed a bookmark's summary, store it and add it to the in-process index"""
+    embedder = get_embedder()
+    vector = embedder.embed([summary])[0]
+    save_embedding(bookmark_id, embedder.model, vector.tobytes())
+    if _index is not None:
+        _index.upsert([bookmark_id], vector[None, :])
+
+
+def similar_bookmarks(bookmark_id, k=10):
+    """Return (bookmark_id, score) pairs most similar to a bookmark, or None if it has no embedding"""
+    index = get_index()
+    vector = index.get(bookmark_id)
+    if vector is None:
+        return None
+    return index.search(vector, k, exclude=(bookmark_id,))
+
+
+def semantic_search(query, k=10):
+    """Return (bookmark_id, score) pairs for the summaries closest to a natural-language query"""
+    vector = get_embedder().embed([query])[0]
+    return get_index().search(vector, k)
+
+
+def save_snapshot():
+    """Write the current index to EMBEDDING_INDEX_DIR for fast startup"""
+    index = get_index()
+    index.save(EMBEDDING_CONFIG['index_dir'], {
+        'model': get_embedder().model,
+        'synced_at': _synced_at.isoformat() if _synced_at else None,
+        'deleted_until': _deleted_until,
+    })
+
+
+if __name__ == '__main__':
+    # Refresh the on-disk snapshot: python embeddings.py
+    save_snapshot()
+    print(f"Saved {len(get_index())} embeddings to {EMBEDDING_CONFIG['index_dir']}", file=sys.stderr)
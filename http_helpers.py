@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import zlib
+from youtube import get_video_id
+
+# Request parsing and response building shared by app.py (Flask) and
+# app_async.py (Quart). Both request objects are werkzeug-based, so these
+# take request.args / the request itself and stay framework-agnostic.
+
+# Pagination limits for list endpoints
+DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '500'))
+
+# Fetch the transcript of a newly saved YouTube bookmark in the background, so
+# a later summary request skips the download. PREFETCH_SUMMARIES=1 goes further
+# and summarizes it too, which spends OpenAI quota on videos nobody may open.
+PREFETCH_TRANSCRIPTS = os.getenv('PREFETCH_TRANSCRIPTS', '1') == '1'
+PREFETCH_SUMMARIES = os.getenv('PREFETCH_SUMMARIES', '0') == '1'
+
+# gzip level for /api/export when the client accepts it. Level 1 compresses
+# NDJSON exports to about a sixth at a quarter of level 6's CPU time
+EXPORT_GZIP_LEVEL = int(os.getenv('EXPORT_GZIP_LEVEL', '1'))
+
+# Tables whose contents appear in hydrated bookmark listings
+BOOKMARK_LIST_TABLES = ('bookmarks', 'bookmark_tags', 'tags', 'collections')
+
+def parse_limit(args, default=10):
+    """Read a positive ?limit= capped at MAX_PAGE_SIZE"""
+    try:
+        limit = int(args.get('limit', default))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
+
+def parse_page_args(args):
+    """Return (limit, cursor) when the request asks for a page, otherwise None"""
+    if 'limit' not in args and 'cursor' not in args:
+        return None
+    return parse_limit(args, DEFAULT_PAGE_SIZE), args.get('cursor') or None
+
+def parse_sync_cursor(args):
+    """Read ?since= as a cursor from /api/sync or /api/export, or None when absent"""
+    since = args.get('since') or None
+    if since is None:
+        return None
+    if not since.isdigit():
+        raise ValueError('since must be a cursor returned by /api/sync or /api/export')
+    return int(since)
+
+def prefetch_job_kind(text):
+    """The job to queue for a newly saved bookmark, or None when there is nothing to prefetch"""
+    if not (PREFETCH_TRANSCRIPTS or PREFETCH_SUMMARIES) or not get_video_id(text):
+        return None
+    return 'summary' if PREFETCH_SUMMARIES else 'transcript'
+
+def conditional_etag(token, request):
+    """Return (etag, fresh): the weak ETag for `token` and whether the client already has it"""
+    etag = hashlib.sha1(f"{token}:{request.full_path}".encode()).hexdigest()
+    # Only the ETag decides: HTTP dates have one-second resolution, so a write
+    # in the same second as the client's copy would look unmodified
+    return etag, request.if_none_match.contains_weak(etag)
+
+def set_validators(response, etag, last_modified):
+    """Mark `response` as revalidate-every-time with its ETag and Last-Modified"""
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def export_headers(cursor, use_gzip):
+    """Headers for an /api/export response starting at sync cursor `cursor`"""
+    headers = {
+        'Content-Disposition': 'attachment; filename="scrollwise-export.ndjson"',
+        'X-Sync-Cursor': cursor,  # pass as ?since= for the next incremental export
+        'Cache-Control': 'no-store',
+        'Vary': 'Accept-Encoding',
+        'X-Accel-Buffering': 'no'
+    }
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+    return headers
+
+class ExportEncoder:
+    """Encode /api/export batches for the wire, gzipped when the client accepts it"""
+
+    def __init__(self, use_gzip):
+        self.compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if use_gzip else None
+
+    def encode(self, batch):
+        if self.compressor is None:
+            return batch
+        # Flush each batch so the client receives it now
+        return self.compressor.compress(batch) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        """The bytes that end the stream (the gzip trailer), possibly empty"""
+        return self.compressor.flush() if self.compressor is not None else b''
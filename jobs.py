@@ -0,0 +1,205 @@
+import os
+import sys
+import threading
+import time
+import traceback
+
+from database_postgres import (
+    get_bookmark, save_summary, get_summary, enqueue_job, claim_job, complete_job,
+    fail_job, requeue_stale_jobs
+)
+from youtube import get_video_id, summarize_video, fetch_transcript, TranscriptError
+from embeddings import index_summary
+
+# Worker configuration
+JOB_CONFIG = {
+    'workers': int(os.getenv('JOB_WORKERS', '2')),
+    'poll_interval': float(os.getenv('JOB_POLL_INTERVAL', '1')),
+    'max_attempts': int(os.getenv('JOB_MAX_ATTEMPTS', '3')),
+    'retry_backoff': float(os.getenv('JOB_RETRY_BACKOFF', '10')),
+    'stale_after': float(os.getenv('JOB_STALE_AFTER', '600')),
+    # Workers per pool that may run prefetch jobs at once; the rest stay free
+    # for work someone is waiting on
+    'prefetch_concurrency': int(os.getenv('JOB_PREFETCH_CONCURRENCY', '1'))
+}
+
+# Prefetch jobs (see app.schedule_prefetch) queue behind everything else,
+# including batch summaries at -10
+PREFETCH_PRIORITY = -20
+
+
+class JobError(Exception):
+    """A permanent job failure that should not be retried"""
+
+
+def run_summary_job(job):
+    """Summarize a bookmark's video (reusing an existing summary of it) and save it"""
+    bookmark = get_bookmark(job['bookmark_id'])
+    if not bookmark:
+        raise JobError('Bookmark not found')
+
+    text = bookmark['text']
+    if not get_video_id(text):
+        raise JobError('Invalid YouTube URL')
+
+    try:
+        # Workers may wait longer for summary budget than requests, but not
+        # so long that the janitor takes the job for stale
+        summary = summarize_video(text, rate_timeout=JOB_CONFIG['stale_after'] / 2)
+    except TranscriptError as e:
+        raise JobError(str(e))
+
+    summary_id = save_summary(job['bookmark_id'], summary)
+    enqueue_job('embedding', job['bookmark_id'])
+    return {'summary_id': summary_id, 'summary': summary}
+
+
+def run_transcript_job(job):
+    """Fetch and store a bookmark's transcript ahead of its summary"""
+    bookmark = get_bookmark(job['bookmark_id'])
+    if not bookmark:
+        raise JobError('Bookmark not found')
+
+    video_id = get_video_id(bookmark['text'])
+    if not video_id:
+        raise JobError('Invalid YouTube URL')
+
+    # Lands in the transcripts table, where the summary will find it
+    transcript = fetch_transcript(bookmark['text'])
+    if transcript.startswith("An error occurred"):
+        raise JobError(transcript)
+    return {'video_id': video_id, 'characters': len(transcript)}
+
+
+def run_embedding_job(job):
+    """Embed a bookmark's summary for semantic search"""
+    summary = get_summary(job['bookmark_id'])
+    if summary is None:
+        raise JobError('Summary not found')
+    index_summary(job['bookmark_id'], summary)
+    return {'bookmark_id': job['bookmark_id']}
+
+
+# Job kind -> handler; a handler returns a JSON-serializable result
+JOB_HANDLERS = {
+    'summary': run_summary_job,
+    'embedding': run_embedding_job,
+    'transcript': run_transcript_job,
+}
+
+
+class WorkerPool:
+    """Background threads that claim jobs from the Postgres queue and run them"""
+
+    def __init__(self, workers=None, poll_interval=None, max_attempts=None,
+                 retry_backoff=None, stale_after=None, handlers=None, prefetch_concurrency=None):
+        self.workers = JOB_CONFIG['workers'] if workers is None else workers
+        if prefetch_concurrency is None:
+            prefetch_concurrency = JOB_CONFIG['prefetch_concurrency']
+        self._prefetch_slots = threading.BoundedSemaphore(prefetch_concurrency) if prefetch_concurrency > 0 else None
+        self.poll_interval = JOB_CONFIG['poll_interval'] if poll_interval is None else poll_interval
+        self.max_attempts = JOB_CONFIG['max_attempts'] if max_attempts is None else max_attempts
+        self.retry_backoff = JOB_CONFIG['retry_backoff'] if retry_backoff is None else retry_backoff
+        self.stale_after = JOB_CONFIG['stale_after'] if stale_after is None else stale_after
+        self.handlers = handlers or JOB_HANDLERS
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads and the stale-job janitor"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        janitor = threading.Thread(target=self._janitor, name='job-janitor', daemon=True)
+        janitor.start()
+        self._threads.append(janitor)
+
+    def stop(self, timeout=None):
+        """Ask the workers to exit after their current job and wait for them"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Wake idle workers because a job was just enqueued"""
+        self._wakeup.set()
+
+    def _work(self):
+        kinds = list(self.handlers)
+        while not self._stop.is_set():
+            # Without a free prefetch slot, only claim jobs above prefetch priority
+            prefetch_slot = self._prefetch_slots is not None and self._prefetch_slots.acquire(blocking=False)
+            try:
+                try:
+                    job = claim_job(kinds, None if prefetch_slot else PREFETCH_PRIORITY)
+                except Exception:
+                    print("ERROR claiming job:", file=sys.stderr)
+                    print(traceback.format_exc(), file=sys.stderr)
+                    self._stop.wait(self.poll_interval)
+                    continue
+
+                if job is None:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+                if prefetch_slot and job['priority'] > PREFETCH_PRIORITY:
+                    self._prefetch_slots.release()
+                    prefetch_slot = False
+                try:
+                    self._run(job)
+                except Exception:
+                    # Recording the outcome failed; the janitor will requeue the job
+                    print(f"ERROR finishing job {job['id']}:", file=sys.stderr)
+                    print(traceback.format_exc(), file=sys.stderr)
+            finally:
+                if prefetch_slot:
+                    self._prefetch_slots.release()
+
+    def _run(self, job):
+        try:
+            result = self.handlers[job['kind']](job)
+        except JobError as e:
+            fail_job(job['id'], str(e))
+        except Exception as e:
+            print(f"ERROR in job {job['id']} ({job['kind']}):", file=sys.stderr)
+            print(traceback.format_exc(), file=sys.stderr)
+            if job['attempts'] < self.max_attempts:
+                retry_in = self.retry_backoff * 2 ** (job['attempts'] - 1)
+                # Not before the upstream asked us to (Retry-After, open circuit breaker)
+                retry_in = max(retry_in, getattr(e, 'retry_after', None) or 0)
+                fail_job(job['id'], str(e), retry_in=retry_in)
+            else:
+                fail_job(job['id'], str(e))
+        else:
+            complete_job(job['id'], result)
+
+    def _janitor(self):
+        while not self._stop.is_set():
+            try:
+                requeued, failed = requeue_stale_jobs(self.stale_after, self.max_attempts)
+                if failed:
+                    print(f"Failed {failed} stale job(s) with no attempts left", file=sys.stderr)
+                if requeued:
+                    print(f"Requeued {requeued} stale job(s)", file=sys.stderr)
+                    self.notify()
+            except Exception:
+                print("ERROR requeuing stale jobs:", file=sys.stderr)
+                print(traceback.format_exc(), file=sys.stderr)
+            self._stop.wait(min(self.stale_after, 60))
+
+
+if __name__ == '__main__':
+    # Run workers in their own process: python jobs.py
+    pool = WorkerPool()
+    pool.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop()
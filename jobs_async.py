@@ -0,0 +1,188 @@
+import asyncio
+import sys
+import traceback
+
+from database_async import (
+    get_bookmark, save_summary, get_summary, enqueue_job, claim_job, complete_job,
+    fail_job, requeue_stale_jobs
+)
+from youtube import get_video_id, TranscriptError
+from youtube_async import summarize_video, fetch_transcript
+from embeddings import index_summary
+from jobs import JOB_CONFIG, JobError, PREFETCH_PRIORITY
+
+
+async def run_summary_job(job):
+    """Summarize a bookmark's video (reusing an existing summary of it) and save it"""
+    bookmark = await get_bookmark(job['bookmark_id'])
+    if not bookmark:
+        raise JobError('Bookmark not found')
+
+    text = bookmark['text']
+    if not get_video_id(text):
+        raise JobError('Invalid YouTube URL')
+
+    try:
+        # Workers may wait longer for summary budget than requests, but not
+        # so long that the janitor takes the job for stale
+        summary = await summarize_video(text, rate_timeout=JOB_CONFIG['stale_after'] / 2)
+    except TranscriptError as e:
+        raise JobError(str(e))
+
+    summary_id = await save_summary(job['bookmark_id'], summary)
+    await enqueue_job('embedding', job['bookmark_id'])
+    return {'summary_id': summary_id, 'summary': summary}
+
+
+async def run_transcript_job(job):
+    """Fetch and store a bookmark's transcript ahead of its summary"""
+    bookmark = await get_bookmark(job['bookmark_id'])
+    if not bookmark:
+        raise JobError('Bookmark not found')
+
+    video_id = get_video_id(bookmark['text'])
+    if not video_id:
+        raise JobError('Invalid YouTube URL')
+
+    transcript = await fetch_transcript(bookmark['text'])
+    if transcript.startswith("An error occurred"):
+        raise JobError(transcript)
+    return {'video_id': video_id, 'characters': len(transcript)}
+
+
+async def run_embedding_job(job):
+    """Embed a bookmark's summary for semantic search"""
+    summary = await get_summary(job['bookmark_id'])
+    if summary is None:
+        raise JobError('Summary not found')
+    # Embedding and the in-process index are synchronous (numpy / OpenAI embeddings)
+    await asyncio.to_thread(index_summary, job['bookmark_id'], summary)
+    return {'bookmark_id': job['bookmark_id']}
+
+
+JOB_HANDLERS = {
+    'summary': run_summary_job,
+    'embedding': run_embedding_job,
+    'transcript': run_transcript_job,
+}
+
+
+class AsyncWorkerPool:
+    """jobs.WorkerPool for the event loop: worker tasks instead of threads.
+
+    Jobs mostly wait on YouTube and OpenAI, so `workers` can be set far higher
+    than the thread pool's without costing a thread each.
+    """
+
+    def __init__(self, workers=None, poll_interval=None, max_attempts=None,
+                 retry_backoff=None, stale_after=None, handlers=None, prefetch_concurrency=None):
+        self.workers = JOB_CONFIG['workers'] if workers is None else workers
+        self.prefetch_concurrency = (
+            JOB_CONFIG['prefetch_concurrency'] if prefetch_concurrency is None else prefetch_concurrency
+        )
+        self._prefetch_running = 0
+        self.poll_interval = JOB_CONFIG['poll_interval'] if poll_interval is None else poll_interval
+        self.max_attempts = JOB_CONFIG['max_attempts'] if max_attempts is None else max_attempts
+        self.retry_backoff = JOB_CONFIG['retry_backoff'] if retry_backoff is None else retry_backoff
+        self.stale_after = JOB_CONFIG['stale_after'] if stale_after is None else stale_after
+        self.handlers = handlers or JOB_HANDLERS
+        self._wakeup = None
+        self._stop = None
+        self._tasks = []
+
+    def start(self):
+        """Start the worker tasks and the stale-job janitor on the running loop"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._stop = asyncio.Event()
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._work(), name=f'job-worker-{i}'))
+        self._tasks.append(asyncio.create_task(self._janitor(), name='job-janitor'))
+
+    async def stop(self, timeout=None):
+        """Ask the workers to exit after their current job and wait for them"""
+        if not self._tasks:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle workers because a job was just enqueued"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _sleep(self, event, seconds):
+        try:
+            await asyncio.wait_for(event.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _work(self):
+        kinds = list(self.handlers)
+        while not self._stop.is_set():
+            # Without a free prefetch slot, only claim jobs above prefetch priority
+            prefetch_slot = self._prefetch_running < self.prefetch_concurrency
+            if prefetch_slot:
+                self._prefetch_running += 1
+            try:
+                try:
+                    job = await claim_job(kinds, None if prefetch_slot else PREFETCH_PRIORITY)
+                except Exception:
+                    print("ERROR claiming job:", file=sys.stderr)
+                    print(traceback.format_exc(), file=sys.stderr)
+                    await self._sleep(self._stop, self.poll_interval)
+                    continue
+
+                if job is None:
+                    await self._sleep(self._wakeup, self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+                if prefetch_slot and job['priority'] > PREFETCH_PRIORITY:
+                    self._prefetch_running -= 1
+                    prefetch_slot = False
+                try:
+                    await self._run(job)
+                except Exception:
+                    # Recording the outcome failed; the janitor will requeue the job
+                    print(f"ERROR finishing job {job['id']}:", file=sys.stderr)
+                    print(traceback.format_exc(), file=sys.stderr)
+            finally:
+                if prefetch_slot:
+                    self._prefetch_running -= 1
+
+    async def _run(self, job):
+        try:
+            result = await self.handlers[job['kind']](job)
+        except JobError as e:
+            await fail_job(job['id'], str(e))
+        except Exception as e:
+            print(f"ERROR in job {job['id']} ({job['kind']}):", file=sys.stderr)
+            print(traceback.format_exc(), file=sys.stderr)
+            if job['attempts'] < self.max_attempts:
+                retry_in = self.retry_backoff * 2 ** (job['attempts'] - 1)
+                # Not before the upstream asked us to (Retry-After, open circuit breaker)
+                retry_in = max(retry_in, getattr(e, 'retry_after', None) or 0)
+                await fail_job(job['id'], str(e), retry_in=retry_in)
+            else:
+                await fail_job(job['id'], str(e))
+        else:
+            await complete_job(job['id'], result)
+
+    async def _janitor(self):
+        while not self._stop.is_set():
+            try:
+                requeued, failed = await requeue_stale_jobs(self.stale_after, self.max_attempts)
+                if failed:
+                    print(f"Failed {failed} stale job(s) with no attempts left", file=sys.stderr)
+                if requeued:
+                    print(f"Requeued {requeued} stale job(s)", file=sys.stderr)
+                    self.notify()
+            except Exception:
+                print("ERROR requeuing stale jobs:", file=sys.stderr)
+                print(traceback.format_exc(), file=sys.stderr)
+            await self._sleep(self._stop, min(self.stale_after, 60))
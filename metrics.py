@@ -0,0 +1,275 @@
+import asyncio
+import bisect
+import functools
+import threading
+import time
+
+# Minimal in-process Prometheus metrics: counters and histograms with labels,
+# rendered in the text exposition format by render(). Each metric child holds
+# its own lock, so recording costs a dict lookup, a bisect and an addition.
+#
+# Values are per process; with several worker processes, scrape each one (or
+# run a single process) to see all of them.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def labels(self, *values):
+        """Return the child for these label values (in labelnames order)"""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    if len(values) != len(self.labelnames):
+                        raise ValueError(f"{self.name} expects labels {self.labelnames}")
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        # Copy under the lock: labels() may add a child while we render
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, e.g. requests or errors"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child._value)}']
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+
+    def set(self, value):
+        self._value = float(value)
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, e.g. replica lag"""
+
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def _render_child(self, values, child):
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child._value)}']
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (seconds, tokens, ...) in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts, total = list(child._counts), child._sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = 'le="%s"' % _format_value(float(bound))
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}')
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+def render():
+    """Return every registered metric in the Prometheus text format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# Metrics shared by the app, the DB layer and the upstream clients
+
+http_request_duration = Histogram(
+    'scrollwise_http_request_duration_seconds', 'Time spent handling HTTP requests',
+    ('method', 'route')
+)
+http_requests = Counter(
+    'scrollwise_http_requests_total', 'HTTP requests by response status',
+    ('method', 'route', 'status')
+)
+db_query_duration = Histogram(
+    'scrollwise_db_query_duration_seconds', 'Time spent in named database calls (including pool checkout)',
+    ('query',)
+)
+db_query_errors = Counter(
+    'scrollwise_db_query_errors_total', 'Database calls that raised', ('query',)
+)
+transcript_fetch_duration = Histogram(
+    'scrollwise_transcript_fetch_duration_seconds', 'Time spent downloading transcripts from YouTube',
+    ('outcome',)
+)
+completion_duration = Histogram(
+    'scrollwise_completion_duration_seconds', 'Time spent in OpenAI chat completion calls',
+    ('model', 'kind', 'outcome')
+)
+completion_tokens = Counter(
+    'scrollwise_completion_tokens_total', 'Tokens reported by OpenAI chat completions',
+    ('model', 'kind', 'type')
+)
+upstream_errors = Counter(
+    'scrollwise_upstream_errors_total', 'Failed calls to external services', ('service',)
+)
+db_reads = Counter(
+    'scrollwise_db_reads_total', 'Read-only connections checked out, by target (primary or replica name)',
+    ('target',)
+)
+db_replica_lag = Gauge(
+    'scrollwise_db_replica_lag_seconds', 'Replication lag last measured on each read replica',
+    ('replica',)
+)
+db_replica_in_rotation = Gauge(
+    'scrollwise_db_replica_in_rotation', '1 while the replica is healthy and serving reads',
+    ('replica',)
+)
+upstream_retries = Counter(
+    'scrollwise_upstream_retries_total', 'Upstream calls retried after a transient failure', ('service',)
+)
+upstream_rate_limit_wait = Histogram(
+    'scrollwise_upstream_rate_limit_wait_seconds', 'Time upstream calls queued for rate limit budget',
+    ('service',)
+)
+upstream_circuit_state = Gauge(
+    'scrollwise_upstream_circuit_state', 'Upstream circuit breaker state: 0 closed, 1 half-open, 2 open',
+    ('service',)
+)
+cache_lookups = Counter(
+    'scrollwise_cache_lookups_total', 'Cache lookups by cache and result (hit or miss)',
+    ('cache', 'result')
+)
+
+
+def timed_query(fn):
+    """Record a DB function's duration and errors under its name (sync or async)"""
+    duration = db_query_duration.labels(fn.__name__)
+    errors = db_query_errors.labels(fn.__name__)
+
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                duration.observe(time.perf_counter() - started)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            duration.observe(time.perf_counter() - started)
+    return wrapper
+
+
+def record_completion_usage(model, kind, usage):
+    """Count the prompt and completion tokens of one completion, if reported"""
+    if usage is None:
+        return
+    completion_tokens.labels(model, kind, 'prompt').inc(getattr(usage, 'prompt_tokens', 0) or 0)
+    completion_tokens.labels(model, kind, 'completion').inc(getattr(usage, 'completion_tokens', 0) or 0)
@@ -0,0 +1,141 @@
+import argparse
+import os
+import re
+import sys
+import psycopg2
+from database_postgres import get_db_connection, release_db_connection, advisory_lock
+
+# Numbered schema migrations: migrations/NNNN_description.sql, applied in
+# order, each in its own transaction together with its schema_version row.
+#
+#   python migrate.py            apply pending migrations
+#   python migrate.py status     list applied and pending migrations
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+class SchemaVersionError(RuntimeError):
+    """The database schema is older than this code expects"""
+
+def list_migrations():
+    """Return [(version, name, path)] for the migration files, in order"""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r'^(\d+)_(\w+)\.sql$', filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration numbers in {MIGRATIONS_DIR}")
+    return migrations
+
+def latest_version():
+    """Return the highest migration number shipped with this code"""
+    migrations = list_migrations()
+    return migrations[-1][0] if migrations else 0
+
+def _ensure_version_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def get_applied_versions():
+    """Return {version: applied_at} for migrations already applied"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                return {}
+            cur.execute("SELECT version, applied_at FROM schema_version")
+            return dict(cur.fetchall())
+    except psycopg2.Error as e:
+        print(f"Error reading schema version: {e}")
+        raise
+    finally:
+        conn.rollback()
+        release_db_connection(conn)
+
+def migrate(target=None):
+    """Apply pending migrations up to `target` (default: all); return the versions applied"""
+    applied = []
+    # Serialize migrators so concurrent deploys cannot apply the same file twice
+    with advisory_lock('schema_migrations'):
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                _ensure_version_table(cur)
+                conn.commit()
+                cur.execute("SELECT version FROM schema_version")
+                done = {row[0] for row in cur.fetchall()}
+
+                for version, name, path in list_migrations():
+                    if version in done or (target is not None and version > target):
+                        continue
+                    with open(path) as f:
+                        sql = f.read()
+                    print(f"Applying migration {version:04d}_{name}...", file=sys.stderr)
+                    cur.execute(sql)
+                    cur.execute(
+                        "INSERT INTO schema_version (version, name) VALUES (%s, %s)",
+                        (version, name)
+                    )
+                    conn.commit()
+                    applied.append(version)
+            return applied
+        except psycopg2.Error as e:
+            print(f"Error applying migrations: {e}")
+            conn.rollback()
+            raise
+        finally:
+            release_db_connection(conn)
+
+def check_schema_version():
+    """Raise SchemaVersionError unless every shipped migration has been applied.
+
+    This is all the app does at startup: one query, no DDL and no table locks.
+    """
+    required = latest_version()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT max(version) FROM schema_version")
+            current = cur.fetchone()[0]
+    except psycopg2.errors.UndefinedTable:
+        current = None
+    except psycopg2.Error as e:
+        print(f"Error checking schema version: {e}")
+        raise
+    finally:
+        conn.rollback()
+        release_db_connection(conn)
+
+    # A newer schema is fine: migrations stay compatible with the previous release
+    if current is None or current < required:
+        raise SchemaVersionError(
+            f"Database schema is at version {current or 0} but this code needs "
+            f"{required}; run `python migrate.py` first"
+        )
+    return current
+
+def print_status():
+    applied = get_applied_versions()
+    for version, name, _ in list_migrations():
+        state = f"applied {applied[version].isoformat()}" if version in applied else "pending"
+        print(f"{version:04d}_{name}: {state}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply numbered schema migrations")
+    parser.add_argument('command', nargs='?', default='up', choices=['up', 'status'])
+    parser.add_argument('--target', type=int, help="stop after this migration number")
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        print_status()
+    else:
+        versions = migrate(args.target)
+        print(f"Applied {len(versions)} migration(s); schema is at version "
+              f"{max(get_applied_versions(), default=0)}", file=sys.stderr)
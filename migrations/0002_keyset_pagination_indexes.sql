@@ -0,0 +1,5 @@
+-- Composite indexes backing keyset pagination on (created_at, id)
+
+CREATE INDEX IF NOT EXISTS idx_bookmarks_created_at_id ON bookmarks(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_bookmarks_collection_created_at_id ON bookmarks(collection_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_bookmark_tags_tag_id_bookmark_id ON bookmark_tags(tag_id, bookmark_id);
@@ -0,0 +1,22 @@
+-- Background work queue, claimed with FOR UPDATE SKIP LOCKED
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    bookmark_id INTEGER REFERENCES bookmarks(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'queued',
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result JSONB,
+    error TEXT,
+    run_after TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    locked_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs(priority DESC, id) WHERE status = 'queued';
+
+-- At most one active job per kind and bookmark
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_kind_bookmark
+ON jobs(kind, bookmark_id) WHERE status IN ('queued', 'running');
@@ -0,0 +1,14 @@
+-- Groups of jobs started together (e.g. a whole collection's summaries)
+
+CREATE TABLE IF NOT EXISTS job_batches (
+    id SERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    scope TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS job_batch_items (
+    batch_id INTEGER REFERENCES job_batches(id) ON DELETE CASCADE,
+    job_id INTEGER REFERENCES jobs(id) ON DELETE CASCADE,
+    PRIMARY KEY (batch_id, job_id)
+);
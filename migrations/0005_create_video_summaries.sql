@@ -0,0 +1,10 @@
+-- Generated summaries shared by every bookmark of the same video
+
+CREATE TABLE IF NOT EXISTS video_summaries (
+    video_id TEXT NOT NULL,
+    prompt_version INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (video_id, prompt_version, model)
+);
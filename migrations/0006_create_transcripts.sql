@@ -0,0 +1,9 @@
+-- Persistent tier of the transcript cache
+
+CREATE TABLE IF NOT EXISTS transcripts (
+    video_id TEXT NOT NULL,
+    language TEXT NOT NULL,
+    transcript TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (video_id, language)
+);
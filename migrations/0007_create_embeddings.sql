@@ -0,0 +1,10 @@
+-- float32 summary vectors for semantic search
+
+CREATE TABLE IF NOT EXISTS embeddings (
+    bookmark_id INTEGER PRIMARY KEY REFERENCES bookmarks(id) ON DELETE CASCADE,
+    model TEXT NOT NULL,
+    vector BYTEA NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_embeddings_model_updated_at ON embeddings(model, updated_at);
@@ -0,0 +1,49 @@
+-- Full-text search: bookmarks.search_vector covers title, text and the
+-- bookmark's summary. A generated column cannot read the summaries table, so
+-- triggers on both tables keep it current.
+
+CREATE OR REPLACE FUNCTION bookmark_search_vector(b_id INTEGER, b_title TEXT, b_text TEXT)
+RETURNS tsvector LANGUAGE sql STABLE AS $$
+    SELECT setweight(to_tsvector('english', coalesce(b_title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(b_text, '')), 'B')
+        || setweight(to_tsvector('english', coalesce(
+               (SELECT string_agg(summary, ' ') FROM summaries WHERE bookmark_id = b_id), ''
+           )), 'C')
+$$;
+
+CREATE OR REPLACE FUNCTION bookmarks_search_vector_trigger() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector := bookmark_search_vector(NEW.id, NEW.title, NEW.text);
+    RETURN NEW;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION summaries_search_vector_trigger() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    target INTEGER := CASE WHEN TG_OP = 'DELETE' THEN OLD.bookmark_id ELSE NEW.bookmark_id END;
+BEGIN
+    UPDATE bookmarks
+    SET search_vector = bookmark_search_vector(id, title, text)
+    WHERE id = target;
+    RETURN NULL;
+END
+$$;
+
+ALTER TABLE bookmarks ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+DROP TRIGGER IF EXISTS bookmarks_search_vector ON bookmarks;
+CREATE TRIGGER bookmarks_search_vector
+BEFORE INSERT OR UPDATE OF title, text ON bookmarks
+FOR EACH ROW EXECUTE FUNCTION bookmarks_search_vector_trigger();
+
+DROP TRIGGER IF EXISTS summaries_search_vector ON summaries;
+CREATE TRIGGER summaries_search_vector
+AFTER INSERT OR UPDATE OF summary OR DELETE ON summaries
+FOR EACH ROW EXECUTE FUNCTION summaries_search_vector_trigger();
+
+UPDATE bookmarks SET search_vector = bookmark_search_vector(id, title, text)
+WHERE search_vector IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_bookmarks_search_vector ON bookmarks USING GIN (search_vector);
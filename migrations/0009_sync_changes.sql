@@ -0,0 +1,93 @@
+-- Incremental sync (GET /api/sync): every synced row carries the id of the
+-- transaction that last wrote it, and deletions leave tombstones. The HTTP
+-- validators (ETag / 304) are derived from the same columns.
+--
+-- Transaction ids rather than sequence values, because a sync reader can
+-- tell which transactions have finished: everything below its snapshot's
+-- xmin is committed (or rolled back), so returning the changes below xmin and
+-- handing out xmin as the next cursor never skips a change that commits late.
+--
+-- Triggers do the stamping, so every write path (save_bookmark,
+-- update_bookmark, the bulk import, save_summary, create_tag,
+-- create_collection, cascades) is covered without touching the queries.
+
+CREATE OR REPLACE FUNCTION stamp_change_xid() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id();
+    RETURN NEW;
+END
+$$;
+
+-- Adding or removing a tag changes the bookmark as the client sees it
+CREATE OR REPLACE FUNCTION touch_tagged_bookmarks() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE bookmarks
+    SET change_xid = pg_current_xact_id()
+    WHERE id IN (SELECT bookmark_id FROM changed_rows)
+      AND change_xid <> pg_current_xact_id();
+    RETURN NULL;
+END
+$$;
+
+CREATE TABLE IF NOT EXISTS sync_tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    entity TEXT NOT NULL,
+    entity_id INTEGER NOT NULL,
+    deleted_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_deleted_xid ON sync_tombstones(deleted_xid);
+
+CREATE OR REPLACE FUNCTION record_tombstones() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO sync_tombstones (entity, entity_id)
+    SELECT TG_ARGV[0], id FROM deleted_rows;
+    RETURN NULL;
+END
+$$;
+
+DO $$
+DECLARE
+    pair TEXT[];
+    t TEXT;
+BEGIN
+    FOREACH pair SLICE 1 IN ARRAY ARRAY[
+        ['bookmarks', 'bookmark'], ['tags', 'tag'], ['collections', 'collection'], ['summaries', 'summary']
+    ] LOOP
+        t := pair[1];
+        -- Existing rows take this migration's transaction id
+        EXECUTE format(
+            'ALTER TABLE %I ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT pg_current_xact_id()', t
+        );
+        EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I(change_xid)', 'idx_' || t || '_change_xid', t);
+
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_change_xid', t);
+        EXECUTE format(
+            'CREATE TRIGGER %I BEFORE UPDATE ON %I FOR EACH ROW EXECUTE FUNCTION stamp_change_xid()',
+            t || '_change_xid', t
+        );
+
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_tombstones', t);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS deleted_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION record_tombstones(%L)',
+            t || '_tombstones', t, pair[2]
+        );
+    END LOOP;
+END
+$$;
+
+-- Transition tables allow one event per trigger
+DROP TRIGGER IF EXISTS bookmark_tags_insert_touch ON bookmark_tags;
+CREATE TRIGGER bookmark_tags_insert_touch
+AFTER INSERT ON bookmark_tags REFERENCING NEW TABLE AS changed_rows
+FOR EACH STATEMENT EXECUTE FUNCTION touch_tagged_bookmarks();
+
+DROP TRIGGER IF EXISTS bookmark_tags_delete_touch ON bookmark_tags;
+CREATE TRIGGER bookmark_tags_delete_touch
+AFTER DELETE ON bookmark_tags REFERENCING OLD TABLE AS changed_rows
+FOR EACH STATEMENT EXECUTE FUNCTION touch_tagged_bookmarks();
@@ -0,0 +1,12 @@
+-- Who is generating a video's summary right now. A process claims the row
+-- before calling OpenAI and deletes it when done; others poll video_summaries
+-- meanwhile instead of holding a connection on a lock. The claim expires at
+-- claimed_until, so a crashed generator does not block the video for good.
+
+CREATE TABLE IF NOT EXISTS video_summary_claims (
+    video_id TEXT NOT NULL,
+    prompt_version INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    claimed_until TIMESTAMP WITH TIME ZONE NOT NULL,
+    PRIMARY KEY (video_id, prompt_version, model)
+);
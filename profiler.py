@@ -0,0 +1,189 @@
+import cProfile
+import hmac
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+import psycopg2
+import psycopg2.extensions
+
+# Opt-in profiling of single requests. A request is profiled when it carries
+# `X-Profile: <PROFILE_TOKEN>` or is picked by PROFILE_SAMPLE_RATE. It then runs
+# under cProfile, every SQL statement it executes is recorded with its timing
+# (and, if asked for, its EXPLAIN (ANALYZE, BUFFERS) plan), and two files are
+# written to PROFILE_DIR:
+#
+#   <id>.prof      cProfile stats: python -m pstats, snakeviz, gprof2dot, ...
+#   <id>.sql.json  the statements, in order
+PROFILE_CONFIG = {
+    'token': os.getenv('PROFILE_TOKEN', ''),  # empty: the header is ignored
+    'sample_rate': float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+    'explain': os.getenv('PROFILE_EXPLAIN', '0') == '1',
+    'dir': os.getenv('PROFILE_DIR', 'profiles'),
+}
+
+PROFILE_HEADER = 'X-Profile'
+EXPLAIN_HEADER = 'X-Profile-Explain'
+
+# One profiled request at a time per process: bounds the overhead, and Python
+# 3.12+ only allows one active cProfile per process anyway
+_profile_lock = threading.Lock()
+_local = threading.local()
+
+def profiling_enabled():
+    return bool(PROFILE_CONFIG['token']) or PROFILE_CONFIG['sample_rate'] > 0
+
+def start_profile(headers, label):
+    """Start profiling this request if it asks for it or is sampled; return the session or None"""
+    token = PROFILE_CONFIG['token']
+    requested = bool(token) and hmac.compare_digest(headers.get(PROFILE_HEADER, ''), token)
+    if not requested and random.random() >= PROFILE_CONFIG['sample_rate']:
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    explain = PROFILE_CONFIG['explain'] or (requested and headers.get(EXPLAIN_HEADER) == '1')
+    session = ProfileSession(label, explain)
+    session.start()
+    return session
+
+class ProfileSession:
+    """cProfile plus SQL capture for one request on the current thread"""
+
+    def __init__(self, label, explain=False):
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_')[:80]
+        self.id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{slug}-{uuid.uuid4().hex[:8]}"
+        self.label = label
+        self.explain = explain
+        self.statements = []
+        self._profile = cProfile.Profile()
+        self._started = None
+        self._finished = False
+
+    def start(self):
+        _local.session = self
+        self._started = time.perf_counter()
+        self._profile.enable()
+
+    def finish(self):
+        """Stop profiling and write the artifacts; safe to call more than once"""
+        if self._finished:
+            return
+        self._finished = True
+        self._profile.disable()
+        elapsed = time.perf_counter() - self._started
+        _local.session = None
+        try:
+            os.makedirs(PROFILE_CONFIG['dir'], exist_ok=True)
+            base = os.path.join(PROFILE_CONFIG['dir'], self.id)
+            self._profile.dump_stats(base + '.prof')
+            with open(base + '.sql.json', 'w') as f:
+                json.dump({
+                    'request': self.label,
+                    'duration_ms': round(elapsed * 1000, 3),
+                    'sql_ms': round(sum(s['duration_ms'] for s in self.statements), 3),
+                    'statements': self.statements,
+                }, f, indent=2, default=str)
+        except Exception as e:
+            print(f"Error writing profile {self.id}: {e}")
+        finally:
+            _profile_lock.release()
+
+    def record(self, cursor, method, duration, sql=None, failed=False):
+        if sql is None:
+            sql = cursor.query.decode(errors='replace') if isinstance(cursor.query, bytes) else cursor.query
+        statement = {
+            'sql': sql,
+            'method': method,
+            'duration_ms': round(duration * 1000, 3),
+            'rowcount': cursor.rowcount,
+        }
+        if failed:
+            statement['failed'] = True
+        elif self.explain and method == 'execute' and _explainable(cursor):
+            statement['plan'] = _explain(cursor)
+        self.statements.append(statement)
+
+# Statements are only re-run under EXPLAIN ANALYZE when that has no side
+# effects: SELECTs that take no row or advisory locks and create no table
+# (SELECT INTO), and WITH queries without a data-modifying CTE. UPDATE also
+# covers FOR UPDATE
+_UNSAFE_TO_REPEAT = re.compile(
+    r'\b(INSERT|UPDATE|DELETE|MERGE|INTO|FOR\s+(SHARE|NO\s+KEY|KEY\s+SHARE)|pg_advisory|nextval|setval|set_config)\b',
+    re.I
+)
+
+def _explainable(cursor):
+    if cursor.name or not isinstance(cursor.query, bytes):
+        return False
+    query = cursor.query.decode(errors='replace').lstrip()
+    return re.match(r'(SELECT|WITH)\b', query, re.I) is not None and not _UNSAFE_TO_REPEAT.search(query)
+
+def _explain(cursor):
+    conn = cursor.connection
+    # A plain cursor, so the EXPLAIN itself is not recorded; the savepoint keeps
+    # a failing EXPLAIN from aborting the caller's transaction
+    cur = psycopg2.extensions.cursor(conn)
+    savepoint = not conn.autocommit
+    try:
+        if savepoint:
+            cur.execute("SAVEPOINT profile_explain")
+        cur.execute(b"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + cursor.query)
+        plan = cur.fetchone()[0]
+        if savepoint:
+            cur.execute("RELEASE SAVEPOINT profile_explain")
+        return plan
+    except psycopg2.Error as e:
+        if savepoint:
+            cur.execute("ROLLBACK TO SAVEPOINT profile_explain")
+        return {'error': str(e)}
+    finally:
+        cur.close()
+
+_recording_cursor_classes = {}
+
+def _recording_cursor(base):
+    cls = _recording_cursor_classes.get(base)
+    if cls is None:
+        class RecordingCursor(base):
+            def _timed(self, method, call, *args, **kwargs):
+                started = time.perf_counter()
+                failed = True
+                try:
+                    result = call(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    session = getattr(_local, 'session', None)
+                    if session is not None:
+                        # COPY leaves cursor.query unset; record its command instead
+                        sql = args[0] if method == 'copy_expert' else None
+                        session.record(self, method, time.perf_counter() - started, sql, failed)
+
+            def execute(self, *args, **kwargs):
+                return self._timed('execute', super().execute, *args, **kwargs)
+
+            def executemany(self, *args, **kwargs):
+                return self._timed('executemany', super().executemany, *args, **kwargs)
+
+            def copy_expert(self, *args, **kwargs):
+                return self._timed('copy_expert', super().copy_expert, *args, **kwargs)
+
+        cls = _recording_cursor_classes[base] = RecordingCursor
+    return cls
+
+class ProfilingConnection(psycopg2.extensions.connection):
+    """Connection whose cursors report their statements to the thread's profile session.
+
+    Threads without an active session get ordinary cursors, so requests that
+    are not profiled pay one attribute lookup per cursor.
+    """
+
+    def cursor(self, *args, **kwargs):
+        if getattr(_local, 'session', None) is not None:
+            base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+            kwargs['cursor_factory'] = _recording_cursor(base)
+        return super().cursor(*args, **kwargs)
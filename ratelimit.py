@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+
+
+class RateLimitTimeout(Exception):
+    """Raised when tokens could not be acquired before the timeout"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursting up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take `tokens` if available right now; return whether they were taken"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens=1):
+        """Seconds until `tokens` (at most `capacity`) are available; 0 if they are now"""
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                return 0
+            return (tokens - self._tokens) / self.rate if self.rate > 0 else 1.0
+
+    def debit(self, tokens):
+        """Take `tokens` without waiting, going into debt if needed (negative to refund)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens - tokens)
+
+    def _take_or_wait(self, tokens, deadline):
+        # Take the tokens and return None, or return how long to wait for them
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return None
+            wait = (tokens - self._tokens) / self.rate if self.rate > 0 else 1.0
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RateLimitTimeout("rate limit budget exhausted")
+            wait = min(wait, remaining)
+        return wait
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block until `tokens` are available (raising RateLimitTimeout after `timeout`)"""
+        tokens = min(tokens, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take_or_wait(tokens, deadline)
+            if wait is None:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1, timeout=None):
+        """Like acquire(), but waits without blocking the event loop"""
+        tokens = min(tokens, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take_or_wait(tokens, deadline)
+            if wait is None:
+                return
+            await asyncio.sleep(wait)
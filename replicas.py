@@ -0,0 +1,256 @@
+import contextvars
+import itertools
+import os
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+import metrics
+
+# Read replicas for the read-heavy GETs. The database modules ask choose_replica()
+# where a read may go; it answers with a replica that is in rotation and has
+# replayed everything the current session wrote, or None for the primary.
+#
+# Read-your-writes: after a request writes, the primary's WAL position is
+# remembered for the session (the app hands it to the client as a cookie and
+# X-Read-After-LSN header and reads it back on the next request). Reads of that
+# session then only go to replicas that have replayed past it.
+#
+# A monitor thread measures every replica's lag each check_interval against
+# the primary's current WAL position; replicas that are unreachable, not in
+# recovery or behind by more than max_lag seconds are taken out of rotation
+# until they catch up.
+REPLICA_CONFIG = {
+    # Comma-separated connection URIs; empty means every read goes to the primary
+    'dsns': [dsn.strip() for dsn in os.getenv('POSTGRES_REPLICA_DSNS', '').split(',') if dsn.strip()],
+    'max_lag': float(os.getenv('REPLICA_MAX_LAG', '5')),
+    'check_interval': float(os.getenv('REPLICA_CHECK_INTERVAL', '1')),
+    'connect_timeout': int(os.getenv('REPLICA_CONNECT_TIMEOUT', '2')),
+}
+
+# Connection parameters for the primary, set by the database module (see
+# set_primary); the monitor reads the primary's WAL position through them
+_primary_params = None
+
+def replicas_enabled():
+    return bool(REPLICA_CONFIG['dsns'])
+
+def set_primary(params):
+    """Tell the monitor how to reach the primary (psycopg2.connect keyword arguments)"""
+    global _primary_params
+    _primary_params = dict(params)
+
+def parse_lsn(text):
+    """Turn a pg_lsn such as '16/B374D848' into an integer, or None if malformed"""
+    try:
+        high, low = text.split('/')
+        return (int(high, 16) << 32) + int(low, 16)
+    except (AttributeError, ValueError):
+        return None
+
+def format_lsn(lsn):
+    return f"{lsn >> 32:X}/{lsn & 0xFFFFFFFF:X}"
+
+class Replica:
+    """One read replica and what the monitor last saw of it"""
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        params = psycopg2.extensions.parse_dsn(dsn)
+        # Shown in stats and metric labels, so never include the password
+        self.name = f"{params.get('host', 'localhost')}:{params.get('port', '5432')}"
+        self.replay_lsn = None
+        self.lag_seconds = None
+        self.in_rotation = False
+        self.last_error = None
+        self.checked_at = None
+        self._conn = None
+
+    def check(self, max_lag, connect_timeout, primary_lsn=None):
+        """Measure lag; `primary_lsn` is the primary's WAL position just before, if known"""
+        try:
+            if self._conn is None or self._conn.closed:
+                self._conn = psycopg2.connect(self.dsn, connect_timeout=connect_timeout)
+                self._conn.autocommit = True
+            with self._conn.cursor() as cur:
+                cur.execute("""
+                    SELECT pg_is_in_recovery(),
+                           pg_last_wal_replay_lsn()::text,
+                           extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+                """)
+                in_recovery, replay_lsn, lag = cur.fetchone()
+            self.replay_lsn = parse_lsn(replay_lsn)
+            # An idle primary sends no new transactions, so a replica that has
+            # replayed everything the primary had written counts as caught up.
+            # Its own receive position is no measure: a replica whose WAL
+            # receiver disconnected has replayed all it received, however old.
+            if self.replay_lsn is not None and primary_lsn is not None and self.replay_lsn >= primary_lsn:
+                lag = 0
+            self.lag_seconds = float(lag) if lag is not None else None
+            self.last_error = None
+            self.in_rotation = bool(in_recovery) and self.lag_seconds is not None and self.lag_seconds <= max_lag
+            if not in_recovery:
+                self.last_error = "not in recovery (promoted?)"
+        except psycopg2.Error as e:
+            self.in_rotation = False
+            self.last_error = str(e).strip()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self.checked_at = time.time()
+        metrics.db_replica_in_rotation.labels(self.name).set(1 if self.in_rotation else 0)
+        if self.lag_seconds is not None:
+            metrics.db_replica_lag.labels(self.name).set(self.lag_seconds)
+
+    def status(self):
+        return {
+            'name': self.name,
+            'in_rotation': self.in_rotation,
+            'lag_seconds': self.lag_seconds,
+            'replay_lsn': format_lsn(self.replay_lsn) if self.replay_lsn is not None else None,
+            'last_error': self.last_error,
+            'checked_at': self.checked_at,
+        }
+
+class ReplicaMonitor:
+    """Background thread measuring replica lag and keeping the rotation current"""
+
+    def __init__(self, dsns, max_lag, check_interval, connect_timeout, primary=None):
+        self.replicas = [Replica(dsn) for dsn in dsns]
+        self.primary = primary
+        self.primary_error = None
+        self._primary_conn = None
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.connect_timeout = connect_timeout
+        self._round_robin = itertools.count()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        # Check once up front so the first reads already have a rotation
+        self.check()
+        self._thread = threading.Thread(target=self._run, name='replica-monitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def check(self):
+        primary_lsn = self.primary_lsn()
+        for replica in self.replicas:
+            replica.check(self.max_lag, self.connect_timeout, primary_lsn)
+
+    def primary_lsn(self):
+        """Return the primary's current WAL position, or None if it cannot be read"""
+        if self.primary is None:
+            return None
+        try:
+            if self._primary_conn is None or self._primary_conn.closed:
+                self._primary_conn = psycopg2.connect(connect_timeout=self.connect_timeout, **self.primary)
+                self._primary_conn.autocommit = True
+            with self._primary_conn.cursor() as cur:
+                cur.execute("SELECT pg_current_wal_lsn()::text")
+                lsn = parse_lsn(cur.fetchone()[0])
+            self.primary_error = None
+            return lsn
+        except psycopg2.Error as e:
+            # Without it only the replay timestamp tells the lag, which an
+            # idle primary inflates; replicas may drop out until it is back
+            self.primary_error = str(e).strip()
+            if self._primary_conn is not None:
+                self._primary_conn.close()
+                self._primary_conn = None
+            return None
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            self.check()
+
+    def choose(self, min_lsn=None):
+        """Return a replica in rotation that has replayed past `min_lsn`, or None"""
+        candidates = [
+            r for r in self.replicas
+            if r.in_rotation and (min_lsn is None or (r.replay_lsn is not None and r.replay_lsn >= min_lsn))
+        ]
+        if not candidates:
+            return None
+        return candidates[next(self._round_robin) % len(candidates)]
+
+    def take_out(self, replica, error):
+        """Drop a replica from rotation until the monitor sees it healthy again"""
+        replica.in_rotation = False
+        replica.last_error = str(error).strip()
+        metrics.db_replica_in_rotation.labels(replica.name).set(0)
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+def get_replica_monitor():
+    """Return the process-wide replica monitor (started on first use), or None without replicas"""
+    global _monitor
+    if not replicas_enabled():
+        return None
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                monitor = ReplicaMonitor(
+                    REPLICA_CONFIG['dsns'], REPLICA_CONFIG['max_lag'],
+                    REPLICA_CONFIG['check_interval'], REPLICA_CONFIG['connect_timeout'],
+                    primary=_primary_params
+                )
+                monitor.start()
+                _monitor = monitor
+    return _monitor
+
+def get_replica_status():
+    monitor = get_replica_monitor()
+    return [r.status() for r in monitor.replicas] if monitor else []
+
+# Per-request session state. The app calls start_read_session() before each
+# request; outside a session (job workers, scripts) reads ignore the session
+# and writes skip remembering their position.
+_read_after = contextvars.ContextVar('read_after_lsn', default=None)
+_session_wrote = contextvars.ContextVar('session_wrote', default=None)
+_session_replica = contextvars.ContextVar('session_replica', default=None)
+
+def start_read_session(read_after=None):
+    """Begin a request whose reads must see writes up to the LSN text `read_after`"""
+    _read_after.set(parse_lsn(read_after) if read_after else None)
+    _session_wrote.set(False)
+    _session_replica.set(None)
+
+def in_read_session():
+    return _session_wrote.get() is not None
+
+def note_write(lsn_text):
+    """Record the primary's WAL position after this session wrote"""
+    lsn = parse_lsn(lsn_text)
+    if lsn is None:
+        return
+    _read_after.set(max(lsn, _read_after.get() or 0))
+    _session_wrote.set(True)
+    # Pick again: the replica used so far may not have this write yet
+    _session_replica.set(None)
+
+def session_write_position():
+    """Return the LSN text to hand back to the client if this request wrote, else None"""
+    if not _session_wrote.get():
+        return None
+    return format_lsn(_read_after.get())
+
+def choose_replica():
+    """Return the replica the current read should use, or None for the primary.
+
+    Within a request every read goes to the same replica, so related reads
+    (a validator and the body it validates) see one consistent position.
+    """
+    monitor = get_replica_monitor()
+    if monitor is None:
+        return None
+    replica = _session_replica.get()
+    if replica is None or not replica.in_rotation:
+        replica = monitor.choose(_read_after.get())
+        if in_read_session():
+            _session_replica.set(replica)
+    return replica
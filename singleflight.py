@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for it and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Run `fn()` for `key` unless a call for `key` is already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        """Return the number of keys currently being computed"""
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines sharing one event loop"""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        """Await `fn()` for `key` unless a call for `key` is already in flight"""
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
+
+    def in_flight(self):
+        """Return the number of keys currently being computed"""
+        return len(self._calls)
@@ -0,0 +1,54 @@
+from cache import TTLCache
+
+
+def test_get_returns_default_when_missing():
+    cache = TTLCache(max_size=10, ttl=60)
+    assert cache.get('a') is None
+    assert cache.get('a', 'fallback') == 'fallback'
+    assert cache.stats()['misses'] == 2
+
+
+def test_set_then_get_counts_a_hit():
+    cache = TTLCache(max_size=10, ttl=60)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    assert cache.stats()['hits'] == 1
+
+
+def test_expired_entries_are_dropped():
+    cache = TTLCache(max_size=10, ttl=60)
+    cache.set('a', 1, ttl=0)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_size_budget_uses_sizeof():
+    cache = TTLCache(max_size=10, ttl=60, sizeof=len)
+    cache.set('a', 'xxxxxx')
+    cache.set('b', 'yyyyyy')
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 6
+    # A value larger than the whole budget is not cached at all
+    cache.set('c', 'z' * 11)
+    assert cache.get('c') is None
+    assert cache.get('b') == 'yyyyyy'
+
+
+def test_replacing_a_key_updates_its_size():
+    cache = TTLCache(max_size=10, ttl=60, sizeof=len)
+    cache.set('a', 'xxxx')
+    cache.set('a', 'xx')
+    assert cache.stats()['size'] == 2
+    cache.delete('a')
+    assert cache.stats()['size'] == 0
@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from database_postgres import _normalize_bulk_item, decode_cursor, encode_cursor, version_token
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor(created_at, 42)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == (created_at, 42)
+
+
+@pytest.mark.parametrize('cursor', ['', 'not a cursor', encode_cursor(datetime(2024, 1, 1), 1)[:-3]])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_version_token_joins_newest_xids():
+    assert version_token(['5', None, '3'], 10) == '5.0.3'
+
+
+def test_version_token_carries_xmin_while_older_transactions_run():
+    assert version_token(['5', '3'], 4) == '5.3.4'
+    assert version_token(['5', '3'], 5) == '5.3'
+
+
+def test_bulk_item_defaults():
+    assert _normalize_bulk_item({'text': 'hello'}) == {
+        'text': 'hello', 'title': None, 'collection_id': None, 'collection_name': None,
+        'tag_ids': [], 'tag_names': [], 'created_at': None,
+    }
+
+
+def test_bulk_item_created_at_forms():
+    assert _normalize_bulk_item({'text': 'x', 'created_at': 0})['created_at'] == \
+        datetime(1970, 1, 1, tzinfo=timezone.utc)
+    # Naive ISO timestamps are taken as UTC
+    assert _normalize_bulk_item({'text': 'x', 'created_at': '2024-01-02T03:04:05'})['created_at'] == \
+        datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize('item, message', [
+    ('text', 'must be a JSON object'),
+    ({}, 'Text is required'),
+    ({'text': 'x', 'title': 5}, 'title must be a string'),
+    ({'text': 'x', 'collection_id': '3'}, 'collection_id must be an integer'),
+    ({'text': 'x', 'tags': ['ok', '']}, 'tags must be a list of tag names'),
+    ({'text': 'x', 'tag_ids': [1, 'two']}, 'tag_ids must be a list of integers'),
+    ({'text': 'x', 'created_at': 'yesterday'}, 'ISO 8601'),
+    ({'text': 'x', 'created_at': float('inf')}, 'unix timestamp'),
+    ({'text': 'x', 'created_at': True}, 'must be an ISO 8601 string or a unix timestamp'),
+])
+def test_bulk_item_validation(item, message):
+    with pytest.raises(ValueError, match=message):
+        _normalize_bulk_item(item)
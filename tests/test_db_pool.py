@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+from psycopg2 import extensions
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        raise AssertionError("health checks within the interval must not query")
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def connect(**kwargs):
+        conn = FakeConnection()
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(db_pool.psycopg2, 'connect', connect)
+    return opened
+
+
+def make_pool(**kwargs):
+    options = dict(min_size=1, max_size=2, timeout=0.05, healthcheck_interval=60)
+    options.update(kwargs)
+    return ConnectionPool({'dbname': 'test'}, **options)
+
+
+def test_opens_min_size_connections_up_front(connections):
+    pool = make_pool(min_size=2)
+    assert len(connections) == 2
+    assert pool.stats()['idle'] == 2
+
+
+def test_returned_connections_are_reused(connections):
+    pool = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(connections) == 1
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_checkout_times_out_when_exhausted(connections):
+    pool = make_pool()
+    pool.getconn()
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    stats = pool.stats()
+    assert stats['in_use'] == 2
+    assert stats['checkout_failures'] == 1
+
+
+def test_waiting_checkout_gets_a_returned_connection(connections):
+    pool = make_pool(max_size=1, timeout=5)
+    conn = pool.getconn()
+    threading.Timer(0.05, pool.putconn, (conn,)).start()
+    assert pool.getconn() is conn
+    assert pool.stats()['waits'] == 1
+
+
+def test_broken_connection_is_replaced_on_checkout(connections):
+    pool = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.closed = 2
+    replacement = pool.getconn()
+    assert replacement is not conn
+    assert pool.stats()['reconnects'] == 1
+    assert pool.stats()['size'] == 1
+
+
+def test_open_transaction_is_rolled_back_on_return(connections):
+    pool = make_pool()
+    conn = pool.getconn()
+    conn.status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert pool.stats()['idle'] == 1
+
+
+def test_discarded_connection_is_closed(connections):
+    pool = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn, discard=True)
+    assert conn.closed
+    stats = pool.stats()
+    assert stats['discarded'] == 1
+    assert stats['size'] == 0
+
+
+def test_failed_connect_frees_its_slot(connections, monkeypatch):
+    pool = make_pool(min_size=0, max_size=1)
+
+    def refuse(**kwargs):
+        raise db_pool.psycopg2.OperationalError("connection refused")
+
+    monkeypatch.setattr(db_pool.psycopg2, 'connect', refuse)
+    with pytest.raises(db_pool.psycopg2.OperationalError):
+        pool.getconn()
+    stats = pool.stats()
+    assert stats['size'] == 0
+    assert stats['checkout_failures'] == 1
@@ -0,0 +1,100 @@
+import numpy as np
+
+from embeddings import EmbeddingIndex, HashingEmbedder
+
+DIM = 64
+
+
+def vectors(texts):
+    return HashingEmbedder(DIM).embed(texts)
+
+
+def test_hashing_embedder_is_deterministic_and_unit_length():
+    embedder = HashingEmbedder(DIM)
+    first = embedder.embed(['the quick brown fox', ''])
+    second = embedder.embed(['the quick brown fox', ''])
+    assert first.dtype == np.float32
+    assert np.array_equal(first, second)
+    assert np.isclose(np.linalg.norm(first[0]), 1)
+    # Empty text embeds to zeros rather than dividing by zero
+    assert not first[1].any()
+    assert embedder.model == f'local-hash-{DIM}'
+
+
+def test_hashing_embedder_ranks_shared_words_higher():
+    query, near, far = vectors(['python web framework', 'a web framework in python', 'baking sourdough bread'])
+    assert query @ near > query @ far
+
+
+def test_search_returns_best_matches_first():
+    index = EmbeddingIndex(DIM)
+    texts = ['cats and dogs', 'stock market news', 'dogs and puppies']
+    index.upsert([1, 2, 3], vectors(texts))
+    results = index.search(vectors(['dogs'])[0], k=2)
+    assert {bookmark_id for bookmark_id, _ in results} == {1, 3}
+    assert results[0][1] >= results[1][1]
+
+
+def test_search_excludes_ids_and_skips_empty_index():
+    index = EmbeddingIndex(DIM)
+    assert index.search(vectors(['anything'])[0]) == []
+    index.upsert([1, 2], vectors(['alpha beta', 'alpha gamma']))
+    assert [i for i, _ in index.search(vectors(['alpha beta'])[0], exclude=(1,))] == [2]
+
+
+def test_upsert_replaces_a_vector():
+    index = EmbeddingIndex(DIM)
+    old, new = vectors(['old text', 'new text'])
+    index.upsert([7], old[None, :])
+    index.upsert([7], new[None, :])
+    assert len(index) == 1
+    assert np.allclose(index.get(7), new)
+
+
+def test_snapshot_round_trip_hides_replaced_base_rows(tmp_path):
+    index = EmbeddingIndex(DIM)
+    base = vectors(['one', 'two', 'three'])
+    index.upsert([1, 2, 3], base)
+    index.save(str(tmp_path), {'model': 'test'})
+
+    loaded, meta = EmbeddingIndex.load(str(tmp_path))
+    assert meta['model'] == 'test'
+    assert isinstance(loaded._base, np.memmap)
+    assert np.allclose(loaded.get(2), base[1])
+
+    replacement = vectors(['two replaced'])
+    loaded.upsert([2], replacement)
+    assert len(loaded) == 3
+    assert np.allclose(loaded.get(2), replacement[0])
+    # The base is read-only; the old row is masked rather than overwritten
+    assert np.allclose(loaded._base[1], base[1])
+    scores = dict(loaded.search(base[1], k=3))
+    assert np.isclose(scores[2], replacement[0] @ base[1])
+
+    loaded.save(str(tmp_path), {'model': 'test'})
+    reloaded, _ = EmbeddingIndex.load(str(tmp_path))
+    assert sorted(reloaded._rows) == [1, 2, 3]
+    assert np.allclose(reloaded.get(2), replacement[0])
+
+
+def test_remove_drops_base_and_appended_rows(tmp_path):
+    index = EmbeddingIndex(DIM)
+    texts = vectors(['one', 'two', 'three', 'four', 'five'])
+    index.upsert([1, 2], texts[:2])
+    index.save(str(tmp_path), {})
+    index.upsert([3, 4, 5], texts[2:])
+
+    index.remove([1, 3, 99])
+    assert len(index) == 3
+    assert index.get(1) is None and index.get(3) is None
+    # The last appended vector moved into the freed row
+    assert np.allclose(index.get(5), texts[4])
+    assert sorted(i for i, _ in index.search(texts[0], k=10)) == [2, 4, 5]
+
+    index.save(str(tmp_path), {})
+    reloaded, _ = EmbeddingIndex.load(str(tmp_path))
+    assert sorted(reloaded._rows) == [2, 4, 5]
+
+
+def test_load_without_snapshot(tmp_path):
+    assert EmbeddingIndex.load(str(tmp_path)) == (None, None)
@@ -0,0 +1,45 @@
+import pytest
+
+import metrics
+
+
+def rendered(name):
+    return [line for line in metrics.render().splitlines() if name in line]
+
+
+def test_counter_renders_labels_and_escapes_values():
+    counter = metrics.Counter('test_render_requests_total', 'Requests', ('route',))
+    counter.labels('/a').inc()
+    counter.labels('/a').inc(2)
+    counter.labels('say "hi"\n').inc()
+    assert rendered('test_render_requests_total') == [
+        '# HELP test_render_requests_total Requests',
+        '# TYPE test_render_requests_total counter',
+        'test_render_requests_total{route="/a"} 3',
+        'test_render_requests_total{route="say \\"hi\\"\\n"} 1',
+    ]
+
+
+def test_gauge_without_labels():
+    gauge = metrics.Gauge('test_render_lag_seconds', 'Lag')
+    gauge.set(0.25)
+    assert rendered('test_render_lag_seconds')[-1] == 'test_render_lag_seconds 0.25'
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('test_render_duration_seconds', 'Duration', ('kind',), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.labels('x').observe(value)
+    assert rendered('test_render_duration_seconds')[2:] == [
+        'test_render_duration_seconds_bucket{kind="x",le="0.1"} 1',
+        'test_render_duration_seconds_bucket{kind="x",le="1"} 2',
+        'test_render_duration_seconds_bucket{kind="x",le="+Inf"} 3',
+        'test_render_duration_seconds_sum{kind="x"} 5.55',
+        'test_render_duration_seconds_count{kind="x"} 3',
+    ]
+
+
+def test_wrong_label_count_is_rejected():
+    counter = metrics.Counter('test_render_labels_total', 'Labels', ('a', 'b'))
+    with pytest.raises(ValueError):
+        counter.labels('only-one')
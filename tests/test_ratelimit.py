@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+import pytest
+
+from ratelimit import TokenBucket, RateLimitTimeout
+
+
+def test_bursts_up_to_capacity():
+    bucket = TokenBucket(rate=1, capacity=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+
+def test_capacity_defaults_to_one_second_of_rate():
+    assert TokenBucket(rate=5).capacity == 5
+    assert TokenBucket(rate=0.1).capacity == 1
+
+
+def test_wait_time_reflects_the_refill_rate():
+    bucket = TokenBucket(rate=10, capacity=1)
+    assert bucket.wait_time() == 0
+    bucket.try_acquire()
+    assert 0 < bucket.wait_time() <= 0.1
+
+
+def test_debit_goes_into_debt_and_refunds():
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.debit(15)
+    assert bucket.wait_time(1) > 1
+    bucket.debit(-15)
+    assert bucket.try_acquire(5)
+
+
+def test_refunds_never_exceed_capacity():
+    bucket = TokenBucket(rate=1, capacity=2)
+    bucket.debit(-10)
+    assert bucket.try_acquire(2)
+    assert not bucket.try_acquire(1)
+
+
+def test_acquire_waits_for_tokens():
+    bucket = TokenBucket(rate=50, capacity=1)
+    bucket.try_acquire()
+    started = time.monotonic()
+    bucket.acquire(timeout=1)
+    assert time.monotonic() - started >= 0.01
+
+
+def test_acquire_times_out():
+    bucket = TokenBucket(rate=0.5, capacity=1)
+    bucket.try_acquire()
+    with pytest.raises(RateLimitTimeout):
+        bucket.acquire(timeout=0.05)
+
+
+def test_acquire_async_times_out():
+    bucket = TokenBucket(rate=0.5, capacity=1)
+    bucket.try_acquire()
+    with pytest.raises(RateLimitTimeout):
+        asyncio.run(bucket.acquire_async(timeout=0.05))
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+
+import pytest
+
+from singleflight import SingleFlight, AsyncSingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do('key', work)))
+    leader.start()
+    assert started.wait(5)
+    waiters = [threading.Thread(target=lambda: results.append(flights.do('key', work))) for _ in range(4)]
+    for thread in waiters:
+        thread.start()
+    assert flights.in_flight() == 1
+    release.set()
+    for thread in [leader] + waiters:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ['result'] * 5
+    assert flights.in_flight() == 0
+
+
+def test_leader_exception_reaches_waiters():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('boom')
+
+    def run():
+        try:
+            flights.do('key', fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=run)
+    leader.start()
+    assert started.wait(5)
+    waiter = threading.Thread(target=run)
+    waiter.start()
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+    assert errors == ['boom', 'boom']
+
+
+def test_calls_after_completion_run_again():
+    flights = SingleFlight()
+    calls = []
+    flights.do('key', lambda: calls.append(1))
+    flights.do('key', lambda: calls.append(2))
+    assert calls == [1, 2]
+
+
+def test_async_calls_share_one_execution():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def main():
+        return await asyncio.gather(*(flights.do('key', work) for _ in range(5)))
+
+    assert asyncio.run(main()) == ['result'] * 5
+    assert calls == [1]
+    assert flights.in_flight() == 0
+
+
+def test_async_leader_exception_reaches_waiters():
+    flights = AsyncSingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError('boom')
+
+    async def main():
+        return await asyncio.gather(*(flights.do('key', fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [str(e) for e in results] == ['boom'] * 3
+
+
+def test_async_cancelled_waiter_does_not_cancel_the_leader():
+    flights = AsyncSingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return 'result'
+
+    async def main():
+        leader = asyncio.ensure_future(flights.do('key', work))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flights.do('key', work))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await leader
+
+    assert asyncio.run(main()) == 'result'
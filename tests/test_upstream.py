@@ -0,0 +1,164 @@
+import asyncio
+import email.utils
+import time
+
+import pytest
+
+from upstream import CircuitBreaker, CircuitOpenError, Upstream, UpstreamError, parse_retry_after
+
+
+class Transient(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__('transient')
+        self.retry_after = retry_after
+
+
+def make_upstream(**kwargs):
+    options = dict(max_attempts=3, base_delay=0, deadline=5, failure_threshold=10, reset_timeout=30)
+    options.update(kwargs)
+    return Upstream(
+        'test', lambda e: isinstance(e, Transient), lambda e: getattr(e, 'retry_after', None), **options
+    )
+
+
+def flaky(failures, result='ok', retry_after=None):
+    # fn(timeout) failing transiently `failures` times, then returning `result`
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        if len(calls) <= failures:
+            raise Transient(retry_after)
+        return result
+    return fn, calls
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('2.5') == 2.5
+    assert parse_retry_after('-3') == 0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 < parse_retry_after(date) <= 30
+
+
+def test_circuit_opens_after_threshold_and_probes_once():
+    breaker = CircuitBreaker('test-breaker', failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError) as info:
+        breaker.before_call()
+    assert 0 < info.value.retry_after <= 0.05
+
+    time.sleep(0.06)
+    assert breaker.state == 'half_open'
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_failed_trial_reopens_the_circuit():
+    breaker = CircuitBreaker('test-breaker', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+
+def test_transient_failures_are_retried():
+    fn, calls = flaky(2)
+    assert make_upstream().call(fn) == 'ok'
+    assert len(calls) == 3
+
+
+def test_other_failures_are_raised_at_once():
+    upstream = make_upstream()
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        raise ValueError('bad request')
+
+    with pytest.raises(ValueError):
+        upstream.call(fn)
+    assert len(calls) == 1
+
+
+def test_exhausted_retries_raise_upstream_error():
+    fn, calls = flaky(5, retry_after=0.01)
+    with pytest.raises(UpstreamError) as info:
+        make_upstream().call(fn)
+    assert len(calls) == 3
+    assert isinstance(info.value.__cause__, Transient)
+    assert info.value.retry_after == 0.01
+
+
+def test_retry_after_sets_the_minimum_delay():
+    fn, calls = flaky(1, retry_after=0.1)
+    started = time.monotonic()
+    make_upstream().call(fn)
+    assert time.monotonic() - started >= 0.1
+
+
+def test_retry_after_holds_back_other_callers():
+    upstream = make_upstream(max_attempts=1)
+    fn, _ = flaky(1, retry_after=0.1)
+    with pytest.raises(UpstreamError):
+        upstream.call(fn)
+    started = time.monotonic()
+    upstream.call(lambda timeout: 'ok')
+    assert time.monotonic() - started >= 0.05
+
+
+def test_retry_after_beyond_the_deadline_gives_up_at_once():
+    fn, calls = flaky(1, retry_after=10)
+    started = time.monotonic()
+    with pytest.raises(UpstreamError):
+        make_upstream(deadline=0.5).call(fn)
+    assert len(calls) == 1
+    assert time.monotonic() - started < 0.5
+
+
+def test_open_circuit_refuses_without_calling():
+    upstream = make_upstream(failure_threshold=2, max_attempts=2)
+    fn, calls = flaky(10)
+    with pytest.raises(UpstreamError):
+        upstream.call(fn)
+    with pytest.raises(CircuitOpenError):
+        upstream.call(fn)
+    assert len(calls) == 2
+
+
+def test_request_quota_spaces_out_calls():
+    # 10 requests per second with a burst of one
+    upstream = make_upstream(requests_per_minute=600, burst_seconds=0.1)
+    started = time.monotonic()
+    for _ in range(3):
+        upstream.call(lambda timeout: None)
+    assert time.monotonic() - started >= 0.15
+
+
+def test_quota_wait_beyond_the_deadline_fails():
+    upstream = make_upstream(requests_per_minute=6, burst_seconds=1, deadline=0.05)
+    upstream.call(lambda timeout: None)
+    with pytest.raises(UpstreamError):
+        upstream.call(lambda timeout: None)
+
+
+def test_call_async_retries():
+    upstream = make_upstream()
+    calls = []
+
+    async def fn(timeout):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise Transient()
+        return 'ok'
+
+    assert asyncio.run(upstream.call_async(fn)) == 'ok'
+    assert len(calls) == 3
@@ -0,0 +1,267 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from ratelimit import TokenBucket
+import metrics
+
+# Flow control for calls to external services (OpenAI, YouTube). An Upstream
+# wraps each call in:
+#
+#   - token buckets sized from the provider's quotas (requests and, where the
+#     provider counts them, tokens per minute), so bursts queue here instead
+#     of turning into 429s;
+#   - retries with jittered exponential backoff for transient failures. A
+#     Retry-After from the provider sets the minimum delay, and holds back
+#     every other caller of the same upstream until it has passed;
+#   - a deadline covering the queueing, every attempt and the backoff;
+#   - a circuit breaker that, after repeated transient failures, refuses calls
+#     at once for a while instead of piling more load on a degraded service.
+#
+# Failures that retrying cannot fix (bad request, no transcript, ...) are
+# raised unchanged on the first attempt. Transient ones that outlast the retry
+# budget are raised as UpstreamError, which carries a retry_after hint for
+# callers that can try again later (summary jobs).
+
+
+class UpstreamError(Exception):
+    """An upstream call that kept failing transiently, or was refused without being made"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamError):
+    """The upstream's circuit breaker is open; the call was not attempted"""
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+CIRCUIT_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and stays open for
+    `reset_timeout` seconds; then one trial call decides whether to close it"""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_started = None
+        self._lock = threading.Lock()
+        self._report('closed')
+
+    def _report(self, state):
+        metrics.upstream_circuit_state.labels(self.name).set(CIRCUIT_STATES[state])
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return 'open'
+            return 'half_open'
+
+    def check(self):
+        """Raise CircuitOpenError while the circuit is open, without taking the trial call"""
+        with self._lock:
+            if self._opened_at is not None:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError(f"{self.name} is unavailable (circuit open)", retry_after=remaining)
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go out now"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                raise CircuitOpenError(f"{self.name} is unavailable (circuit open)", retry_after=remaining)
+            # Half-open: let one call through to probe the upstream (another
+            # one if that trial never reported back)
+            now = time.monotonic()
+            if self._trial_started is not None and now - self._trial_started < self.reset_timeout:
+                raise CircuitOpenError(f"{self.name} is being probed (circuit half-open)", retry_after=1.0)
+            self._trial_started = now
+            self._report('half_open')
+
+    def record_success(self):
+        with self._lock:
+            was_open = self._opened_at is not None
+            self._failures = 0
+            self._opened_at = None
+            self._trial_started = None
+        if was_open:
+            print(f"Circuit for {self.name} closed")
+            self._report('closed')
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_started is not None or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._trial_started = None
+                opened = True
+            else:
+                opened = False
+        if opened:
+            print(f"Circuit for {self.name} opened after {self._failures} consecutive failures")
+            self._report('open')
+
+
+class Upstream:
+    """Rate limits, retries, deadline and circuit breaker for calls to one service.
+
+    `is_transient(exc)` says whether a failure is worth retrying;
+    `retry_after(exc)` returns the provider's requested delay for it, if any.
+    """
+
+    def __init__(self, name, is_transient, retry_after=None,
+                 requests_per_minute=None, tokens_per_minute=None, burst_seconds=5,
+                 max_attempts=4, base_delay=0.5, max_delay=30, deadline=120,
+                 failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.is_transient = is_transient
+        self.retry_after = retry_after or (lambda exc: None)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        # Bursts are capped at `burst_seconds` of quota: providers enforce
+        # per-minute limits over shorter windows too
+        self.request_bucket = self._bucket(requests_per_minute, burst_seconds)
+        self.token_bucket = self._bucket(tokens_per_minute, burst_seconds)
+        # monotonic time before which no call goes out (set by Retry-After)
+        self._resume_at = 0.0
+        self._retries = metrics.upstream_retries.labels(name)
+        self._wait = metrics.upstream_rate_limit_wait.labels(name)
+
+    @staticmethod
+    def _bucket(per_minute, burst_seconds):
+        if not per_minute:
+            return None
+        rate = per_minute / 60
+        return TokenBucket(rate, capacity=max(1.0, rate * burst_seconds))
+
+    def check(self):
+        """Fail fast with CircuitOpenError if calls are currently refused"""
+        self.breaker.check()
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Settle a call's token estimate against the usage the provider reported"""
+        if self.token_bucket is not None and actual_tokens:
+            self.token_bucket.debit(actual_tokens - estimated_tokens)
+
+    def record_failure(self, exc):
+        """Count a failure that happened after call() returned, e.g. mid-stream"""
+        if self.is_transient(exc):
+            self.breaker.record_failure()
+
+    def _budget_wait(self, tokens, deadline_at):
+        # How long to wait before the next attempt may go out, or None to go
+        # now. Checking and taking are separate steps, so concurrent callers
+        # can overdraw a bucket slightly; the next callers wait off the debt.
+        now = time.monotonic()
+        costs = [(bucket, amount) for bucket, amount in ((self.request_bucket, 1), (self.token_bucket, tokens))
+                 if bucket is not None and amount]
+        wait = self._resume_at - now
+        if wait <= 0:
+            wait = max([bucket.wait_time(amount) for bucket, amount in costs], default=0)
+            if not wait:
+                # A call larger than the burst waits for a full bucket and takes
+                # it into debt, so the quota still holds
+                for bucket, amount in costs:
+                    bucket.debit(amount)
+                return None
+        if now + wait > deadline_at:
+            raise UpstreamError(
+                f"{self.name} rate limit budget exhausted before the deadline", retry_after=wait
+            )
+        return wait
+
+    def _on_failure(self, exc, attempt, deadline_at):
+        """Return the delay before the next attempt, or raise if the call is over"""
+        if not self.is_transient(exc):
+            # The upstream answered; the request itself was at fault
+            self.breaker.record_success()
+            raise exc
+        self.breaker.record_failure()
+        retry_after = self.retry_after(exc)
+        if retry_after:
+            self._resume_at = max(self._resume_at, time.monotonic() + retry_after)
+        # Full jitter keeps callers that failed together from retrying together
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        delay = max(delay, retry_after or 0)
+        if attempt >= self.max_attempts or time.monotonic() + delay > deadline_at:
+            raise UpstreamError(
+                f"{self.name} failed after {attempt} attempt{'s' if attempt > 1 else ''}: {exc}",
+                retry_after=retry_after
+            ) from exc
+        self._retries.inc()
+        return delay
+
+    def call(self, fn, tokens=0, deadline=None):
+        """Call `fn(timeout)` under this upstream's limits and return its result.
+
+        `timeout` is the time left before the deadline, for clients that take a
+        per-request timeout. `tokens` is the call's estimated token cost.
+        """
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        for attempt in range(1, self.max_attempts + 1):
+            self.breaker.check()
+            started = time.monotonic()
+            while True:
+                wait = self._budget_wait(tokens, deadline_at)
+                if wait is None:
+                    break
+                time.sleep(wait)
+            self._wait.observe(time.monotonic() - started)
+            self.breaker.before_call()
+            try:
+                result = fn(deadline_at - time.monotonic())
+            except Exception as e:
+                time.sleep(self._on_failure(e, attempt, deadline_at))
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def call_async(self, fn, tokens=0, deadline=None):
+        """Like call(), for `fn(timeout)` returning an awaitable, waiting without blocking the loop"""
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        for attempt in range(1, self.max_attempts + 1):
+            self.breaker.check()
+            started = time.monotonic()
+            while True:
+                wait = self._budget_wait(tokens, deadline_at)
+                if wait is None:
+                    break
+                await asyncio.sleep(wait)
+            self._wait.observe(time.monotonic() - started)
+            self.breaker.before_call()
+            try:
+                result = await fn(deadline_at - time.monotonic())
+            except Exception as e:
+                await asyncio.sleep(self._on_failure(e, attempt, deadline_at))
+            else:
+                self.breaker.record_success()
+                return result
@@ -1,42 +1,330 @@
+import os
+import queue
 import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import openai
+import requests
+import youtube_transcript_api
 from youtube_transcript_api import YouTubeTranscriptApi
 from openai import OpenAI
+from cache import TTLCache
+from singleflight import SingleFlight
+from ratelimit import TokenBucket, RateLimitTimeout
+from upstream import Upstream, UpstreamError, parse_retry_after
+import metrics
+from database_postgres import (
+    get_stored_transcripts, save_transcript, get_video_summary, save_video_summary,
+    claim_video_summary, release_video_summary
+)
 
-openai_client = OpenAI()
+# Quotas and retry policy for the upstreams (see upstream.py). The limits are
+# per process: when several processes share one API key, split the quota
+# between them. QUOTA_HEADROOM leaves room for other users of the key.
+UPSTREAM_CONFIG = {
+    'openai_rpm': float(os.getenv('OPENAI_RPM_LIMIT', '500')),
+    'openai_tpm': float(os.getenv('OPENAI_TPM_LIMIT', '200000')),
+    'openai_timeout': float(os.getenv('OPENAI_TIMEOUT', '60')),  # per attempt
+    # A transcript takes two requests: listing the video's tracks, then the fetch
+    'youtube_rpm': float(os.getenv('YOUTUBE_RPM_LIMIT', '120')),
+    'quota_headroom': float(os.getenv('QUOTA_HEADROOM', '0.9')),
+    'max_attempts': int(os.getenv('UPSTREAM_MAX_ATTEMPTS', '4')),
+    'deadline': float(os.getenv('UPSTREAM_DEADLINE', '120')),  # per call, retries included
+    'failure_threshold': int(os.getenv('UPSTREAM_FAILURE_THRESHOLD', '5')),
+    'reset_timeout': float(os.getenv('UPSTREAM_RESET_TIMEOUT', '30')),
+}
+
+# Retries are ours (openai_upstream), so the client must not retry on its own
+openai_client = OpenAI(max_retries=0, timeout=UPSTREAM_CONFIG['openai_timeout'])
+
+SUMMARY_MODEL = os.getenv('SUMMARY_MODEL', 'gpt-4o-mini')
+SUMMARY_PROMPT = "You will be provided a transcript of a YouTube video. Summarize key insights covering all important points, assuming you are relaying them to a person who does not have the time to watch the video. The summary needs to be fewer than 1500 characters strictly! Also, do not include any \n in your output!"
+CHUNK_PROMPT = "You will be provided one consecutive part of a longer YouTube video transcript. Summarize the key insights and important points of this part concisely, keeping concrete facts, names and numbers. Do not include any \n in your output!"
+REDUCE_PROMPT = "You will be provided summaries of consecutive parts of one YouTube video, in order. Combine them into a single summary of key insights covering all important points, assuming you are relaying them to a person who does not have the time to watch the video. The summary needs to be fewer than 1500 characters strictly! Also, do not include any \n in your output!"
+# Bump whenever SUMMARY_PROMPT changes so stored summaries are regenerated
+SUMMARY_PROMPT_VERSION = 1
+
+# Transcripts estimated above SUMMARY_SINGLE_CALL_TOKENS are split into windows
+# of SUMMARY_CHUNK_TOKENS, summarized in parallel and then combined
+SUMMARY_SINGLE_CALL_TOKENS = int(os.getenv('SUMMARY_SINGLE_CALL_TOKENS', '12000'))
+SUMMARY_CHUNK_TOKENS = int(os.getenv('SUMMARY_CHUNK_TOKENS', '6000'))
+SUMMARY_CHUNK_CONCURRENCY = int(os.getenv('SUMMARY_CHUNK_CONCURRENCY', '8'))
+CHARS_PER_TOKEN = 4  # rough average for English text
+MAX_REDUCE_ROUNDS = 3
+
+# Shared by all summaries so total parallel chunk calls stay bounded
+chunk_executor = ThreadPoolExecutor(
+    max_workers=SUMMARY_CHUNK_CONCURRENCY, thread_name_prefix='summary-chunk'
+)
+
+# Per-process budget for newly generated summaries (stored ones are free)
+summary_rate_limiter = TokenBucket(
+    rate=float(os.getenv('SUMMARY_RATE_PER_MINUTE', '60')) / 60,
+    capacity=float(os.getenv('SUMMARY_RATE_BURST', '5'))
+)
+# How long a request waits for that budget before giving up (RateLimitTimeout)
+SUMMARY_RATE_TIMEOUT = float(os.getenv('SUMMARY_RATE_TIMEOUT', '10'))
+
+# A process generating a video's summary claims it for SUMMARY_CLAIM_LEASE
+# seconds (longer than a generation takes); others poll for the result
+SUMMARY_CLAIM_LEASE = float(os.getenv('SUMMARY_CLAIM_LEASE', '300'))
+SUMMARY_CLAIM_POLL = (0.25, 2.0)  # first and longest poll interval
+
+# Concurrent requests for the same video share one YouTube fetch / completion
+transcript_flights = SingleFlight()
+summary_flights = SingleFlight()
+
+class TranscriptError(Exception):
+    # The video's transcript could not be fetched
+    pass
+
+def _openai_transient(e):
+    # Rate limits, timeouts, dropped connections and server errors pass
+    if isinstance(e, openai.RateLimitError):
+        # An exhausted billing quota does not come back by retrying
+        return getattr(e, 'code', None) != 'insufficient_quota'
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code in (408, 409) or e.status_code >= 500
+    return isinstance(e, openai.APIConnectionError)
+
+def _openai_retry_after(e):
+    headers = getattr(getattr(e, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers['retry-after-ms']) / 1000
+    except (KeyError, ValueError):
+        return parse_retry_after(headers.get('retry-after'))
+
+# YouTube throttling or failing, as opposed to a video without a transcript.
+# The class names differ between youtube_transcript_api versions.
+_YOUTUBE_BLOCKED = tuple(
+    getattr(youtube_transcript_api, name) for name in ('TooManyRequests', 'RequestBlocked')
+    if hasattr(youtube_transcript_api, name)
+)
+_YOUTUBE_TRANSIENT = _YOUTUBE_BLOCKED + tuple(
+    getattr(youtube_transcript_api, name) for name in ('YouTubeRequestFailed',)
+    if hasattr(youtube_transcript_api, name)
+) + (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+# YouTube sends no Retry-After; a blocked client backs off this long
+YOUTUBE_BLOCKED_BACKOFF = float(os.getenv('YOUTUBE_BLOCKED_BACKOFF', '60'))
+
+def _youtube_transient(e):
+    return isinstance(e, _YOUTUBE_TRANSIENT)
+
+def _youtube_retry_after(e):
+    return YOUTUBE_BLOCKED_BACKOFF if isinstance(e, _YOUTUBE_BLOCKED) else None
+
+def _upstream_policy():
+    return {key: UPSTREAM_CONFIG[key] for key in ('max_attempts', 'deadline', 'failure_threshold', 'reset_timeout')}
+
+# Shared by the sync and async modules, so both count against one quota
+openai_upstream = Upstream(
+    'openai', _openai_transient, _openai_retry_after,
+    requests_per_minute=UPSTREAM_CONFIG['openai_rpm'] * UPSTREAM_CONFIG['quota_headroom'],
+    tokens_per_minute=UPSTREAM_CONFIG['openai_tpm'] * UPSTREAM_CONFIG['quota_headroom'],
+    **_upstream_policy()
+)
+youtube_upstream = Upstream(
+    'youtube', _youtube_transient, _youtube_retry_after,
+    requests_per_minute=UPSTREAM_CONFIG['youtube_rpm'] * UPSTREAM_CONFIG['quota_headroom'],
+    **_upstream_policy()
+)
+
+# Transcript language negotiation. Each video's tracks are listed once; the
+# first preferred language wins (a manual track before an auto-generated one),
+# then a translation into the first preferred language, then the best track
+# in whatever language the video has.
+TRANSCRIPT_CONFIG = {
+    'languages': tuple(
+        code.strip() for code in os.getenv('TRANSCRIPT_LANGUAGES', 'en').split(',') if code.strip()
+    ),
+    'translate': os.getenv('TRANSCRIPT_TRANSLATE', '1') == '1',
+    # Listed tracks carry signed URLs that expire, so keep them briefly
+    'tracks_ttl': float(os.getenv('TRANSCRIPT_TRACKS_TTL', '600')),
+    'unavailable_ttl': float(os.getenv('TRANSCRIPT_UNAVAILABLE_TTL', '21600')),
+}
+
+# In-process transcript cache, bounded by total characters; the transcripts
+# table behind it keeps every transcript we have ever fetched.
+transcript_cache = TTLCache(
+    max_size=int(os.getenv('TRANSCRIPT_CACHE_MAX_CHARS', str(50 * 1024 * 1024))),
+    ttl=float(os.getenv('TRANSCRIPT_CACHE_TTL', '3600')),
+    sizeof=len
+)
+
+# Each video's listed tracks (what languages exist, manual or generated,
+# translatable), so another fetch of the video does not list them again
+transcript_tracks = TTLCache(
+    max_size=int(os.getenv('TRANSCRIPT_TRACKS_MAX_ENTRIES', '10000')),
+    ttl=TRANSCRIPT_CONFIG['tracks_ttl']
+)
+
+# Videos without a usable transcript (captions disabled, no tracks, video
+# gone), by video id. Fetches of them fail at once instead of asking YouTube
+# again until the entry expires.
+unavailable_transcripts = TTLCache(
+    max_size=int(os.getenv('TRANSCRIPT_UNAVAILABLE_MAX_ENTRIES', '100000')),
+    ttl=TRANSCRIPT_CONFIG['unavailable_ttl']
+)
+
+_TRANSCRIPT_UNAVAILABLE = tuple(
+    getattr(youtube_transcript_api, name)
+    for name in ('TranscriptsDisabled', 'NoTranscriptFound', 'NoTranscriptAvailable', 'VideoUnavailable')
+    if hasattr(youtube_transcript_api, name)
+)
 
 def get_video_id(youtube_url):
     # Extract the video ID from the YouTube URL
     video_id = re.search(r'(?:v=|\/)([0-9A-Za-z_-]{11}).*', youtube_url)
     return video_id.group(1) if video_id else None
 
-def fetch_transcript(youtube_url, language='en'):
+def fetch_transcript(youtube_url, languages=None):
     # Get the video ID
     video_id = get_video_id(youtube_url)
     if not video_id:
         return "Invalid YouTube URL provided."
 
+    # Known to have no transcript: fail without a round trip
+    reason = unavailable_transcripts.get(video_id)
+    _record_cache('transcript_unavailable', reason)
+    if reason is not None:
+        return f"An error occurred: {reason}"
+
+    # Serve from the in-process cache, then from the transcripts table
+    languages = tuple(languages or TRANSCRIPT_CONFIG['languages'])
+    key = (video_id, languages)
+    transcript = transcript_cache.get(key)
+    _record_cache('transcript_memory', transcript)
+    if transcript is not None:
+        return transcript
+    stored = {}
     try:
-        # Fetch the transcript in the specified language
-        transcript_data = YouTubeTranscriptApi.get_transcript(video_id, languages=[language])
-        
-        # Format the transcript text
-        transcript = " ".join([item['text'] for item in transcript_data])
+        stored = get_stored_transcripts(video_id)
+        transcript = choose_stored(stored, languages)
+        _record_cache('transcript_db', transcript)
+    except Exception as e:
+        print(f"Transcript store unavailable, fetching from YouTube: {e}", file=sys.stderr)
+    if transcript is not None:
+        transcript_cache.set(key, transcript)
         return transcript
 
+    try:
+        return transcript_flights.do(key, lambda: _download_transcript(video_id, languages, stored))
+    except UpstreamError:
+        # YouTube is throttling or down, which is worth trying again later
+        raise
     except Exception as e:
         return f"An error occurred: {e}"
+
+def check_transcript_available(video_id):
+    # Raise TranscriptError at once for a video known to have no transcript,
+    # before a summary takes a lock or rate limit budget for it
+    reason = unavailable_transcripts.get(video_id)
+    _record_cache('transcript_unavailable', reason)
+    if reason is not None:
+        raise TranscriptError(f"An error occurred: {reason}")
+
+def _list_transcripts(video_id):
+    # list_transcripts() is the 0.6 API; 1.x lists through an instance
+    if hasattr(YouTubeTranscriptApi, 'list_transcripts'):
+        return YouTubeTranscriptApi.list_transcripts(video_id)
+    return YouTubeTranscriptApi().list(video_id)
+
+def _list_tracks(video_id):
+    # One listing call per video tells us every manual and generated track
+    tracks = transcript_tracks.get(video_id)
+    _record_cache('transcript_tracks', tracks)
+    if tracks is None:
+        tracks = list(youtube_upstream.call(lambda timeout: _list_transcripts(video_id)))
+        transcript_tracks.set(video_id, tracks)
+    return tracks
+
+def _language_matches(code, wanted):
+    # 'en' accepts regional tracks such as 'en-GB'
+    return code == wanted or code.split('-')[0] == wanted
+
+def _translation_code(language):
+    # Translation languages are dicts in 0.6 and objects in 1.x
+    return language['language_code'] if isinstance(language, dict) else language.language_code
+
+def choose_track(tracks, languages):
+    # Return the (track, language) to fetch, or (None, None) if there is none
+    for wanted in languages:
+        for generated in (False, True):
+            for track in tracks:
+                if track.is_generated == generated and _language_matches(track.language_code, wanted):
+                    return track, track.language_code
+    ranked = sorted(tracks, key=lambda track: track.is_generated)
+    if TRANSCRIPT_CONFIG['translate'] and languages:
+        target = languages[0]
+        for track in ranked:
+            if track.is_translatable and any(
+                _translation_code(language) == target for language in track.translation_languages
+            ):
+                return track.translate(target), target
+    if ranked:
+        return ranked[0], ranked[0].language_code
+    return None, None
+
+def choose_stored(transcripts, languages):
+    # Return the stored transcript in the first preferred language, or None.
+    # A stored fallback language is only served once listing the tracks again
+    # shows no preferred one has appeared (see _download_transcript).
+    for wanted in languages:
+        for code, transcript in transcripts.items():
+            if _language_matches(code, wanted):
+                return transcript
+    return None
+
+def _download_transcript(video_id, languages, stored=None):
+    # List the video's tracks, then fetch the negotiated one unless `stored`
+    # (the video's stored transcripts by language) already has it. The client
+    # takes no timeout, so the upstream deadline only bounds queueing and
+    # retries.
+    started = time.perf_counter()
+    try:
+        track, language = choose_track(_list_tracks(video_id), languages)
+        if track is None:
+            raise TranscriptError(f"No transcript available for video {video_id}")
+        if stored and language in stored:
+            transcript_cache.set((video_id, languages), stored[language])
+            return stored[language]
+        transcript_data = youtube_upstream.call(lambda timeout: track.fetch())
+    except (TranscriptError,) + _TRANSCRIPT_UNAVAILABLE as e:
+        metrics.transcript_fetch_duration.labels('unavailable').observe(time.perf_counter() - started)
+        reason = str(e) if isinstance(e, TranscriptError) else (
+            f"No transcript available for video {video_id} ({type(e).__name__})"
+        )
+        unavailable_transcripts.set(video_id, reason)
+        transcript_tracks.delete(video_id)
+        raise TranscriptError(reason) from e
+    except Exception:
+        metrics.transcript_fetch_duration.labels('error').observe(time.perf_counter() - started)
+        metrics.upstream_errors.labels('youtube').inc()
+        raise
+    metrics.transcript_fetch_duration.labels('ok').observe(time.perf_counter() - started)
+
+    # Format the transcript text (1.x returns snippet objects)
+    if hasattr(transcript_data, 'to_raw_data'):
+        transcript_data = transcript_data.to_raw_data()
+    transcript = " ".join([item['text'] for item in transcript_data])
+
+    transcript_cache.set((video_id, languages), transcript)
+    try:
+        save_transcript(video_id, language, transcript)
+    except Exception as e:
+        print(f"Could not store transcript for {video_id}: {e}", file=sys.stderr)
+    return transcript
     
-def summarize(youtube_url):
-    transcript = fetch_transcript(youtube_url)
-    completion = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
+def _messages(system_prompt, text):
+    return [
         {
           "role": "system",
           "content": [
             {
               "type": "text",
-              "text": "You will be provided a transcript of a YouTube video. Summarize key insights covering all important points, assuming you are relaying them to a person who does not have the time to watch the video. The summary needs to be fewer than 1500 characters strictly! Also, do not include any \n in your output!"
+              "text": system_prompt
             }
           ]
         },
@@ -45,10 +333,268 @@ def summarize(youtube_url):
           "content": [
             {
               "type": "text",
-              "text": transcript
+              "text": text
             }
           ]
         }
       ]
+
+def _record_cache(cache, value):
+    metrics.cache_lookups.labels(cache, 'miss' if value is None else 'hit').inc()
+
+# Metric label for each kind of completion call
+PROMPT_KINDS = {SUMMARY_PROMPT: 'summary', CHUNK_PROMPT: 'chunk', REDUCE_PROMPT: 'reduce'}
+
+def _record_completion(system_prompt, started, usage=None, error=False, cost=None, abandoned=False):
+    # `abandoned`: the caller stopped reading a stream (e.g. the client went
+    # away), which is no upstream error
+    kind = PROMPT_KINDS.get(system_prompt, 'other')
+    outcome = 'error' if error else 'abandoned' if abandoned else 'ok'
+    metrics.completion_duration.labels(SUMMARY_MODEL, kind, outcome).observe(
+        time.perf_counter() - started
     )
-    return completion.choices[0].message.content
\ No newline at end of file
+    if error:
+        metrics.upstream_errors.labels('openai').inc()
+    metrics.record_completion_usage(SUMMARY_MODEL, kind, usage)
+    if cost is not None and usage is not None:
+        openai_upstream.record_usage(cost, getattr(usage, 'total_tokens', None))
+
+# Summaries are capped at ~1500 characters
+COMPLETION_TOKENS_ESTIMATE = 500
+
+def _completion_cost(system_prompt, text):
+    # Tokens a completion is expected to use, charged against the TPM quota up
+    # front and settled once the response reports its usage
+    return estimate_tokens(system_prompt) + estimate_tokens(text) + COMPLETION_TOKENS_ESTIMATE
+
+def _attempt_timeout(timeout):
+    return min(timeout, UPSTREAM_CONFIG['openai_timeout'])
+
+def _complete(system_prompt, text):
+    started = time.perf_counter()
+    cost = _completion_cost(system_prompt, text)
+    try:
+        completion = openai_upstream.call(
+            lambda timeout: openai_client.chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=_messages(system_prompt, text),
+                timeout=_attempt_timeout(timeout)
+            ),
+            tokens=cost
+        )
+    except Exception:
+        _record_completion(system_prompt, started, error=True)
+        raise
+    _record_completion(system_prompt, started, completion.usage, cost=cost)
+    return completion.choices[0].message.content
+
+def _stream_completion(system_prompt, text):
+    # Yield the completion's text deltas as the model produces them; the last
+    # chunk carries the token usage and no choices
+    started = time.perf_counter()
+    usage = None
+    cost = _completion_cost(system_prompt, text)
+    try:
+        stream = openai_upstream.call(
+            lambda timeout: openai_client.chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=_messages(system_prompt, text),
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=_attempt_timeout(timeout)
+            ),
+            tokens=cost
+        )
+    except Exception:
+        _record_completion(system_prompt, started, error=True)
+        raise
+    try:
+        for chunk in stream:
+            usage = getattr(chunk, 'usage', None) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except GeneratorExit:
+        # Closed before the end, e.g. the client disconnected mid-stream
+        _record_completion(system_prompt, started, usage, abandoned=True)
+        raise
+    except Exception as e:
+        # Text already went out, so no retry; the circuit breaker still counts it
+        openai_upstream.record_failure(e)
+        _record_completion(system_prompt, started, usage, error=True)
+        raise
+    _record_completion(system_prompt, started, usage, cost=cost)
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def split_into_windows(text, max_tokens):
+    # Split on word boundaries into windows of at most ~max_tokens each
+    budget = max_tokens * CHARS_PER_TOKEN
+    windows, current, length = [], [], 0
+    for word in text.split():
+        if current and length + len(word) + 1 > budget:
+            windows.append(" ".join(current))
+            current, length = [], 0
+        current.append(word)
+        length += len(word) + 1
+    if current:
+        windows.append(" ".join(current))
+    return windows
+
+def summarize(youtube_url, transcript=None):
+    # Reuse an already fetched transcript when the caller has one
+    if transcript is None:
+        transcript = fetch_transcript(youtube_url)
+    return _complete(*_final_prompt(transcript))
+
+def _final_prompt(transcript):
+    # Return the (system prompt, user text) of the call that writes the final
+    # summary, running the map phase first for long transcripts
+    if estimate_tokens(transcript) <= SUMMARY_SINGLE_CALL_TOKENS:
+        return SUMMARY_PROMPT, transcript
+    return REDUCE_PROMPT, _map_transcript(transcript)
+
+def _map_transcript(transcript):
+    # Long transcripts: summarize the windows in parallel and return the partial
+    # summaries for the reduce call. If they are still too long to combine in
+    # one call, map them again.
+    parts = [transcript]
+    for _ in range(MAX_REDUCE_ROUNDS):
+        windows = [w for part in parts for w in split_into_windows(part, SUMMARY_CHUNK_TOKENS)]
+        parts = list(chunk_executor.map(lambda w: _complete(CHUNK_PROMPT, w), windows))
+        combined = "\n\n".join(
+            f"Part {i} of {len(parts)}: {part}" for i, part in enumerate(parts, 1)
+        )
+        if estimate_tokens(combined) <= SUMMARY_SINGLE_CALL_TOKENS:
+            break
+        parts = [combined]
+    return combined
+
+def summarize_video(youtube_url, rate_timeout=SUMMARY_RATE_TIMEOUT):
+    # Return the video's summary, reusing one generated for any bookmark of the
+    # same video with the current prompt version and model. Raises
+    # RateLimitTimeout if no summary budget frees up within `rate_timeout`.
+    video_id = get_video_id(youtube_url)
+    if not video_id:
+        raise TranscriptError("Invalid YouTube URL provided.")
+    key = (video_id, SUMMARY_PROMPT_VERSION, SUMMARY_MODEL)
+    summary = get_video_summary(*key)
+    _record_cache('video_summary', summary)
+    if summary is not None:
+        return summary
+    check_transcript_available(video_id)
+    return summary_flights.do(key, lambda: _generate_video_summary(youtube_url, key, rate_timeout))
+
+def _generate_video_summary(youtube_url, key, rate_timeout, on_delta=None):
+    # Fail before waiting for budget if OpenAI is refusing calls, and wait for
+    # it before claiming, so nobody waits on the claim behind the rate limiter.
+    # rate_timeout=None: the caller already took the budget. With `on_delta`,
+    # the final completion is streamed and each text delta passed to it.
+    if rate_timeout is not None:
+        openai_upstream.check()
+        summary_rate_limiter.acquire(timeout=rate_timeout)
+    # The claim extends single-flight across processes. Waiting for another
+    # process's claim holds no connection; it ends when that process stores
+    # the summary, gives up the claim or lets it expire.
+    delay = SUMMARY_CLAIM_POLL[0]
+    while True:
+        summary = get_video_summary(*key)
+        if summary is not None:
+            summary_rate_limiter.debit(-1)  # nothing generated: refund the budget
+            return summary
+        if claim_video_summary(*key, SUMMARY_CLAIM_LEASE):
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, SUMMARY_CLAIM_POLL[1])
+
+    try:
+        # Stored between our last look and the claim?
+        summary = get_video_summary(*key)
+        if summary is not None:
+            summary_rate_limiter.debit(-1)
+            return summary
+
+        transcript = fetch_transcript(youtube_url)
+        if transcript.startswith("An error occurred"):
+            raise TranscriptError(transcript)
+
+        if on_delta is None:
+            summary = summarize(youtube_url, transcript=transcript)
+        else:
+            pieces = []
+            for delta in _stream_completion(*_final_prompt(transcript)):
+                pieces.append(delta)
+                on_delta(delta)
+            summary = "".join(pieces)
+        save_video_summary(*key, summary)
+        return summary
+    finally:
+        try:
+            release_video_summary(*key)
+        except Exception as e:
+            # The claim expires on its own
+            print(f"Could not release summary claim for {key[0]}: {e}", file=sys.stderr)
+
+def stream_video_summary(youtube_url, rate_timeout=SUMMARY_RATE_TIMEOUT):
+    # Return an iterator of the video's summary as text deltas: a stored
+    # summary is replayed in one piece, otherwise the final completion is
+    # streamed and then stored. Checks and the summary budget are taken here,
+    # before any delta, so callers can answer their errors (RateLimitTimeout,
+    # TranscriptError, ...) before the stream starts.
+    video_id = get_video_id(youtube_url)
+    if not video_id:
+        raise TranscriptError("Invalid YouTube URL provided.")
+    key = (video_id, SUMMARY_PROMPT_VERSION, SUMMARY_MODEL)
+    summary = get_video_summary(*key)
+    _record_cache('video_summary', summary)
+    if summary is not None:
+        return iter([summary])
+
+    check_transcript_available(video_id)
+    openai_upstream.check()
+    summary_rate_limiter.acquire(timeout=rate_timeout)
+    return _stream_new_summary(youtube_url, key)
+
+# Ends a stream's delta queue; anything else there is a delta or an exception
+_STREAM_END = object()
+
+def _stream_new_summary(youtube_url, key):
+    # Generate on a thread of its own, in the same flight and under the same
+    # claim as summarize_video, so concurrent streams, summaries and job
+    # workers for the video share one completion. The thread finishes and
+    # stores the summary even if our consumer goes away mid-stream. A stream
+    # that lost the flight or claim replays the winner's summary.
+    deltas = queue.Queue()
+
+    def generate():
+        led = streamed = False
+
+        def on_delta(delta):
+            nonlocal streamed
+            streamed = True
+            deltas.put(delta)
+
+        def lead():
+            nonlocal led
+            led = True
+            return _generate_video_summary(youtube_url, key, None, on_delta=on_delta)
+
+        try:
+            summary = summary_flights.do(key, lead)
+            if not led:
+                summary_rate_limiter.debit(-1)  # another call generated it: refund the budget
+            if not streamed:
+                deltas.put(summary)
+        except Exception as e:
+            deltas.put(e)
+        finally:
+            deltas.put(_STREAM_END)
+
+    threading.Thread(target=generate, name=f'summary-stream-{key[0]}', daemon=True).start()
+    while True:
+        item = deltas.get()
+        if item is _STREAM_END:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
@@ -0,0 +1,264 @@
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from openai import AsyncOpenAI
+from singleflight import AsyncSingleFlight
+import youtube
+from youtube import (
+    get_video_id, estimate_tokens, split_into_windows, _messages, transcript_cache,
+    unavailable_transcripts, check_transcript_available, TRANSCRIPT_CONFIG,
+    _record_cache, _record_completion, _completion_cost, _attempt_timeout, openai_upstream,
+    UPSTREAM_CONFIG, summary_rate_limiter, SUMMARY_RATE_TIMEOUT, TranscriptError, SUMMARY_MODEL, SUMMARY_PROMPT, CHUNK_PROMPT,
+    REDUCE_PROMPT, SUMMARY_CLAIM_LEASE, SUMMARY_CLAIM_POLL, SUMMARY_PROMPT_VERSION, SUMMARY_SINGLE_CALL_TOKENS,
+    SUMMARY_CHUNK_TOKENS, SUMMARY_CHUNK_CONCURRENCY, MAX_REDUCE_ROUNDS
+)
+from database_async import (
+    get_video_summary, save_video_summary, claim_video_summary, release_video_summary
+)
+
+# Async counterparts of youtube.py for app_async.py: completions go through
+# AsyncOpenAI so one event loop can keep many of them in flight, sharing
+# prompts, caches and the rate limiter with the sync module.
+
+async_openai_client = AsyncOpenAI(max_retries=0, timeout=UPSTREAM_CONFIG['openai_timeout'])
+
+# youtube_transcript_api only has a blocking client, so transcript downloads
+# run on their own threads (bounded separately from asyncio's default pool)
+transcript_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('TRANSCRIPT_FETCH_CONCURRENCY', '32')),
+    thread_name_prefix='transcript-fetch'
+)
+
+summary_flights = AsyncSingleFlight()
+
+# Bounds parallel chunk calls across all summaries in this process
+chunk_semaphore = asyncio.Semaphore(SUMMARY_CHUNK_CONCURRENCY)
+
+async def fetch_transcript(youtube_url, languages=None):
+    # Serve cached transcripts, and videos known to have none, without leaving
+    # the event loop
+    video_id = get_video_id(youtube_url)
+    languages = tuple(languages or TRANSCRIPT_CONFIG['languages'])
+    if video_id:
+        reason = unavailable_transcripts.get(video_id)
+        if reason is not None:
+            _record_cache('transcript_unavailable', reason)
+            return f"An error occurred: {reason}"
+        transcript = transcript_cache.get((video_id, languages))
+        if transcript is not None:
+            _record_cache('transcript_memory', transcript)
+            return transcript
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        transcript_executor, youtube.fetch_transcript, youtube_url, languages
+    )
+
+async def _complete(system_prompt, text):
+    started = time.perf_counter()
+    cost = _completion_cost(system_prompt, text)
+    try:
+        completion = await openai_upstream.call_async(
+            lambda timeout: async_openai_client.chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=_messages(system_prompt, text),
+                timeout=_attempt_timeout(timeout)
+            ),
+            tokens=cost
+        )
+    except Exception:
+        _record_completion(system_prompt, started, error=True)
+        raise
+    _record_completion(system_prompt, started, completion.usage, cost=cost)
+    return completion.choices[0].message.content
+
+async def _stream_completion(system_prompt, text):
+    # Yield the completion's text deltas as the model produces them
+    started = time.perf_counter()
+    usage = None
+    cost = _completion_cost(system_prompt, text)
+    try:
+        stream = await openai_upstream.call_async(
+            lambda timeout: async_openai_client.chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=_messages(system_prompt, text),
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=_attempt_timeout(timeout)
+            ),
+            tokens=cost
+        )
+    except Exception:
+        _record_completion(system_prompt, started, error=True)
+        raise
+    try:
+        async for chunk in stream:
+            usage = getattr(chunk, 'usage', None) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except (GeneratorExit, asyncio.CancelledError):
+        # Closed (aclose) or cancelled before the end, e.g. the client disconnected
+        _record_completion(system_prompt, started, usage, abandoned=True)
+        raise
+    except Exception as e:
+        # Text already went out, so no retry; the circuit breaker still counts it
+        openai_upstream.record_failure(e)
+        _record_completion(system_prompt, started, usage, error=True)
+        raise
+    _record_completion(system_prompt, started, usage, cost=cost)
+
+async def summarize(youtube_url, transcript=None):
+    # Reuse an already fetched transcript when the caller has one
+    if transcript is None:
+        transcript = await fetch_transcript(youtube_url)
+    return await _complete(*await _final_prompt(transcript))
+
+async def _final_prompt(transcript):
+    if estimate_tokens(transcript) <= SUMMARY_SINGLE_CALL_TOKENS:
+        return SUMMARY_PROMPT, transcript
+    return REDUCE_PROMPT, await _map_transcript(transcript)
+
+async def _complete_chunk(window):
+    async with chunk_semaphore:
+        return await _complete(CHUNK_PROMPT, window)
+
+async def _map_transcript(transcript):
+    # Same map phase as youtube._map_transcript, with the window calls gathered
+    parts = [transcript]
+    for _ in range(MAX_REDUCE_ROUNDS):
+        windows = [w for part in parts for w in split_into_windows(part, SUMMARY_CHUNK_TOKENS)]
+        parts = await asyncio.gather(*(_complete_chunk(w) for w in windows))
+        combined = "\n\n".join(
+            f"Part {i} of {len(parts)}: {part}" for i, part in enumerate(parts, 1)
+        )
+        if estimate_tokens(combined) <= SUMMARY_SINGLE_CALL_TOKENS:
+            break
+        parts = [combined]
+    return combined
+
+async def summarize_video(youtube_url, rate_timeout=SUMMARY_RATE_TIMEOUT):
+    # Return the video's summary, reusing one generated for any bookmark of the
+    # same video with the current prompt version and model. Raises
+    # RateLimitTimeout if no summary budget frees up within `rate_timeout`.
+    video_id = get_video_id(youtube_url)
+    if not video_id:
+        raise TranscriptError("Invalid YouTube URL provided.")
+    key = (video_id, SUMMARY_PROMPT_VERSION, SUMMARY_MODEL)
+    summary = await get_video_summary(*key)
+    _record_cache('video_summary', summary)
+    if summary is not None:
+        return summary
+    check_transcript_available(video_id)
+    return await summary_flights.do(key, lambda: _generate_video_summary(youtube_url, key, rate_timeout))
+
+async def _generate_video_summary(youtube_url, key, rate_timeout, on_delta=None):
+    # Take the budget before claiming, so nobody waits on the claim behind it
+    # (rate_timeout=None: the caller took it). See youtube.py for `on_delta`.
+    if rate_timeout is not None:
+        openai_upstream.check()
+        await summary_rate_limiter.acquire_async(timeout=rate_timeout)
+    # Poll another process's claim without holding a connection (see youtube.py)
+    delay = SUMMARY_CLAIM_POLL[0]
+    while True:
+        summary = await get_video_summary(*key)
+        if summary is not None:
+            summary_rate_limiter.debit(-1)  # nothing generated: refund the budget
+            return summary
+        if await claim_video_summary(*key, SUMMARY_CLAIM_LEASE):
+            break
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, SUMMARY_CLAIM_POLL[1])
+
+    try:
+        summary = await get_video_summary(*key)
+        if summary is not None:
+            summary_rate_limiter.debit(-1)
+            return summary
+
+        transcript = await fetch_transcript(youtube_url)
+        if transcript.startswith("An error occurred"):
+            raise TranscriptError(transcript)
+
+        if on_delta is None:
+            summary = await summarize(youtube_url, transcript=transcript)
+        else:
+            pieces = []
+            async for delta in _stream_completion(*await _final_prompt(transcript)):
+                pieces.append(delta)
+                on_delta(delta)
+            summary = "".join(pieces)
+        await save_video_summary(*key, summary)
+        return summary
+    finally:
+        try:
+            await release_video_summary(*key)
+        except Exception as e:
+            print(f"Could not release summary claim for {key[0]}: {e}", file=sys.stderr)
+
+async def stream_video_summary(youtube_url, rate_timeout=SUMMARY_RATE_TIMEOUT):
+    # Return an async iterator of the video's summary as text deltas, taking
+    # the checks and the summary budget before any delta (see youtube.py)
+    video_id = get_video_id(youtube_url)
+    if not video_id:
+        raise TranscriptError("Invalid YouTube URL provided.")
+    key = (video_id, SUMMARY_PROMPT_VERSION, SUMMARY_MODEL)
+    summary = await get_video_summary(*key)
+    _record_cache('video_summary', summary)
+    if summary is not None:
+        return _replay(summary)
+
+    check_transcript_available(video_id)
+    openai_upstream.check()
+    await summary_rate_limiter.acquire_async(timeout=rate_timeout)
+    return _stream_new_summary(youtube_url, key)
+
+async def _replay(summary):
+    yield summary
+
+# Generations started by streams, referenced until done so a stream whose
+# client went away still finishes and stores its summary
+_stream_tasks = set()
+
+# Ends a stream's delta queue; anything else there is a delta or an exception
+_STREAM_END = object()
+
+async def _stream_new_summary(youtube_url, key):
+    # Generate in a task of its own, in the same flight and under the same
+    # claim as summarize_video (see youtube.py)
+    deltas = asyncio.Queue()
+
+    async def generate():
+        led = streamed = False
+
+        def on_delta(delta):
+            nonlocal streamed
+            streamed = True
+            deltas.put_nowait(delta)
+
+        def lead():
+            nonlocal led
+            led = True
+            return _generate_video_summary(youtube_url, key, None, on_delta=on_delta)
+
+        try:
+            summary = await summary_flights.do(key, lead)
+            if not led:
+                summary_rate_limiter.debit(-1)  # another call generated it: refund the budget
+            if not streamed:
+                deltas.put_nowait(summary)
+        except Exception as e:
+            deltas.put_nowait(e)
+        finally:
+            deltas.put_nowait(_STREAM_END)
+
+    task = asyncio.create_task(generate())
+    _stream_tasks.add(task)
+    task.add_done_callback(_stream_tasks.discard)
+    while True:
+        item = await deltas.get()
+        if item is _STREAM_END:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item